@@ -1,18 +1,21 @@
 import pandas as pd
 from pathlib import Path
 
-# Percorso del file CSV processato
-data_path = Path(__file__).parent.parent / "data" / "processed_data" / "processed_pagamenti.csv"
+try:
+    from .tools.processed_dataset import load_processed_dataset
+except ImportError:
+    # Eseguito come script (python src/analisi_mag_group.py)
+    from tools.processed_dataset import load_processed_dataset
 
-# Carica il CSV
+# Carica dal dataset processato solo le colonne usate dall'analisi
 try:
-    df = pd.read_csv(data_path, encoding="utf-8-sig")
+    df = load_processed_dataset(columns=["Anno", "Beneficiario", "DescrizioneMandato", "ImportoEuro"])
 except Exception as e:
     print(f"Errore nel caricamento del file: {e}")
     exit(1)
 
 # Filtra solo le righe di MAGGIOLI S.P.A.
-df_mag = df[df["Beneficiario"].str.upper().str.contains("MAGGIOLI S.P.A.")].copy()
+df_mag = df[df["Beneficiario"].str.upper().str.contains("MAGGIOLI S.P.A.", na=False)].copy()
 
 # Funzione per assegnare un macrogruppo in base alla descrizione
 # (puoi personalizzare le regole qui sotto)
@@ -11,7 +11,6 @@ from flask import Flask, render_template, request, jsonify, Response, send_from_
 from flask import redirect, url_for 
 from flask_cors import CORS
 from dotenv import load_dotenv
-from cachetools import LRUCache # `cached` non è usato
 from flask_sqlalchemy import SQLAlchemy
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
@@ -28,6 +27,11 @@ try:
     )
     # Import normalize_string
     from .tools.wikipedia_enricher_tool import normalize_string
+    from .tools.chroma_pool import get_collection as get_pooled_collection, warm_up as warm_up_chroma_pool
+    from .tools.answer_cache import get_answer_cache, normalize_query
+    from .tools.single_flight import SingleFlight
+    from .tools.sqlite_pool import get_read_cursor
+    from .tools.semantic_cache import get_semantic_cache
 except ImportError:
     import sys
     # Aggiungi la directory 'src' al path se necessario per trovare i moduli
@@ -50,6 +54,11 @@ except ImportError:
             get_payment_count_beneficiary_year
         )
         from tools.wikipedia_enricher_tool import normalize_string
+        from tools.chroma_pool import get_collection as get_pooled_collection, warm_up as warm_up_chroma_pool
+        from tools.answer_cache import get_answer_cache, normalize_query
+        from tools.single_flight import SingleFlight
+        from tools.sqlite_pool import get_read_cursor
+        from tools.semantic_cache import get_semantic_cache
     except ImportError as e:
         logging.critical(f"Errore critico: Impossibile importare moduli backend. Dettagli: {e}", exc_info=True)
         # Definisci una funzione dummy per normalize_string per evitare errori successivi se l'import fallisce
@@ -59,7 +68,6 @@ except ImportError:
         # Potresti voler uscire qui se moduli critici non vengono caricati
         # sys.exit(1)
 
-import chromadb
 import google.generativeai as genai
 import google.api_core.exceptions
 
@@ -97,7 +105,17 @@ CORS(app, resources={
 })
 
 # --- Configurazione Caching ---
-query_cache = LRUCache(maxsize=int(os.environ.get("QUERY_CACHE_SIZE", 128)))
+# Due livelli (memoria + SQLite condiviso tra worker), TTL per voce, chiave legata alla versione dei dati
+answer_cache = get_answer_cache()
+# Livello semantico (solo RAG): riusa risposte a domande già viste formulate in modo diverso
+semantic_cache = get_semantic_cache()
+# Richieste identiche in contemporanea condividono un'unica esecuzione della pipeline
+ask_single_flight = SingleFlight()
+
+# --- Warm-up ChromaDB (client e collezione condivisi tra le richieste) ---
+CHROMA_COLLECTION_NAME = os.environ.get("CHROMA_COLLECTION_NAME", "pagamenti_busto")
+if warm_up_chroma_pool(name=CHROMA_COLLECTION_NAME):
+    logger.info("Pool ChromaDB inizializzato all'avvio.")
 
 # --- Funzione Helper formato SSE ---
 def format_sse(data: dict, event: str = 'message') -> str:
@@ -251,7 +269,7 @@ def serve_embed_js():
 def stream_query_response(user_query: str, query_key_for_cache: str):
     """
     Generatore che produce eventi SSE per la risposta alla query.
-    Accetta query_key per il caching.
+    Accetta query_key per il caching (None se la cache risposte è disabilitata).
     """
     final_payload = {"success": False, "answer": None, "references": [], "table_data": None, "error_code": None, "error_message": None}
     intent = "rag"
@@ -352,40 +370,46 @@ def stream_query_response(user_query: str, query_key_for_cache: str):
             retrieved_chunks = []
             references_for_payload = []
             enrichment_summary = None
+            semantic_hit = False
+            dataset_version = answer_cache.dataset_version() if answer_cache else None
             if not run_rag_anyway: yield format_sse({"status": "Preparazione ricerca semantica..."}, event='status')
             try: # ChromaDB & Embedding
                 yield format_sse({"status": "Calcolo rappresentazione semantica..."}, event='status')
                 query_embedding = get_embedding_for_query(user_query)
                 if not query_embedding: raise ValueError("Embedding failed")
-                yield format_sse({"status": "Ricerca documenti simili..."}, event='status')
-                PROJECT_ROOT=Path(__file__).parent.parent.resolve()
-                chroma_db_full_path=PROJECT_ROOT/os.environ.get("CHROMA_DB_PATH", "data/database/chroma_db_pagamenti")
-                client=chromadb.PersistentClient(path=str(chroma_db_full_path))
-                collection_name=os.environ.get("CHROMA_COLLECTION_NAME", "pagamenti_busto")
-                collection=client.get_collection(name=collection_name)
-                n_results=int(os.environ.get("RAG_DEFAULT_N_RESULTS", 15))
-                results=collection.query(query_embeddings=[query_embedding],n_results=n_results,include=['documents','metadatas','distances'])
-                if results and results.get('ids',[[]])[0]:
-                    ids=results['ids'][0]; distances=results['distances'][0]; metadatas=results['metadatas'][0]; documents=results['documents'][0];
-                    for id, dist, meta, doc in zip(ids,distances,metadatas,documents):
-                        retrieved_chunks.append({"id":id,"distance":dist,"metadata":meta,"document":doc})
-                        meta_with_distance = meta.copy(); meta_with_distance['distance'] = dist; meta_with_distance['retrieved_doc_text_preview'] = doc[:150]+"..."; references_for_payload.append(meta_with_distance)
-                    logger.info(f"Recuperati {len(retrieved_chunks)} chunk RAG.")
+                # Cache semantica: stessa domanda con parole diverse -> niente ChromaDB né LLM
+                semantic_payload = semantic_cache.lookup(user_query, query_embedding, dataset_version) if semantic_cache else None
+                if semantic_payload is not None:
+                    semantic_hit = True
+                    final_payload.update(semantic_payload)
+                    yield format_sse({"status": "Trovata risposta a una domanda simile già posta..."}, event='status')
                 else:
-                    logger.warning("Nessun risultato query ChromaDB.")
-                    retrieved_chunks = []
+                    yield format_sse({"status": "Ricerca documenti simili..."}, event='status')
+                    collection_name=CHROMA_COLLECTION_NAME
+                    collection=get_pooled_collection(name=collection_name) # Handle condiviso, riaperto solo se l'indice cambia
+                    n_results=int(os.environ.get("RAG_DEFAULT_N_RESULTS", 15))
+                    results=collection.query(query_embeddings=[query_embedding],n_results=n_results,include=['documents','metadatas','distances'])
+                    if results and results.get('ids',[[]])[0]:
+                        ids=results['ids'][0]; distances=results['distances'][0]; metadatas=results['metadatas'][0]; documents=results['documents'][0];
+                        for id, dist, meta, doc in zip(ids,distances,metadatas,documents):
+                            retrieved_chunks.append({"id":id,"distance":dist,"metadata":meta,"document":doc})
+                            meta_with_distance = meta.copy(); meta_with_distance['distance'] = dist; meta_with_distance['retrieved_doc_text_preview'] = doc[:150]+"..."; references_for_payload.append(meta_with_distance)
+                        logger.info(f"Recuperati {len(retrieved_chunks)} chunk RAG.")
+                    else:
+                        logger.warning("Nessun risultato query ChromaDB.")
+                        retrieved_chunks = []
             except ValueError as e_val:
                 logger.error(f"Errore embedding RAG: {e_val}")
                 final_payload.update({"success": False, "answer": "Errore analisi domanda.", "error_code": "EMBEDDING_ERROR"})
             except Exception as e_chroma:
                 error_message = str(e_chroma)
                 logger.error(f"Errore ChromaDB RAG: {error_message}", exc_info=True)
-                err_code = "COLLECTION_NOT_FOUND" if f"Collection {collection_name} not found" in error_message else "VECTORDB_QUERY_FAILED"
+                err_code = "COLLECTION_NOT_FOUND" if f"Collection {CHROMA_COLLECTION_NAME} not found" in error_message else "VECTORDB_QUERY_FAILED"
                 err_answer = "Base di conoscenza non trovata." if err_code == "COLLECTION_NOT_FOUND" else f"Errore ricerca dati: {error_message}"
                 final_payload.update({"success": False, "answer": err_answer, "error_code": err_code})
 
             # --- Arricchimento e LLM ---
-            if final_payload.get('error_code') is None: # Procedi solo se non ci sono stati errori prima
+            if final_payload.get('error_code') is None and not semantic_hit: # Procedi solo se non ci sono stati errori prima
                 if retrieved_chunks:
                     potential_beneficiary_from_rag = None
                     if retrieved_chunks[0].get('metadata', {}).get('beneficiario'): potential_beneficiary_from_rag = retrieved_chunks[0]['metadata']['beneficiario']
@@ -394,15 +418,15 @@ def stream_query_response(user_query: str, query_key_for_cache: str):
                         logger.info(f"Tentativo arricchimento per: '{potential_beneficiary_from_rag}'")
                         normalized_beneficiary_for_lookup = normalize_string(potential_beneficiary_from_rag)
                         if normalized_beneficiary_for_lookup:
-                            conn_enrich=None
+                            cursor_enrich=None
                             try:
                                 PROJECT_ROOT_APP = Path(__file__).parent.parent.resolve(); DB_ENV_VAR_APP = os.environ.get("DATABASE_FILE", "data/database/busto_pagamenti.db"); DB_PATH_APP = PROJECT_ROOT_APP / DB_ENV_VAR_APP
                                 if DB_PATH_APP and DB_PATH_APP.exists():
-                                    conn_enrich = sqlite3.connect(DB_PATH_APP); cursor_enrich = conn_enrich.cursor(); query_enrich = "SELECT WikipediaSummary FROM beneficiari_info WHERE NomeNormalizzato = ? AND LookupStatus = 'found' LIMIT 1"; cursor_enrich.execute(query_enrich, (normalized_beneficiary_for_lookup,)); result_enrich = cursor_enrich.fetchone()
+                                    cursor_enrich = get_read_cursor(DB_PATH_APP); query_enrich = "SELECT WikipediaSummary FROM beneficiari_info WHERE NomeNormalizzato = ? AND LookupStatus = 'found' LIMIT 1"; cursor_enrich.execute(query_enrich, (normalized_beneficiary_for_lookup,)); result_enrich = cursor_enrich.fetchone()
                                     if result_enrich and result_enrich[0]: enrichment_summary = result_enrich[0]; logger.info("Trovato riassunto.")
                             except Exception as e_enrich: logger.error(f"Errore lookup arricchimento: {e_enrich}")
                             finally:
-                                if conn_enrich: conn_enrich.close()
+                                if cursor_enrich: cursor_enrich.close() # Restituisce la connessione al pool in sola lettura
                         # --- Fine Logica Arricchimento ---
 
                     # --- Chiamata LLM ---
@@ -412,17 +436,31 @@ def stream_query_response(user_query: str, query_key_for_cache: str):
                     try:
                         if not genai: raise Exception("Modulo GenAI non inizializzato")
                         llm_model=genai.GenerativeModel(RAG_GENERATIVE_MODEL)
-                        llm_response=llm_model.generate_content(prompt)
+                        # Streaming: ogni frammento di testo viene inoltrato subito al client come evento 'token'
+                        llm_response=llm_model.generate_content(prompt, stream=True)
+                        answer_parts = []
                         try:
-                            final_payload.update({"success": True, "answer": llm_response.text, "references": references_for_payload})
-                            logger.info("Payload impostato da RAG: LLM OK.")
-                        except ValueError as e_block:
-                            block_reason=llm_response.prompt_feedback.block_reason.name if llm_response.prompt_feedback else 'UNKNOWN'
-                            final_payload.update({"success": False, "answer": f"Risposta bloccata ({block_reason}).", "error_code": 'GENERATION_BLOCKED', "references": references_for_payload})
-                            logger.warning(f"Blocco LLM RAG ({block_reason}).")
+                            for llm_chunk in llm_response:
+                                try:
+                                    delta = llm_chunk.text
+                                except ValueError:
+                                    delta = "" # Chunk senza testo (es. solo metadati o prompt bloccato)
+                                if delta:
+                                    answer_parts.append(delta)
+                                    yield format_sse({"delta": delta}, event='token')
+                            if answer_parts:
+                                # Il payload finale (e in cache) contiene la risposta completa riassemblata
+                                final_payload.update({"success": True, "answer": "".join(answer_parts), "references": references_for_payload})
+                                logger.info(f"Payload impostato da RAG: LLM OK ({len(answer_parts)} frammenti in streaming).")
+                                if semantic_cache: semantic_cache.add(user_query, query_embedding, dict(final_payload), dataset_version)
+                            else:
+                                block_reason=llm_response.prompt_feedback.block_reason.name if llm_response.prompt_feedback and llm_response.prompt_feedback.block_reason else 'UNKNOWN'
+                                final_payload.update({"success": False, "answer": f"Risposta bloccata ({block_reason}).", "error_code": 'GENERATION_BLOCKED', "references": references_for_payload})
+                                logger.warning(f"Blocco LLM RAG ({block_reason}).")
                         except Exception as e_text:
+                            # Interruzione a metà stream (es. stop per sicurezza): il client sostituisce il testo parziale con l'errore
                             final_payload.update({"success": False, "answer": "Errore lettura LLM.", "error_code": 'GENERATION_RESPONSE_ERROR', "references": references_for_payload})
-                            logger.error(f"Errore accesso testo LLM RAG: {e_text}.")
+                            logger.error(f"Errore lettura stream LLM RAG dopo {len(answer_parts)} frammenti: {e_text}.")
                     except Exception as llm_err:
                         final_payload.update({"success": False, "answer": "Errore generazione.", "error_code": 'LLM_GENERATION_FAILED', "references": references_for_payload})
                         logger.error(f"Errore API LLM RAG: {llm_err}.")
@@ -448,11 +486,10 @@ def stream_query_response(user_query: str, query_key_for_cache: str):
             })
 
     # --- Caching (Eseguito alla fine del generatore) ---
-    if final_payload.get('success') and not final_payload.get('error_code'):
+    if answer_cache and query_key_for_cache and final_payload.get('success') and not final_payload.get('error_code'):
         try:
-            # Assumiamo che query_cache sia globale e accessibile
-            query_cache[query_key_for_cache] = final_payload # Usa la chiave passata
-            logger.info(f"Risultato per query '{query_key_for_cache}' salvato nella cache.")
+            answer_cache.put(query_key_for_cache, final_payload, query=user_query) # Usa la chiave passata
+            logger.info(f"Risultato per query '{user_query[:50]}' salvato nella cache.")
         except Exception as e_cache:
             logger.warning(f"Errore salvataggio cache: {e_cache}")
 
@@ -463,6 +500,20 @@ def stream_query_response(user_query: str, query_key_for_cache: str):
     logger.info(f"Generatore per query '{user_query[:50]}...' terminato, yield finale inviato.")
 
 
+def coalesced_query_response(user_query: str, query_key_for_cache: str):
+    """
+    Come stream_query_response, ma le richieste identiche già in corso nel processo
+    ricevono gli eventi dell'esecuzione esistente invece di avviarne una nuova.
+    """
+    flight_key = query_key_for_cache or normalize_query(user_query)
+    try:
+        yield from ask_single_flight.stream(flight_key, lambda: stream_query_response(user_query, query_key_for_cache))
+    except TimeoutError as e_timeout:
+        logger.error(f"Timeout in attesa della risposta condivisa per '{user_query[:50]}': {e_timeout}")
+        yield format_sse({"success": False, "answer": "Timeout in attesa della risposta.", "references": [], "table_data": None,
+                          "error_code": "SINGLE_FLIGHT_TIMEOUT", "error_message": "Il server ha impiegato troppo tempo a rispondere."}, event='result')
+
+
 # --- ROUTE /ask CHE USA IL GENERATORE ESTERNO ---
 @app.route('/ask', methods=['POST'])
 def handle_ask_stream():
@@ -478,18 +529,31 @@ def handle_ask_stream():
     logger.info(f"Richiesta /ask: '{user_query[:100]}...'")
 
     # Caching Check
-    query_key = user_query.strip().lower()
-    if query_key in query_cache:
-        logger.info(f"Cache hit per: '{query_key}'")
-        return jsonify(query_cache[query_key])
+    query_key = None
+    if answer_cache:
+        query_key = answer_cache.make_key(user_query)
+        cached_payload = answer_cache.get(query_key)
+        if cached_payload is not None:
+            logger.info(f"Cache hit per: '{user_query.strip()[:100]}'")
+            return jsonify(cached_payload)
 
     # Crea e ritorna la risposta SSE
     # Passa user_query e query_key al generatore
-    response = Response(stream_query_response(user_query, query_key), mimetype='text/event-stream')
+    response = Response(coalesced_query_response(user_query, query_key), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Accel-Buffering'] = 'no'
     return response
 
+# --- Metriche cache (per processo) ---
+@app.route('/metrics/cache')
+def cache_metrics():
+    """Espone hit/miss e hit rate delle cache risposte (esatta e semantica) del worker corrente."""
+    return jsonify({
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "single_flight": ask_single_flight.stats(),
+    })
+
 # --- Avvio App ---
 if __name__ == '__main__':
     logger.info("Avvio server Flask...")
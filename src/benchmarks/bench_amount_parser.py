@@ -0,0 +1,91 @@
+# src/benchmarks/bench_amount_parser.py
+"""
+Micro-benchmark della conversione degli importi.
+
+Confronta la vecchia conversione riga-per-riga dell'ETL (Series.apply(safe_parse_float))
+con il parser vettoriale di tools/amount_parser.py su importi sintetici in formato
+italiano ('1.234,56', '€ 12,30', celle vuote, trattini, valori non numerici), dopo aver
+verificato che i due producano gli stessi valori.
+
+Uso: python src/benchmarks/bench_amount_parser.py [--values 10000000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Rende importabile il package tools anche eseguendo lo script direttamente
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+from tools.amount_parser import parse_amounts
+
+
+# --- Percorso precedente (riferimento) ---
+
+def safe_parse_float(value):
+    """Copia della vecchia conversione riga-per-riga dell'ETL (senza i log di debug)."""
+    if value is None: return None
+    if isinstance(value, (int, float)): return float(value)
+    if not isinstance(value, str): value = str(value)
+    cleaned_text = value.replace(".", "").replace(",", ".").replace("€", "").strip()
+    if cleaned_text == "": return None
+    try:
+        return float(cleaned_text)
+    except ValueError:
+        return None
+
+
+# --- Dati sintetici ---
+
+def format_italian(amounts: np.ndarray) -> np.ndarray:
+    """Formatta gli importi all'italiana: punto per le migliaia, virgola per i decimali."""
+    english = pd.Series(amounts).map('{:,.2f}'.format)
+    return english.str.replace(',', '_').str.replace('.', ',').str.replace('_', '.').to_numpy(dtype=object)
+
+
+def make_synthetic_importi(n_values: int, seed: int = 42) -> np.ndarray:
+    """Importi come celle di testo dei file sorgente (array object, come letto da read_excel)."""
+    rng = np.random.default_rng(seed)
+    # Formatta un pool e lo campiona: formattare 10M valori costerebbe più della conversione stessa
+    pool = format_italian(np.round(rng.uniform(-500, 250000, 100_000), 2))
+    importi = pool[rng.integers(0, len(pool), n_values)]
+    with_euro = rng.random(n_values) < 0.2
+    importi[with_euro] = "€ " + importi[with_euro]
+    importi[rng.random(n_values) < 0.01] = ""     # importi mancanti
+    importi[rng.random(n_values) < 0.005] = "-"   # trattino al posto dell'importo
+    importi[rng.random(n_values) < 0.005] = "n.d." # importi non numerici
+    return importi
+
+
+def check_equivalence(importi: np.ndarray, sample_values: int = 200_000):
+    sample = pd.Series(importi[:sample_values])
+    expected = pd.to_numeric(sample.apply(safe_parse_float), errors='coerce').to_numpy(dtype='float64')
+    actual, rejected = parse_amounts(sample)
+    np.testing.assert_array_equal(expected, actual.to_numpy())
+    print(f"Equivalenza verificata su {len(sample)} valori ({int(rejected.sum())} scartati).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversione importi: apply riga-per-riga vs vettoriale.")
+    parser.add_argument("--values", type=int, default=10_000_000, help="Numero di importi sintetici.")
+    args = parser.parse_args()
+
+    importi = make_synthetic_importi(args.values)
+    print(f"Importi sintetici: {len(importi)} valori.")
+    check_equivalence(importi)
+
+    results = {}
+    series = pd.Series(importi)
+    for name, func in (("apply (legacy)", lambda s: s.apply(safe_parse_float)), ("vettoriale", lambda s: parse_amounts(s)[0])):
+        start = time.perf_counter()
+        func(series)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"{name:>15}: {elapsed:8.2f}s  ({len(series) / elapsed:,.0f} valori/s)")
+    print(f"Speedup: {results['apply (legacy)'] / results['vettoriale']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
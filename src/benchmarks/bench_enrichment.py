@@ -0,0 +1,97 @@
+# src/benchmarks/bench_enrichment.py
+"""
+Benchmark dell'arricchimento Wikipedia dei beneficiari, senza rete.
+
+L'API Wikipedia è sostituita da tools/wikipedia_stub.py (pagine sintetiche, latenza simulata
+per richiesta). Confronta il vecchio ciclo seriale (get_wikipedia_summary + pausa fissa
+WIKI_REQUEST_DELAY dopo ogni gruppo) con enrich_terms (worker in parallelo, rate limiter
+globale, cache persistente per termine), dopo aver verificato che diano gli stessi esiti.
+Misura anche la seconda esecuzione, servita dalla cache (compresi 'not_found' ed 'error').
+
+Uso: python src/benchmarks/bench_enrichment.py [--names 60] [--latency 0.05] [--delay 0.5] [--workers 8] [--requests-per-second 10]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Rende importabile il package tools anche eseguendo lo script direttamente
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+PREFISSI = ["Comune di", "Associazione", "Fondazione", "Cooperativa Sociale", "Consorzio", "Istituto", "Azienda"]
+LUOGHI = ["Busto Arsizio", "Gallarate", "Legnano", "Varese", "Castellanza", "Saronno", "Olgiate Olona", "Cassano Magnago"]
+
+
+def make_names(count: int, rng: random.Random) -> list[str]:
+    """Beneficiari sintetici (organizzazioni, con e senza forma societaria)."""
+    names = set()
+    while len(names) < count:
+        kind = rng.random()
+        if kind < 0.5:
+            names.add(f"{rng.choice(PREFISSI)} {rng.choice(LUOGHI)} {rng.randint(1, 999)}")
+        else:
+            names.add(f"{rng.choice(['Alfa', 'Beta', 'Gamma', 'Delta', 'Sigma'])} {rng.choice(['Servizi', 'Energy', 'Group'])} {rng.randint(1, 999)} S.R.L.")
+    return sorted(names)
+
+
+# --- Percorso precedente (riferimento) ---
+
+def legacy_enrichment(names: list[str], delay: float, summary_func) -> dict:
+    """Ciclo seriale di run_beneficiary_enrichment prima della parallelizzazione."""
+    results = {}
+    for name in names:
+        results[name] = summary_func(name)
+        time.sleep(delay)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark arricchimento Wikipedia: ciclo seriale vs worker con rate limiter e cache.")
+    parser.add_argument("--names", type=int, default=60, help="Beneficiari sintetici da cercare.")
+    parser.add_argument("--found-ratio", type=float, default=0.5, help="Quota di beneficiari con una pagina Wikipedia.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latenza simulata per richiesta HTTP all'API (secondi).")
+    parser.add_argument("--delay", type=float, default=0.5, help="Pausa dopo ogni gruppo nel ciclo seriale (WIKI_REQUEST_DELAY).")
+    parser.add_argument("--workers", type=int, default=8, help="Worker in parallelo (WIKI_WORKERS).")
+    parser.add_argument("--requests-per-second", type=float, default=10, help="Limite globale di richieste HTTP all'API al secondo (WIKI_REQUESTS_PER_SECOND).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_enrichment_") as tmp:
+        # Configurazione letta all'import dei tool: cache Wikipedia nella cartella temporanea
+        os.environ["WIKI_CACHE_FILE"] = str(Path(tmp) / "wikipedia_cache.db")
+        from tools import wikipedia_cache, wikipedia_enricher_tool as wiki
+        from tools.rate_limiter import TokenBucket
+        logging.getLogger().setLevel(logging.WARNING) # Il log per ricerca falserebbe le misure
+
+        rng = random.Random(42)
+        names = make_names(args.names, rng)
+        pages = {wiki.normalize_string(n): f"{n} è un ente di esempio. " * 40 for n in names if rng.random() < args.found_ratio}
+        failing = [wiki.normalize_string(names[i]) for i in range(0, len(names), 25)]
+        stub = wiki.use_wikipedia_stub(pages, latency=args.latency, fail_titles=failing)
+        print(f"{len(names)} beneficiari, {len(pages)} con pagina, {len(failing)} con errore API | latenza {args.latency}s")
+
+        # Riferimento senza cache: stessa ricerca, ma ogni termine va all'API
+        wikipedia_cache.WIKI_CACHE_ENABLED = False
+        stub.requests_served = 0; start = time.perf_counter()
+        expected = legacy_enrichment(names, args.delay, wiki.get_wikipedia_summary)
+        old = time.perf_counter() - start
+        print(f"{'seriale':>16}: {old:7.2f}s | {len(names) / old:6.1f} gruppi/s | {stub.requests_served} richieste API (pausa {args.delay}s)")
+
+        wikipedia_cache.WIKI_CACHE_ENABLED = True
+        for label in ("parallelo", "parallelo (cache)"):
+            limiter = TokenBucket(args.requests_per_second, capacity=args.workers, name="wikipedia", penalty_cooldown=5)
+            stub.requests_served = 0; start = time.perf_counter()
+            results = wiki.enrich_terms({n: n for n in names}, workers=args.workers, rate_limiter=limiter)
+            new = time.perf_counter() - start
+            if results != expected:
+                raise AssertionError(f"Esiti diversi dal ciclo seriale ({label}).")
+            print(f"{label:>16}: {new:7.2f}s | {len(names) / new:6.1f} gruppi/s | {stub.requests_served} richieste API | speedup {old / new:.1f}x")
+        print("Esiti identici al ciclo seriale. Stato ricerche: " +
+              ", ".join(f"{s}={sum(r['status'] == s for r in expected.values())}" for s in ('found', 'not_found', 'error')))
+
+
+if __name__ == "__main__":
+    main()
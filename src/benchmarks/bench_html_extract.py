@@ -0,0 +1,171 @@
+# src/benchmarks/bench_html_extract.py
+"""
+Benchmark dell'estrazione dalle pagine HTML del portale (elenco atti e pagine di dettaglio).
+
+Confronta il vecchio percorso BeautifulSoup (albero completo + find_all/select_one) con le
+espressioni XPath compilate di tools/html_extract.py, dopo aver verificato che i due
+estraggano gli stessi atti e gli stessi link allegato.
+
+Le pagine vengono lette da una cartella di fixture (sottocartelle listing/ e detail/ con file
+.html, es. quelle registrate dallo scraper) oppure, se non indicata, generate in memoria.
+
+Uso: python src/benchmarks/bench_html_extract.py [--fixtures DIR] [--listing-pages 200] [--detail-pages 2000] [--repeat 3]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+# Rende importabile il package tools anche eseguendo lo script direttamente
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+from tools.html_extract import download_href, listing_rows, parse_html
+
+BASE_URL = "https://bustoarsizio.trasparenza-valutazione-merito.it"
+DETAIL_LINK_TITLE = "Apri Dettaglio"
+FALLBACK_EXTENSIONS = ('.xlsx', '.xls', '.ods', '.zip', '.pdf', '.doc', '.p7m')
+OGGETTI = ["Dati sui PAGAMENTI - {anno} trimestre {n}", "Determina impegno di spesa n. {n}/{anno}",
+           "Pagamenti dell'amministrazione anno {anno}", "Avviso pubblico {n} del {anno}", "Indicatore di tempestività dei pagamenti {anno}"]
+
+
+# --- Percorso precedente (riferimento) ---
+
+def legacy_extract_items(html_content):
+    """Copia della vecchia extract_data_from_html (senza log)."""
+    soup = BeautifulSoup(html_content, 'lxml'); relevant_items = []
+    table = soup.find('table', class_='master-detail-list-table')
+    if not table: return relevant_items
+    for row in table.find_all('tr', class_='master-detail-list-line'):
+        object_cell = row.find('td', class_='oggetto'); action_cell = row.find('td', class_='actions')
+        if object_cell and action_cell:
+            object_text = object_cell.get_text(strip=True)
+            if "PAGAMENTI" in object_text.upper():
+                detail_link_tag = action_cell.find('a', title=DETAIL_LINK_TITLE)
+                if detail_link_tag and detail_link_tag.has_attr('href'):
+                    detail_url = urljoin(BASE_URL, detail_link_tag['href'])
+                    relevant_items.append({'object': object_text, 'detail_url': detail_url, 'data_id': row.get('data-id', detail_url)})
+    return relevant_items
+
+
+def legacy_find_download_link(html_content):
+    """Copia della parte di parsing della vecchia find_excel_link_in_detail."""
+    soup = BeautifulSoup(html_content, 'lxml'); link_tag = soup.select_one("a[href*='downloadAllegato']")
+    if link_tag and link_tag.has_attr('href'): return urljoin(BASE_URL, link_tag['href'])
+    for link_tag_fallback in soup.find_all('a', href=True):
+        href = link_tag_fallback['href']
+        if any((href.lower().endswith(ext + '?p_auth=') or href.lower().endswith(ext)) for ext in FALLBACK_EXTENSIONS): return urljoin(BASE_URL, href)
+    return None
+
+
+# --- Percorso attuale (come in scraper.py) ---
+
+def extract_items(html_content):
+    rows = listing_rows(parse_html(html_content), DETAIL_LINK_TITLE) or []
+    items = []
+    for row in rows:
+        if "PAGAMENTI" in row['object'].upper() and row['detail_href'] is not None:
+            detail_url = urljoin(BASE_URL, row['detail_href'])
+            items.append({'object': row['object'], 'detail_url': detail_url, 'data_id': row['data_id'] if row['data_id'] is not None else detail_url})
+    return items
+
+
+def find_download_link(html_content):
+    href, _ = download_href(parse_html(html_content), FALLBACK_EXTENSIONS)
+    return urljoin(BASE_URL, href) if href is not None else None
+
+
+# --- Corpus ---
+
+def _page_shell(body: str, rng: random.Random) -> str:
+    """Intestazione, menu e piè di pagina come nelle pagine del portale (la parte che il parser deve attraversare)."""
+    menu = "".join(f'<li id="menu-item-header-{35000 + i}" class="menu-item"><a href="/web/trasparenza/sezione-{i}">Sezione {i}</a></li>' for i in range(150))
+    scripts = "".join(f'<script type="text/javascript">var cfg{i} = {{"id": {rng.randint(1, 99999)}, "path": "/o/js/m{i}.js"}};</script>' for i in range(20))
+    return (f'<!DOCTYPE html><html lang="it"><head><meta charset="utf-8"><title>Amministrazione trasparente</title>{scripts}</head>'
+            f'<body><header><nav><ul class="menu">{menu}</ul></nav></header><main>{body}</main>'
+            f'<footer><p>Comune di Busto Arsizio - <a href="/privacy">Privacy</a> - <a href="/note-legali">Note legali</a></p></footer></body></html>')
+
+
+def make_listing_page(page: int, rng: random.Random, rows_per_page: int = 50) -> str:
+    rows = []
+    for r in range(rows_per_page):
+        data_id = page * 1000 + r
+        oggetto = rng.choice(OGGETTI).format(anno=rng.randint(2017, 2025), n=rng.randint(1, 400))
+        rows.append(f'<tr class="master-detail-list-line odd" data-id="{data_id}"><td class="numero">{data_id}</td>'
+                    f'<td class="data">{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2017, 2025)}</td>'
+                    f'<td class="oggetto"> <span>{oggetto}</span> <!-- pubblicazione --> </td>'
+                    f'<td class="actions"><a class="btn" title="Stampa" href="/stampa/{data_id}">Stampa</a>'
+                    f'<a class="btn" title="{DETAIL_LINK_TITLE}" href="/web/trasparenza/dettaglio?id={data_id}&amp;p={page}">Dettaglio</a></td></tr>')
+    pager = f'<ul class="pagination"><li class="{"disabled" if page == 1 else ""}"><a href="?page={page - 1}">Indietro</a></li><li><a href="?page={page + 1}">Avanti</a></li></ul>'
+    table = f'<table class="master-detail-list-table table"><thead><tr><th>Numero</th><th>Data</th><th>Oggetto</th><th></th></tr></thead><tbody>{"".join(rows)}</tbody></table>'
+    return _page_shell(table + pager, rng)
+
+
+def make_detail_page(n: int, rng: random.Random) -> str:
+    fields = "".join(f'<tr><th>Campo {i}</th><td>{"valore " * rng.randint(1, 30)}</td></tr>' for i in range(15))
+    kind = rng.random()
+    if kind < 0.8:
+        attachments = f'<a href="/documents/atto-{n}.pdf">Atto firmato</a><a href="/c/portal/downloadAllegato?id={n}&amp;p_auth=x">pagamenti_{n}.xlsx</a>'
+    elif kind < 0.9:
+        attachments = f'<a href="/documents/allegati/pagamenti_{n}.XLSX?p_auth=">pagamenti_{n}.xlsx</a>'
+    else:
+        attachments = '<a href="/documents/informativa">Informativa</a>'
+    return _page_shell(f'<table class="dettaglio">{fields}</table><div class="allegati">{attachments}</div>', rng)
+
+
+def load_corpus(fixtures: Path | None, listing_pages: int, detail_pages: int) -> tuple[list[str], list[str]]:
+    if fixtures:
+        listing = [p.read_text(encoding='utf-8', errors='replace') for p in sorted((fixtures / "listing").glob("*.html"))]
+        detail = [p.read_text(encoding='utf-8', errors='replace') for p in sorted((fixtures / "detail").glob("*.html"))]
+        return listing, detail
+    rng = random.Random(42)
+    return ([make_listing_page(p, rng) for p in range(1, listing_pages + 1)],
+            [make_detail_page(n, rng) for n in range(detail_pages)])
+
+
+def check_equivalence(listing: list[str], detail: list[str]):
+    for i, page in enumerate(listing):
+        if legacy_extract_items(page) != extract_items(page):
+            raise AssertionError(f"Atti diversi tra BeautifulSoup e lxml nella pagina elenco {i}.")
+    for i, page in enumerate(detail):
+        if legacy_find_download_link(page) != find_download_link(page):
+            raise AssertionError(f"Link allegato diverso tra BeautifulSoup e lxml nella pagina dettaglio {i}.")
+    print(f"Equivalenza verificata su {len(listing)} pagine elenco e {len(detail)} pagine dettaglio.")
+
+
+def time_pass(pages: list[str], func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark estrazione HTML: BeautifulSoup vs XPath compilati (lxml).")
+    parser.add_argument("--fixtures", type=Path, default=None, help="Cartella con listing/*.html e detail/*.html.")
+    parser.add_argument("--listing-pages", type=int, default=200, help="Pagine elenco sintetiche (senza --fixtures).")
+    parser.add_argument("--detail-pages", type=int, default=2000, help="Pagine dettaglio sintetiche (senza --fixtures).")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (si tiene la migliore).")
+    args = parser.parse_args()
+
+    listing, detail = load_corpus(args.fixtures, args.listing_pages, args.detail_pages)
+    total_mb = sum(len(p.encode('utf-8')) for p in listing + detail) / 1024 / 1024
+    print(f"Corpus: {len(listing)} pagine elenco, {len(detail)} pagine dettaglio ({total_mb:.1f} MB).")
+    check_equivalence(listing, detail)
+
+    for label, pages, legacy, current in (("elenco", listing, legacy_extract_items, extract_items),
+                                          ("dettaglio", detail, legacy_find_download_link, find_download_link)):
+        if not pages: continue
+        old = time_pass(pages, legacy, args.repeat)
+        new = time_pass(pages, current, args.repeat)
+        print(f"{label:>10}: BeautifulSoup {old:7.2f}s ({len(pages) / old:,.0f} pagine/s) | "
+              f"lxml {new:7.2f}s ({len(pages) / new:,.0f} pagine/s) | speedup {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# src/benchmarks/bench_scraper.py
+"""
+Benchmark offline dello scraper: fase elenco (scoperta degli atti) e fase download.
+
+Le risposte HTTP arrivano da un FixtureStore (tools/http_fixtures.py) montato sulla sessione
+dello scraper, quindi nessuna richiesta esce sulla rete e non serve Firefox. Le fixture sono
+quelle registrate con `python src/scraper.py --record DIR` oppure, se non indicate, un portale
+sintetico generato in una cartella temporanea (pagina principale con l'iframe, elenco paginato,
+pagine di dettaglio e allegati con ETag).
+
+Misura atti/s e byte/s di: elenco completo, download a freddo (manifest vuoto), elenco
+incrementale (si ferma alla prima pagina di atti già noti) e aggiornamento completo a caldo
+(solo GET condizionali, 304), dopo aver verificato che tutti gli allegati attesi siano su disco.
+
+Uso: python src/benchmarks/bench_scraper.py [--fixtures DIR] [--items 300] [--attachment-kb 64] [--latency 0.02] [--workers 8] [--min-interval 0]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Rende importabile il package tools (e scraper.py) anche eseguendo lo script direttamente
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+from tools.http_fixtures import FixtureStore
+
+BASE_URL = "https://bustoarsizio.trasparenza-valutazione-merito.it"
+MAIN_PAGE_URL = BASE_URL + "/"
+LISTING_URL = BASE_URL + "/web/trasparenza/pagamenti-iframe"
+ROWS_PER_PAGE = 20
+
+
+# --- Portale sintetico ---
+
+def _page(body: str) -> bytes:
+    return f'<!DOCTYPE html><html lang="it"><head><meta charset="utf-8"><title>Trasparenza</title></head><body>{body}</body></html>'.encode('utf-8')
+
+
+def build_synthetic_site(store: FixtureStore, items: int, attachment_kb: int) -> int:
+    """Scrive nel FixtureStore un portale con `items` atti di pagamento. Ritorna i byte di allegati attesi."""
+    html_headers = {'Content-Type': 'text/html; charset=utf-8'}
+    store.put(MAIN_PAGE_URL, 200, html_headers, _page(f'<iframe id="corrente-iframe" src="{LISTING_URL}"></iframe>'), "OK")
+    pages = max(1, -(-items // ROWS_PER_PAGE))
+    attachment = (b"PK\x03\x04" + bytes(range(256)) * 4 * attachment_kb)[:attachment_kb * 1024]
+    for page in range(1, pages + 1):
+        rows = []
+        for n in range((page - 1) * ROWS_PER_PAGE, min(page * ROWS_PER_PAGE, items)):
+            rows.append(f'<tr class="master-detail-list-line" data-id="{n}"><td class="oggetto">Dati sui PAGAMENTI - atto {n}</td>'
+                        f'<td class="actions"><a title="Apri Dettaglio" href="/web/trasparenza/dettaglio?id={n}">Dettaglio</a></td></tr>')
+            detail = f'<a href="/documents/atto-{n}.pdf">Atto</a><a href="/c/portal/downloadAllegato?id={n}">pagamenti_{n}.xlsx</a>'
+            store.put(f"{BASE_URL}/web/trasparenza/dettaglio?id={n}", 200, html_headers, _page(detail), "OK")
+            store.put(f"{BASE_URL}/c/portal/downloadAllegato?id={n}", 200,
+                      {'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                       'Content-Disposition': f'attachment; filename="pagamenti_{n}.xlsx"',
+                       'ETag': f'"atto-{n}-v1"', 'Last-Modified': 'Mon, 06 Jan 2025 10:00:00 GMT'}, attachment, "OK")
+        pager = f'<ul class="pagination"><li class="{"disabled" if page == pages else ""}"><a href="?page={page + 1}">Avanti</a></li></ul>'
+        url = LISTING_URL if page == 1 else f"{LISTING_URL}?page={page}"
+        store.put(url, 200, html_headers, _page(f'<table class="master-detail-list-table">{"".join(rows)}</table>{pager}'), "OK")
+    return items * len(attachment)
+
+
+# --- Misure ---
+
+class ByteCounter:
+    """Hook di risposta della sessione: conta risposte e byte dichiarati (Content-Length) per stato."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.responses, self.bytes, self.not_modified = 0, 0, 0
+
+    def __call__(self, response, *args, **kwargs):
+        with self._lock:
+            self.responses += 1
+            self.not_modified += response.status_code == 304
+            if response.request.method != 'HEAD':
+                self.bytes += int(response.headers.get('Content-Length') or 0)
+
+
+def report(label: str, seconds: float, items: int, counter: ByteCounter):
+    print(f"{label:>18}: {seconds:7.2f}s | {items / seconds:8.1f} atti/s | {counter.bytes / 1024 / 1024 / seconds:8.2f} MB/s "
+          f"| {counter.responses} risposte ({counter.not_modified} x 304)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline dello scraper (elenco e download) su fixture HTTP.")
+    parser.add_argument("--fixtures", type=Path, default=None, help="Cartella registrata con scraper.py --record (default: portale sintetico).")
+    parser.add_argument("--items", type=int, default=300, help="Atti del portale sintetico.")
+    parser.add_argument("--attachment-kb", type=int, default=64, help="Dimensione di ogni allegato sintetico (KB).")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latenza simulata per richiesta (secondi).")
+    parser.add_argument("--workers", type=int, default=8, help="Thread della fase download (SCRAPER_WORKERS).")
+    parser.add_argument("--max-per-host", type=int, default=4, help="Richieste contemporanee per host (SCRAPER_MAX_PER_HOST).")
+    parser.add_argument("--min-interval", type=float, default=0.0, help="Intervallo minimo tra richieste allo stesso host (SCRAPER_MIN_INTERVAL).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_scraper_") as tmp:
+        tmp = Path(tmp)
+        fixtures_dir = args.fixtures or tmp / "fixtures"
+        expected_bytes = None
+        if not args.fixtures:
+            expected_bytes = build_synthetic_site(FixtureStore(fixtures_dir), args.items, args.attachment_kb)
+            os.environ["SCRAPER_LISTING_URL"] = ""
+        # Configurazione letta da scraper.py all'import: allegati, manifest e stato incrementale nella cartella temporanea
+        os.environ.update({"SCRAPER_DOWNLOAD_DIR": str(tmp / "downloads"), "DOWNLOAD_MANIFEST_FILE": str(tmp / "manifest.db"),
+                           "CRAWL_STATE_FILE": str(tmp / "crawl_state.db"),
+                           "SCRAPER_MAX_PER_HOST": str(args.max_per_host), "SCRAPER_MIN_INTERVAL": str(args.min_interval),
+                           "SCRAPER_MAX_PAGES": "0"})
+        import scraper
+        logging.getLogger().setLevel(logging.WARNING) # Il log per atto dello scraper falserebbe le misure
+        os.makedirs(scraper.DOWNLOAD_DIR, exist_ok=True)
+        store = scraper.use_http_fixtures("replay", fixtures_dir, latency=args.latency)
+        counter = ByteCounter(); scraper.session.hooks['response'].append(counter)
+        print(f"Fixture: {fixtures_dir} ({len(store)} risposte) | latenza {args.latency}s | {args.workers} worker, "
+              f"max {args.max_per_host} per host, intervallo {args.min_interval}s")
+
+        start = time.perf_counter()
+        items = scraper.collect_listing_items("requests", incremental=False)
+        discovery = time.perf_counter() - start
+        if not items:
+            raise SystemExit("Nessun atto trovato nelle fixture: impossibile misurare il download.")
+        report("elenco completo", discovery, len(items), counter)
+
+        counter.reset(); start = time.perf_counter()
+        downloaded, _ = scraper.download_items(items, workers=args.workers)
+        cold = time.perf_counter() - start
+        on_disk = sum(os.path.getsize(f['local_path']) for f in downloaded)
+        if expected_bytes is not None and (len(downloaded) != len(items) or on_disk != expected_bytes):
+            raise AssertionError(f"Download incompleto: {len(downloaded)}/{len(items)} allegati, {on_disk}/{expected_bytes} byte.")
+        print(f"Verificati {len(downloaded)} allegati su disco ({on_disk / 1024 / 1024:.1f} MB).")
+        report("download a freddo", cold, len(items), counter)
+
+        counter.reset(); start = time.perf_counter()
+        new_items = scraper.collect_listing_items("requests", incremental=True)
+        scraper.download_items(new_items, workers=args.workers, incremental=True)
+        incremental = time.perf_counter() - start
+        print(f"{'giro incrementale':>18}: {incremental:7.2f}s | {len(new_items)} atti nuovi | {counter.responses} risposte")
+
+        counter.reset(); start = time.perf_counter()
+        scraper.download_items(items, workers=args.workers, incremental=False)
+        report("aggiornamento 304", time.perf_counter() - start, len(items), counter)
+
+
+if __name__ == "__main__":
+    main()
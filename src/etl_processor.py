@@ -1,8 +1,24 @@
 # Inizio di src/etl_processor.py
+import argparse
+import hashlib
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 from pathlib import Path
 import logging
 
+try:
+    from .tools.spreadsheet_reader import read_sheet_with_header, EXPECTED_KEYWORDS, HEADER_SCAN_ROWS, MIN_HEADER_KEYWORDS
+    from .tools.processed_dataset import coerce_to_schema, write_processed_dataset, PROCESSED_PARQUET, PROCESSED_CSV
+    from .tools.amount_parser import parse_amounts
+except ImportError:
+    # Eseguito come script (python src/etl_processor.py)
+    from tools.spreadsheet_reader import read_sheet_with_header, EXPECTED_KEYWORDS, HEADER_SCAN_ROWS, MIN_HEADER_KEYWORDS
+    from tools.processed_dataset import coerce_to_schema, write_processed_dataset, PROCESSED_PARQUET, PROCESSED_CSV
+    from tools.amount_parser import parse_amounts
+
 # Configurazione logging (simile allo scraper)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -10,11 +26,20 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
 DOWNLOAD_DIR = PROJECT_ROOT / "data" / "downloaded_files"
 OUTPUT_DIR = PROJECT_ROOT / "data" / "processed_data" 
-OUTPUT_PARQUET = OUTPUT_DIR / "processed_pagamenti.parquet" 
-# File di output (commentato o meno)
+OUTPUT_PARQUET = PROCESSED_PARQUET # Dataset canonico (Parquet tipizzato)
+OUTPUT_CSV = PROCESSED_CSV # Esportazione per ispezione
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".ods"}
+# Processi worker per il parsing dei file (default: numero di CPU)
+ETL_WORKERS = int(os.environ.get("ETL_WORKERS", 0)) or (os.cpu_count() or 1)
+
+# Cache dei file già elaborati: un Parquet per sorgente, chiave sha256 del file + versione della logica ETL.
+# Incrementare ETL_LOGIC_VERSION quando cambia la lettura/pulizia, così i file vengono rielaborati.
+ETL_LOGIC_VERSION = "3"
+PARSE_CACHE_DIR = OUTPUT_DIR / "cache"
+PARSE_CACHE_ENABLED = (os.environ.get("ETL_PARSE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+                       and importlib.util.find_spec("pyarrow") is not None) # Parquet richiede pyarrow
 
 # --- DEFINIZIONI FUORI DAL CICLO ---
 # Mappa dalle chiavi (minuscole, pulite) che CERCHIAMO negli header promossi
@@ -43,98 +68,38 @@ final_column_order = [
 # --- FINE DEFINIZIONI ---
 
 def find_data_files(directory: Path) -> list[Path]:
-    """Trova tutti i file con le estensioni consentite nella directory."""
-    files = [f for f in directory.iterdir() if f.is_file() and f.suffix.lower() in ALLOWED_EXTENSIONS]
+    """Trova tutti i file con le estensioni consentite nella directory (ordinati per nome)."""
+    files = sorted((f for f in directory.iterdir() if f.is_file() and f.suffix.lower() in ALLOWED_EXTENSIONS), key=lambda f: f.name)
     logging.info(f"Trovati {len(files)} file dati in {directory}")
     return files
 
-data_files = find_data_files(DOWNLOAD_DIR)
-if not data_files:
-    logging.warning("Nessun file dati trovato da processare. Uscita.")
-    exit()
-
-all_dataframes = [] # Lista per contenere i DataFrame puliti di ogni file
 
-# --- CICLO PRINCIPALE SUI FILE ---
-
-for file_path in data_files:
+def process_file(file_path: Path) -> pd.DataFrame:
+    """
+    Legge, pulisce e standardizza un singolo file scaricato (colonne `final_column_order`).
+    Ritorna un DataFrame vuoto se il file non è leggibile o non contiene dati utilizzabili.
+    Non dipende dagli altri file: viene eseguita in parallelo nei processi worker.
+    """
     logging.info(f"--- Processo il file: {file_path.name} ---")
     df = None
     header_correctly_identified = False # Flag per sapere se abbiamo un header valido
 
-    # --- 1. LETTURA FILE (con logica header flessibile) ---
+    # --- 1. LETTURA FILE (una sola lettura, intestazione individuata in memoria) ---
     try:
-        # Tentativo 1: Leggi con header=0 (prima riga)
-        logging.debug(f"  -> Tentativo lettura con header=0")
-        df_read = None # Usiamo una variabile temporanea
-        if file_path.suffix.lower() == '.ods':
-            df_read = pd.read_excel(file_path, header=0, engine='odf')
-        else:
-             try: df_read = pd.read_excel(file_path, header=0)
-             except Exception: df_read = pd.read_excel(file_path, header=0, engine='openpyxl')
-
-        # Verifica se l'header trovato è 'sensato'
-        expected_keywords = {'numero', 'anno', 'data', 'importo', 'nominativo', 'descrizione'}
-        if df_read is not None and not df_read.empty:
-            actual_headers_lower = {str(col).lower().strip() for col in df_read.columns}
-            keywords_found = sum(any(key in hdr for hdr in actual_headers_lower) for key in expected_keywords)
-
-            if keywords_found >= 3: # Soglia: almeno 3 keyword
-                logging.info(f"  -> Header valido trovato alla riga 0 (lettura standard). Colonne: {df_read.columns.tolist()}")
-                df = df_read # Assegna il DataFrame letto a quello principale
-                header_correctly_identified = True # Imposta il flag
-            else:
-                logging.info(f"  -> Header riga 0 non sembra valido ({keywords_found} keyword trovate). Ritento lettura senza header e promozione riga dati 0.")
+        df, header_row = read_sheet_with_header(file_path)
+        if header_row is not None:
+            logging.info(f"  -> Header valido trovato alla riga {header_row}. Colonne: {df.columns.tolist()}")
+            header_correctly_identified = True # Imposta il flag
+            if df.empty:
+                logging.warning(f"  -> La riga {header_row} sembra un header valido, ma non ci sono dati dopo.")
+        elif df.empty:
+            logging.warning(f"  -> Lettura del file ha prodotto DataFrame vuoto.")
         else:
-             logging.info(f"  -> Lettura con header=0 ha prodotto DataFrame vuoto o None.")
-
-
-        # Tentativo 2 (SOLO se il Tentativo 1 non ha identificato l'header)
-        if not header_correctly_identified:
-            df_read_no_header = None
-            if file_path.suffix.lower() == '.ods':
-                 df_read_no_header = pd.read_excel(file_path, header=None, engine='odf')
-            else:
-                 try: df_read_no_header = pd.read_excel(file_path, header=None)
-                 except Exception: df_read_no_header = pd.read_excel(file_path, header=None, engine='openpyxl')
-
-            if df_read_no_header is not None and not df_read_no_header.empty and len(df_read_no_header) >= 2:
-                 # L'HEADER VERO dovrebbe essere alla SECONDA riga letta (indice 1)
-                 potential_header_row = df_read_no_header.iloc[1].astype(str).str.strip()
-                 logging.info(f"  -> DEBUG: Riga 1 (potenziale header) RAW: {potential_header_row.tolist()}")
-
-                 # Verifica se QUESTA riga (indice 1) è un header sensato
-                 potential_header_values_lower = set(potential_header_row.tolist())
-                 potential_header_values_lower = {str(val).lower().strip() for val in potential_header_values_lower}
-                 logging.info(f"  -> DEBUG: Riga 1 (potenziale header) lower/strip: {potential_header_values_lower}")
-
-                 keywords_found_row1 = len(expected_keywords.intersection(potential_header_values_lower))
-                 logging.debug(f"  -> Controllo Riga 1: Valori trovati={potential_header_values_lower}, Keywords attese={expected_keywords}, Intersezione={keywords_found_row1}")
-
-                 if keywords_found_row1 >= 3: # Stessa soglia
-                     # Se la riga 1 è l'header, i DATI iniziano dalla riga 2
-                     if len(df_read_no_header) > 2:
-                         df = df_read_no_header[2:].reset_index(drop=True)
-                         df.columns = potential_header_row # Usa la riga 1 come header
-                         logging.info(f"  -> Usata Riga 1 (letta senza header) come header valido. Colonne: {df.columns.tolist()}")
-                         header_correctly_identified = True # Imposta il flag
-                     else:
-                          logging.warning(f"  -> Riga 1 sembra un header valido, ma non ci sono dati dopo (solo 2 righe nel file).")
-                          df = pd.DataFrame() # File vuoto
-                 else:
-                     logging.warning(f"  -> La riga 1 (letta senza header) non sembra un header valido ({keywords_found_row1} keyword trovate).")
-                     df = pd.DataFrame()
-            elif df_read_no_header is not None and not df_read_no_header.empty:
-                 logging.warning(f"  -> File letto senza header ha meno di 2 righe. Impossibile identificare header.")
-                 df = pd.DataFrame()
-            else:
-                 logging.warning(f"  -> Lettura con header=None ha prodotto DataFrame vuoto o None.")
-                 df = pd.DataFrame()
+            logging.warning(f"  -> Nessuna delle prime {HEADER_SCAN_ROWS} righe sembra un header valido (almeno {MIN_HEADER_KEYWORDS} keyword tra {sorted(EXPECTED_KEYWORDS)}).")
 
     except Exception as e:
         logging.error(f"  -> ERRORE LETTURA file {file_path.name}: {e}", exc_info=True)
         df = pd.DataFrame() # Assicura che df sia vuoto in caso di errore lettura
-        # continue # Potresti voler saltare, ma vediamo se la pulizia gestisce df vuoto
 
     # --- 2. PULIZIA E STANDARDIZZAZIONE ---
     try:
@@ -145,7 +110,7 @@ for file_path in data_files:
                  logging.warning(f"  -> Nessun header valido identificato. Salto pulizia.")
             else:
                  logging.warning(f"  -> DataFrame vuoto o lettura fallita. Salto pulizia.")
-            continue # Salta al prossimo file
+            return pd.DataFrame() # Nessun dato utilizzabile da questo file
         
 
         # --- 2b. Rinominare Colonne Trovate ---
@@ -193,33 +158,14 @@ for file_path in data_files:
         if 'ImportoEuro' in df.columns:
             logging.info(f"  -> Inizio pulizia e conversione 'ImportoEuro'...") # Log aggiunto
 
-            # Applica una funzione di pulizia più robusta
-            def safe_parse_float(value):
-                if value is None:
-                    logging.debug(f"DEBUG IMPORTO: valore None trovato")
-                    return None
-                if isinstance(value, (int, float)):
-                    logging.debug(f"DEBUG IMPORTO: valore già numerico {value}")
-                    return float(value) # Già numerico
-                if not isinstance(value, str):
-                    value = str(value) # Converti a stringa
-                cleaned_text = value.replace(".", "").replace(",", ".").replace("€", "").strip()
-                if cleaned_text == "":
-                    logging.debug(f"DEBUG IMPORTO: stringa vuota trovata nell'importo originario: '{value}'")
-                    return None
-                try:
-                    return float(cleaned_text)
-                except Exception as e_conv:
-                    logging.warning(f"DEBUG IMPORTO: errore conversione '{value}' -> '{cleaned_text}': {e_conv}")
-                    return None
-            df['ImportoEuro'] = df['ImportoEuro'].apply(safe_parse_float)
-
-            # Controlla quanti NaN sono stati introdotti
-            new_non_numeric = df['ImportoEuro'].isna().sum()
-            # Calcola quanti erano NaN *prima* dell'apply (più complesso ora)
-            # Potremmo contare quanti None ha restituito la funzione, ma per ora logghiamo solo il totale NaN
-            if new_non_numeric > 0:
-                 conversion_errors.append(f"ImportoEuro ({new_non_numeric} valori non convertiti in numero)")
+            # Conversione vettoriale condivisa con loader e indicizzatore (tools/amount_parser.py)
+            amounts, rejected = parse_amounts(df['ImportoEuro'])
+            n_rejected = int(rejected.sum())
+            if n_rejected > 0:
+                examples = df.loc[rejected, 'ImportoEuro'].astype(str).unique()[:5].tolist()
+                logging.warning(f"  -> {file_path.name}: {n_rejected} importi non interpretabili scartati (es. {examples}).")
+                conversion_errors.append(f"ImportoEuro ({n_rejected} valori non convertiti in numero)")
+            df['ImportoEuro'] = amounts
 
             # Logga il tipo risultante PRIMA di salvare
             logging.info(f"  -> Tipo Dati 'ImportoEuro' dopo conversione: {df['ImportoEuro'].dtype}")
@@ -239,50 +185,149 @@ for file_path in data_files:
                 logging.info(f"  -> Rimosse {rows_dropped} righe con NA in almeno una delle colonne chiave: {existing_key_cols}.")
 
 
+        # --- 2f. Tipi dello schema del dataset (Int64, float64, datetime, string) ---
+        df = coerce_to_schema(df)
+
         # --- Fine Pulizia per questo file ---
         if not df.empty:
-             all_dataframes.append(df)
-             logging.info(f"  -> DataFrame pulito aggiunto. Shape finale per questo file: {df.shape}")
+             logging.info(f"  -> DataFrame pulito. Shape finale per questo file: {df.shape}")
         else:
              logging.warning(f"  -> DataFrame vuoto dopo pulizia/dropna. Non aggiunto.")
+        return df
 
     except Exception as e:
         logging.error(f"  -> ERRORE PULIZIA file {file_path.name}: {e}", exc_info=True)
+        return pd.DataFrame()
 
-# --- FINE CICLO ---
+def file_sha256(file_path: Path) -> str:
+    """sha256 del contenuto del file (letto a blocchi)."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-# --- 3. UNIONE E SALVATAGGIO FINALE ---
-if all_dataframes:
-    logging.info(f"--- Unione di {len(all_dataframes)} DataFrame processati ---")
-    try:
-        final_df = pd.concat(all_dataframes, ignore_index=True)
-        logging.info(f"DataFrame finale creato. Shape totale: {final_df.shape}")
-
-        # Ispezione finale (opzionale ma utile)
-        logging.info("Info sul DataFrame finale:")
-        final_df.info(verbose=True, show_counts=True) # Mostra info dettagliate
-
-        # Controllo valori unici per colonne chiave (opzionale)
-        logging.info(f"Valori unici Anno: {final_df['Anno'].unique().tolist()}")
-        # logging.info(f"Valori CIG non vuoti trovati: {final_df[final_df['CIG'] != '']['CIG'].nunique()}")
-
-        # Salvataggio in Parquet (consigliato per efficienza)
-        #logging.info(f"Salvataggio DataFrame finale in: {OUTPUT_PARQUET}")
-        #final_df.to_parquet(OUTPUT_PARQUET, index=False)
-        #logging.info("Salvataggio completato.")
-
-        # Salvataggio anche in CSV (opzionale, per ispezione facile)
-        OUTPUT_CSV = OUTPUT_DIR / "processed_pagamenti.csv"
-        logging.info(f"Salvataggio DataFrame finale in: {OUTPUT_CSV}")
-        final_df.to_csv(OUTPUT_CSV, 
-                        index=False, 
-                        #decimal=',' ,
-                        encoding='utf-8-sig') # utf-8-sig per Excel compatibility
-        logging.info("Salvataggio CSV completato.")
 
+def parse_cache_path(digest: str) -> Path:
+    return PARSE_CACHE_DIR / f"{digest}-v{ETL_LOGIC_VERSION}.parquet"
+
+
+def _store_in_parse_cache(df: pd.DataFrame, cache_path: Path, file_name: str):
+    """
+    Salva il risultato in cache solo se il Parquet lo restituisce identico (stessi valori e tipi):
+    le colonne con tipi misti non sono rappresentabili e quel file verrà semplicemente rielaborato.
+    """
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, index=False)
+        pd.testing.assert_frame_equal(pd.read_parquet(tmp_path), df.reset_index(drop=True))
+        os.replace(tmp_path, cache_path) # Atomico: nessun lettore vede un file scritto a metà
     except Exception as e:
-        logging.error(f"Errore durante l'unione o il salvataggio finale: {e}", exc_info=True)
-else:
-    logging.warning("Nessun DataFrame processato con successo. Nessun file finale creato.")
+        logging.info(f"  -> {file_name}: risultato non memorizzabile nella cache Parquet ({type(e).__name__}), verrà rielaborato alla prossima esecuzione.")
+        tmp_path.unlink(missing_ok=True)
+
+
+def process_file_cached(file_path: Path) -> pd.DataFrame:
+    """process_file con cache: se il contenuto del file non è cambiato legge il Parquet salvato."""
+    cache_path = parse_cache_path(file_sha256(file_path))
+    if cache_path.is_file():
+        try:
+            df = pd.read_parquet(cache_path)
+            if not df.empty:
+                df['NomeFileOrigine'] = file_path.name # Lo stesso contenuto può arrivare con un altro nome
+            logging.info(f"--- File {file_path.name}: letto dalla cache ({len(df)} righe) ---")
+            return df
+        except Exception as e:
+            logging.warning(f"  -> Cache illeggibile per {file_path.name} ({e}): rielaboro il file.")
+            cache_path.unlink(missing_ok=True)
+    df = process_file(file_path)
+    _store_in_parse_cache(df, cache_path, file_path.name)
+    return df
+
+
+def prune_parse_cache():
+    """Rimuove le voci di cache prodotte da altre versioni della logica ETL."""
+    if not PARSE_CACHE_DIR.is_dir(): return
+    stale = [f for f in PARSE_CACHE_DIR.glob("*.parquet") if not f.name.endswith(f"-v{ETL_LOGIC_VERSION}.parquet")]
+    for f in stale:
+        f.unlink(missing_ok=True)
+    if stale:
+        logging.info(f"Rimosse {len(stale)} voci di cache di versioni ETL precedenti.")
+
+
+def process_all_files(data_files: list[Path], workers: int = ETL_WORKERS, use_cache: bool = PARSE_CACHE_ENABLED) -> list[pd.DataFrame]:
+    """
+    Esegue process_file su tutti i file con un pool di processi (parsing dei fogli di calcolo CPU-bound).
+    I risultati sono restituiti nell'ordine di `data_files`, indipendentemente da quale worker
+    termina prima: l'output finale è deterministico. Con workers=1 lavora nel processo corrente.
+    Con use_cache i file invariati vengono letti dalla cache Parquet invece di essere rielaborati.
+    """
+    if use_cache:
+        PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        prune_parse_cache()
+    worker = process_file_cached if use_cache else process_file
+    workers = max(1, min(workers, len(data_files)))
+    results = {}
+    if workers == 1:
+        for file_path in data_files:
+            results[file_path] = worker(file_path)
+    else:
+        logging.info(f"Parsing di {len(data_files)} file con {workers} processi worker...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(worker, file_path): file_path for file_path in data_files}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    results[file_path] = future.result()
+                except Exception as e: # Es. worker terminato in modo anomalo
+                    logging.error(f"  -> ERRORE nel worker per il file {file_path.name}: {e}", exc_info=True)
+                    results[file_path] = pd.DataFrame()
+    return [results[file_path] for file_path in data_files if not results[file_path].empty]
 
-logging.info("--- Script ETL completato ---")
\ No newline at end of file
+
+# --- 3. UNIONE E SALVATAGGIO FINALE ---
+def merge_and_save(all_dataframes: list[pd.DataFrame]):
+    """Unisce i DataFrame (nell'ordine ricevuto, cioè quello dei file) e salva il dataset Parquet e l'esportazione CSV."""
+    if all_dataframes:
+        logging.info(f"--- Unione di {len(all_dataframes)} DataFrame processati ---")
+        try:
+            final_df = pd.concat(all_dataframes, ignore_index=True)
+            logging.info(f"DataFrame finale creato. Shape totale: {final_df.shape}")
+
+            # Ispezione finale (opzionale ma utile)
+            logging.info("Info sul DataFrame finale:")
+            final_df.info(verbose=True, show_counts=True) # Mostra info dettagliate
+
+            # Controllo valori unici per colonne chiave (opzionale)
+            logging.info(f"Valori unici Anno: {final_df['Anno'].unique().tolist()}")
+            # logging.info(f"Valori CIG non vuoti trovati: {final_df[final_df['CIG'] != '']['CIG'].nunique()}")
+
+            # Salvataggio in Parquet (dataset canonico letto dagli altri script) + CSV per ispezione
+            logging.info(f"Salvataggio DataFrame finale in: {OUTPUT_PARQUET} e {OUTPUT_CSV}")
+            write_processed_dataset(final_df, OUTPUT_PARQUET, OUTPUT_CSV)
+            logging.info("Salvataggio completato.")
+
+        except Exception as e:
+            logging.error(f"Errore durante l'unione o il salvataggio finale: {e}", exc_info=True)
+    else:
+        logging.warning("Nessun DataFrame processato con successo. Nessun file finale creato.")
+
+
+# --- Blocco Esecuzione ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pulisce e unisce i file scaricati in processed_pagamenti.csv.")
+    parser.add_argument("--workers", type=int, default=ETL_WORKERS, help=f"Processi worker per il parsing dei file (default: {ETL_WORKERS}).")
+    parser.add_argument("--no-cache", action="store_true", help="Rielabora tutti i file ignorando la cache Parquet.")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if not args.no_cache and not PARSE_CACHE_ENABLED:
+        logging.info("Cache Parquet dei file elaborati disattivata (ETL_PARSE_CACHE_ENABLED o pyarrow non installato).")
+    data_files = find_data_files(DOWNLOAD_DIR)
+    if not data_files:
+        logging.warning("Nessun file dati trovato da processare. Uscita.")
+        exit()
+
+    all_dataframes = process_all_files(data_files, workers=args.workers, use_cache=PARSE_CACHE_ENABLED and not args.no_cache) # DataFrame puliti di ogni file
+    merge_and_save(all_dataframes)
+    logging.info(f"--- Script ETL completato in {time.time() - start_time:.2f} secondi ---")
@@ -1,6 +1,11 @@
+import argparse
+import hashlib
 import logging
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
 import chromadb
@@ -9,6 +14,20 @@ import pandas as pd
 from dotenv import load_dotenv
 from google.api_core import exceptions as google_exceptions
 
+try:
+    from .tools.document_builder import build_documents_frame, build_batch_documents
+    from .tools.embedding_cache import get_embedding_cache
+    from .tools.rate_limiter import TokenBucket, backoff_delay
+    from .tools.processed_dataset import load_processed_dataset, to_text_frame, PROCESSED_PARQUET
+    from .tools.chroma_pool import write_index_marker
+except ImportError:
+    # Eseguito come script (python src/index_pagamenti_chroma.py)
+    from tools.document_builder import build_documents_frame, build_batch_documents
+    from tools.embedding_cache import get_embedding_cache
+    from tools.rate_limiter import TokenBucket, backoff_delay
+    from tools.processed_dataset import load_processed_dataset, to_text_frame, PROCESSED_PARQUET
+    from tools.chroma_pool import write_index_marker
+
 # --- Configurazione Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -21,19 +40,20 @@ try:
     CHROMA_DB_PATH = os.environ.get("CHROMA_DB_PATH", "data/database/chroma_db_pagamenti")
     CHROMA_COLLECTION_NAME = os.environ.get("CHROMA_COLLECTION_NAME", "pagamenti_busto")
     GEMINI_EMBEDDING_MODEL = os.environ.get("GEMINI_EMBEDDING_MODEL", "models/text-embedding-004")
-    PROCESSED_CSV_PATH_FROM_ENV = os.environ.get("PROCESSED_CSV_FILE", "data/processed_data/processed_pagamenti.csv")
     DEFAULT_CHUNK_SIZE = int(os.environ.get("DEFAULT_CHUNK_SIZE_WORDS", 250))
     DEFAULT_CHUNK_OVERLAP = int(os.environ.get("DEFAULT_CHUNK_OVERLAP_WORDS", 40))
     BATCH_SIZE = 100 # Quanti documenti processare per batch (per API embedding e ChromaDB)
+    CHROMA_GET_PAGE_SIZE = 5000 # Pagina di lettura metadati esistenti (modalità incrementale)
+    EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 4)) # Chiamate embed_content in parallelo
+    EMBEDDING_MAX_RPM = float(os.environ.get("EMBEDDING_MAX_RPM", 600)) # Quota richieste/minuto dell'API embedding
 
     # Costruisci percorsi assoluti (assumendo che lo script sia in src/)
     PROJECT_ROOT = Path(__file__).parent.parent.resolve()
-    processed_csv_full_path = PROJECT_ROOT / PROCESSED_CSV_PATH_FROM_ENV  
     chroma_db_full_path = PROJECT_ROOT / CHROMA_DB_PATH
 
     # Verifica configurazioni critiche
     if not GOOGLE_API_KEY: raise ValueError("GOOGLE_API_KEY non trovata nel file .env")
-    logger.info(f"Configurazione caricata: Modello Embedding='{GEMINI_EMBEDDING_MODEL}', Path ChromaDB='{chroma_db_full_path}', Collezione='{CHROMA_COLLECTION_NAME}', CSV Processato='{processed_csv_full_path}'")
+    logger.info(f"Configurazione caricata: Modello Embedding='{GEMINI_EMBEDDING_MODEL}', Path ChromaDB='{chroma_db_full_path}', Collezione='{CHROMA_COLLECTION_NAME}', Dataset Processato='{PROCESSED_PARQUET}'")
 
 except (ValueError, KeyError, TypeError) as e:
     logger.critical(f"Errore critico nella configurazione: {e}. Assicurati che .env esista e contenga le variabili necessarie.", exc_info=True)
@@ -44,70 +64,79 @@ except (ValueError, KeyError, TypeError) as e:
 # Costanti per Embedding API
 TASK_TYPE_DOCUMENT = "retrieval_document"
 
-def safe_parse_float_for_index(value):
+# Versione del formato documento/metadati: incrementarla se cambia il testo indicizzato,
+# così la modalità incrementale ricalcola tutti gli embedding.
+INDEX_DOC_VERSION = "1"
+# Campi che identificano il contenuto di un pagamento (testo indicizzato + metadati salvati)
+ROW_HASH_FIELDS = ['NumeroMandato', 'Anno', 'Beneficiario', 'DescrizioneMandato', 'ImportoEuro', 'CIG', 'NomeFileOrigine']
+
+def compute_row_keys(df: pd.DataFrame) -> pd.Series:
     """
-    Parsa un valore in float, rimuovendo solo € e spazi.
-    Assume che il punto (.) sia il separatore decimale.
-    Ritorna float o None.
+    Calcola per ogni riga una chiave stabile derivata dal contenuto (sha1 dei campi ROW_HASH_FIELDS).
+    Non dipende dalla posizione nel DataFrame, quindi sopravvive a riordinamenti del dataset.
+    Righe identiche ricevono un suffisso progressivo (-1, -2, ...) per restare distinte.
     """
-    if value is None: return None
-    if isinstance(value, (int, float)): return float(value)
-    if not isinstance(value, str): value = str(value)
-
-    # Logica corretta per formato XXX.YY: Rimuovi solo € e spazi
-    cleaned_text = value.replace("€", "").strip()
-
-    if cleaned_text == "" or cleaned_text == "-": return None
-
-    try:
-        # Conversione diretta a float, il punto è il decimale
-        return float(cleaned_text)
-    except ValueError:
-        # Logga in debug per non intasare
-        logger.debug(f"Conversione float fallita (ValueError) per '{value}' (pulito: '{cleaned_text}')")
-        return None
-    except Exception as e:
-        logger.error(f"Errore imprevisto conversione float per '{value}': {e}", exc_info=True)
-        return None
-
-def split_text_into_chunks(
-    text: str,
-    chunk_size: int = DEFAULT_CHUNK_SIZE,
-    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
-) -> list[str]:
-    """Divide un testo lungo in chunk basandosi su parole."""
-    if not isinstance(text, str) or not text.strip(): return [] # Gestisce None o stringhe vuote
-    words = text.split()
-    if len(words) <= chunk_size: return [text]
-
-    chunks = []
-    start_index = 0
-    step = max(1, chunk_size - chunk_overlap) # Assicura avanzamento minimo
-
-    while start_index < len(words):
-        end_index = min(start_index + chunk_size, len(words))
-        chunks.append(" ".join(words[start_index:end_index]))
-        start_index += step
-
-    #logger.debug(f"Diviso testo ({len(words)} parole) in {len(chunks)} chunk.")
-    return chunks
+    fields = [col for col in ROW_HASH_FIELDS if col in df.columns]
+    joined = df[fields].astype(str).agg('\x1f'.join, axis=1)
+    # Anche i parametri di chunking entrano nella chiave: se cambiano, i chunk vanno rigenerati
+    salt = f"{INDEX_DOC_VERSION}:{DEFAULT_CHUNK_SIZE}:{DEFAULT_CHUNK_OVERLAP}"
+    hashes = joined.map(lambda text: hashlib.sha1(f"{salt}\x1e{text}".encode('utf-8')).hexdigest()[:20])
+    occurrence = hashes.groupby(hashes).cumcount()
+    return hashes.where(occurrence == 0, hashes + '-' + occurrence.astype(str))
+
+def get_indexed_row_keys(collection) -> dict[str, list[str]]:
+    """
+    Legge (a pagine) i metadati già presenti nella collezione e restituisce {row_key: [id chunk]}.
+    I chunk senza 'row_key' (indicizzazioni precedenti con ID posizionali) finiscono sotto la chiave ''.
+    """
+    existing = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=CHROMA_GET_PAGE_SIZE, offset=offset)
+        ids = page.get('ids', [])
+        if not ids: break
+        for chunk_id, meta in zip(ids, page.get('metadatas') or [None] * len(ids)):
+            row_key = (meta or {}).get('row_key', '')
+            existing.setdefault(row_key, []).append(chunk_id)
+        offset += len(ids)
+    return existing
 
 def get_gemini_embeddings_batch(
     texts: list[str],
     model_name: str = GEMINI_EMBEDDING_MODEL,
-    task_type: str = TASK_TYPE_DOCUMENT
+    task_type: str = TASK_TYPE_DOCUMENT,
+    rate_limiter: TokenBucket | None = None
 ) -> list[list[float]] | None:
     """
     Genera embeddings per un batch di testi usando Gemini.
-    Gestisce retries e rate limiting di base.
+    I testi già presenti nella cache embedding locale non vengono inviati all'API.
+    Gestisce retries con backoff esponenziale e, se fornito, un rate limiter condiviso tra thread.
     Restituisce una lista di embeddings o None in caso di fallimento persistente.
     """
     if not texts: return []
-    retries = 3
-    delay = 5
+    cache = get_embedding_cache()
+    if cache is None:
+        return _embed_texts_via_api(texts, model_name, task_type, rate_limiter)
+
+    cached = cache.get_many(model_name, task_type, texts)
+    missing_positions = [i for i, emb in enumerate(cached) if emb is None]
+    if missing_positions:
+        missing_texts = [texts[i] for i in missing_positions]
+        new_embeddings = _embed_texts_via_api(missing_texts, model_name, task_type, rate_limiter)
+        if new_embeddings is None: return None
+        cache.put_many(model_name, task_type, missing_texts, new_embeddings)
+        for pos, emb in zip(missing_positions, new_embeddings):
+            cached[pos] = emb
+    return cached
+
+def _embed_texts_via_api(texts: list[str], model_name: str, task_type: str,
+                         rate_limiter: TokenBucket | None = None) -> list[list[float]] | None:
+    """Chiamata diretta a embed_content con retry e backoff (nessuna cache)."""
+    retries = 5
     embeddings = None
 
     for attempt in range(retries):
+        if rate_limiter: rate_limiter.acquire()
         try:
             # Nota: Assumiamo genai.configure(api_key=...) sia stato chiamato all'inizio
             result = genai.embed_content(
@@ -124,13 +153,15 @@ def get_gemini_embeddings_batch(
                  # Non fare retry subito, potrebbe essere un problema del contenuto
 
         except google_exceptions.ResourceExhausted as e:
-            logger.warning(f"Rate limit API (tentativo {attempt + 1}/{retries}). Attesa {int(delay)}s...")
+            # Quota superata: rallenta TUTTI i worker (limiter condiviso) oltre a questo retry
+            if rate_limiter: rate_limiter.penalize()
+            delay = backoff_delay(attempt)
+            logger.warning(f"Rate limit API (tentativo {attempt + 1}/{retries}). Attesa {delay:.1f}s...")
             time.sleep(delay)
-            delay *= 1.5 # Backoff esponenziale
         except Exception as e:
-            logger.error(f"Errore chiamata embed_content (tentativo {attempt + 1}/{retries}): {e}", exc_info=True)
+            delay = backoff_delay(attempt)
+            logger.error(f"Errore chiamata embed_content (tentativo {attempt + 1}/{retries}): {e}. Attesa {delay:.1f}s...", exc_info=True)
             time.sleep(delay) # Attendi anche per altri errori
-            delay *= 1.5
 
         if attempt == retries - 1: # Se siamo all'ultimo tentativo
              logger.error(f"Fallimento generazione embedding batch dopo {retries} tentativi.")
@@ -138,11 +169,41 @@ def get_gemini_embeddings_batch(
 
     return None # Non dovrebbe arrivare qui, ma per sicurezza
 
+def _upsert_writer(collection, write_queue: queue.Queue, stats: dict):
+    """
+    Stadio di scrittura: consuma i batch con embedding dalla coda e li scrive su ChromaDB,
+    così l'upsert si sovrappone alle chiamate embedding ancora in corso. Termina con None.
+    """
+    while True:
+        item = write_queue.get()
+        if item is None: break
+        batch_no, batch, embeddings = item
+        try:
+            logger.info(f"Esecuzione upsert su ChromaDB per {len(batch['ids'])} elementi (batch {batch_no})...")
+            collection.upsert(
+                ids=batch['ids'],
+                embeddings=embeddings,
+                metadatas=batch['metadatas'],
+                documents=batch['chunks'] # Salva anche il testo del chunk
+            )
+            stats['upserted_chunks'] += len(batch['ids'])
+            logger.info(f"Upsert batch {batch_no} completato.")
+        except Exception as e:
+            logger.error(f"Errore durante upsert ChromaDB per batch {batch_no}: {e}", exc_info=True)
+            # Aggiungi tutti gli indici originali di questo batch ai falliti
+            stats['failed_indices'].extend(set(batch['original_indices']))
 
 # --- Funzione Principale di Indicizzazione ---
-def index_pagamenti_to_chroma():
-    """Legge i pagamenti dal CSV, genera embeddings e li indicizza in ChromaDB."""
-    logger.info("--- Avvio Script Indicizzazione Pagamenti in ChromaDB ---")
+def index_pagamenti_to_chroma(incremental: bool = True):
+    """
+    Legge i pagamenti dal dataset processato, genera embeddings e li indicizza in ChromaDB.
+
+    Args:
+        incremental: se True (default) calcola gli embedding solo per le righe nuove o modificate
+            (confrontando le chiavi di contenuto già in collezione) ed elimina i vettori delle righe
+            scomparse dal dataset. Se False re-indicizza tutte le righe.
+    """
+    logger.info(f"--- Avvio Script Indicizzazione Pagamenti in ChromaDB (modalità: {'incrementale' if incremental else 'completa'}) ---")
 
     # 1. Configura Google Generative AI Client
     try:
@@ -154,32 +215,19 @@ def index_pagamenti_to_chroma():
 
     # 2. Leggi i dati processati
     try:
-        logger.info(f"Lettura dati da: {processed_csv_full_path}")
-        # Leggi specificando dtypes per colonne potenzialmente ambigue
-        dtype_spec = {
-            'NumeroMandato': 'str', # Leggi come stringa per sicurezza
-            'Anno': 'str',
-            'CIG': 'str',
-            'Beneficiario': 'str',
-            'ImportoEuro': 'str', 
-            'DescrizioneMandato': 'str',
-            'NomeFileOrigine': 'str'
-        }
-        df = pd.read_csv(processed_csv_full_path,                          
-                         dtype=dtype_spec, 
-                         keep_default_na=False) # keep_default_na=False per evitare che stringhe vuote diventino NaN
-        # Riempi eventuali NaN rimanenti (improbabile con keep_default_na=False) con stringa vuota
-        df.fillna('', inplace=True)
+        logger.info(f"Lettura dati da: {PROCESSED_PARQUET}")
+        # Testi e chiavi di contenuto si basano sulle stringhe (vuote se mancanti), come col CSV
+        df = to_text_frame(load_processed_dataset())
         df.info() 
-        logger.info(f"Letti {len(df)} record di pagamenti dal CSV.")
+        logger.info(f"Letti {len(df)} record di pagamenti dal dataset processato.")
         if df.empty:
-            logger.warning("Il file CSV dei pagamenti è vuoto. Nessuna indicizzazione da eseguire.")
+            logger.warning("Il dataset dei pagamenti è vuoto. Nessuna indicizzazione da eseguire.")
             return True # Considera successo perché non c'è nulla da fare
-    except FileNotFoundError:
-        logger.error(f"File CSV processato non trovato: {processed_csv_full_path}")
+    except FileNotFoundError as e:
+        logger.error(f"Dataset processato non trovato: {e}")
         return False
     except Exception as e:
-        logger.error(f"Errore durante la lettura del CSV: {e}", exc_info=True)
+        logger.error(f"Errore durante la lettura del dataset processato: {e}", exc_info=True)
         return False
 
     # 3. Inizializza ChromaDB Client e Collezione
@@ -197,104 +245,92 @@ def index_pagamenti_to_chroma():
         logger.error(f"Errore durante inizializzazione ChromaDB o collezione: {e}", exc_info=True)
         return False
 
-    # 4. Processa e Indicizza i dati in Batch
-    total_pagamenti = len(df)
-    processed_count = 0
-    failed_pagamenti_indices = []
-
-    logger.info(f"Inizio indicizzazione di {total_pagamenti} pagamenti in batch da {BATCH_SIZE}...")
-
-    for i in range(0, total_pagamenti, BATCH_SIZE):
-        batch_df = df.iloc[i:i + BATCH_SIZE]
-        logger.info(f"Processo batch {i // BATCH_SIZE + 1}/{(total_pagamenti + BATCH_SIZE - 1) // BATCH_SIZE} (Indici: {i}-{i + len(batch_df) - 1})")
-
-        batch_chunks = []
-        batch_metadatas = []
-        batch_ids = []
-        original_indices = [] # Per tenere traccia degli indici originali del DataFrame
-
-        # Prepara chunk, metadati e ID per il batch
-        for idx, row in batch_df.iterrows():
-            # Combina campi testuali per creare il "documento" da indicizzare
-            # Puoi scegliere quali campi sono più significativi
-            doc_text = f"Anno: {row.get('Anno', '')}. Beneficiario: {row.get('Beneficiario', '')}. Descrizione: {row.get('DescrizioneMandato', '')}"
-            doc_text = ' '.join(doc_text.split())
-
-            if not doc_text:
-                logger.warning(f"Pagamento indice {idx} saltato: testo combinato vuoto.")
-                continue
-
-            chunks = split_text_into_chunks(doc_text, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
-
-            if not chunks:
-                logger.warning(f"Pagamento indice {idx} saltato: nessun chunk generato dal testo.")
-                continue
+    # 4. Chiavi di contenuto stabili e confronto con quanto già indicizzato
+    df['row_key'] = compute_row_keys(df)
+    total_csv = len(df)
+    try:
+        existing_keys = get_indexed_row_keys(collection)
+    except Exception as e:
+        logger.error(f"Errore lettura metadati esistenti dalla collezione: {e}", exc_info=True)
+        return False
 
-            for chunk_idx, chunk_text in enumerate(chunks):
-                original_indices.append(idx) # Salva indice originale
-                batch_chunks.append(chunk_text)
-                chunk_id = f"pag_{idx}_chunk_{chunk_idx}" # ID univoco per il chunk
-                batch_ids.append(chunk_id)
-
-                # Prepara metadati per ChromaDB (SOLO stringhe, numeri o booleani)
-                metadata = {
-                    "original_index": str(idx), # Salva come stringa
-                    "chunk_index": str(chunk_idx),
-                    "anno": str(row.get('Anno', '')), # Assicura sia stringa
-                    "numero_mandato": str(row.get('NumeroMandato', '')), # Assicura sia stringa
-                    "beneficiario": str(row.get('Beneficiario', '')),
-                    # L'importo potrebbe essere utile, ma deve essere float/int o stringa.
-                    # Proviamo a convertirlo, con fallback a stringa
-                    "importo_str": str(row.get('ImportoEuro', '')), # Salva sempre come stringa per sicurezza
-                    "descrizione": str(row.get('DescrizioneMandato', ''))[:500], # Limita lunghezza per sicurezza metadati
-                    "file_origine": str(row.get('NomeFileOrigine', ''))
-                    # Aggiungi altri metadati utili qui, assicurandoti siano tipi validi
-                }
-                # Tentativo conversione importo a float per eventuale filtro numerico
-                try:
-                    importo_float_value = safe_parse_float_for_index(row.get('ImportoEuro', ''))
-                    if importo_float_value is not None:
-                        metadata['importo_float'] = importo_float_value # Aggiungi solo se la conversione ha avuto successo
-                except Exception as e_proc_float: # Cattura eventuali errori nella funzione stessa
-                    logger.error(f"Errore in safe_parse_float_for_index per valore '{row.get('ImportoEuro', '')}': {e_proc_float}", exc_info=True)
-                    # Non aggiungere il campo float se c'è stato un errore grave
-                    pass # Il campo 'importo_float' non verrà aggiunto a metadata se fallisce
-                
-                batch_metadatas.append(metadata)
-
-        if not batch_chunks:
-            logger.info(f"Batch {i // BATCH_SIZE + 1}: Nessun chunk valido da processare.")
-            continue
-
-        # Genera embeddings per il batch
-        logger.info(f"Richiesta embedding per {len(batch_chunks)} chunk del batch...")
-        batch_embeddings = get_gemini_embeddings_batch(batch_chunks)
-
-        if batch_embeddings is None:
-            logger.error(f"Fallimento generazione embedding per batch {i // BATCH_SIZE + 1}. Salto questo batch.")
-            # Aggiungi tutti gli indici originali di questo batch ai falliti
-            failed_pagamenti_indices.extend(list(set(original_indices))) # set per evitare duplicati
-            continue
+    current_keys = set(df['row_key'])
+    # Vettori da eliminare: righe scomparse/modificate (la chiave cambia) e chunk con ID posizionali legacy
+    stale_ids = [chunk_id for row_key, ids in existing_keys.items() if row_key not in current_keys for chunk_id in ids]
+    if incremental:
+        df = df[~df['row_key'].isin(existing_keys.keys())]
+        logger.info(f"Modalità incrementale: {total_csv - len(df)} pagamenti già indicizzati, {len(df)} nuovi/modificati, {len(stale_ids)} chunk obsoleti da eliminare.")
 
-        # Upsert in ChromaDB
+    if stale_ids:
         try:
-            logger.info(f"Esecuzione upsert su ChromaDB per {len(batch_ids)} elementi...")
-            collection.upsert(
-                ids=batch_ids,
-                embeddings=batch_embeddings,
-                metadatas=batch_metadatas,
-                documents=batch_chunks # Salva anche il testo del chunk
-            )
-            processed_count += len(batch_df) # Incrementa del numero di pagamenti nel batch DF
-            logger.info(f"Upsert batch {i // BATCH_SIZE + 1} completato.")
+            for j in range(0, len(stale_ids), CHROMA_GET_PAGE_SIZE):
+                collection.delete(ids=stale_ids[j:j + CHROMA_GET_PAGE_SIZE])
+            logger.info(f"Eliminati {len(stale_ids)} chunk obsoleti dalla collezione.")
         except Exception as e:
-            logger.error(f"Errore durante upsert ChromaDB per batch {i // BATCH_SIZE + 1}: {e}", exc_info=True)
-            # Aggiungi tutti gli indici originali di questo batch ai falliti
-            failed_pagamenti_indices.extend(list(set(original_indices)))
+            logger.error(f"Errore eliminazione chunk obsoleti: {e}", exc_info=True)
+            return False
 
-    # 5. Riepilogo Finale
+    # 5. Processa e Indicizza i dati in Batch (pipeline: preparazione -> embedding in parallelo -> upsert)
+    total_pagamenti = len(df)
+    total_batches = (total_pagamenti + BATCH_SIZE - 1) // BATCH_SIZE
+    failed_pagamenti_indices = []
+    rate_limiter = TokenBucket(EMBEDDING_MAX_RPM / 60.0, capacity=EMBEDDING_WORKERS, name="embedding")
+    max_in_flight = EMBEDDING_WORKERS * 2 # Limita i batch in memoria in attesa di embedding
+
+    # Stadio di scrittura in background (unico thread che tocca la collezione durante il loop)
+    writer_stats = {'upserted_chunks': 0, 'failed_indices': []}
+    write_queue = queue.Queue(maxsize=max_in_flight)
+    writer = threading.Thread(target=_upsert_writer, args=(collection, write_queue, writer_stats), name="chroma-writer", daemon=True)
+    writer.start()
+
+    # Testo, importo numerico e metadati calcolati una sola volta in forma colonnare
+    docs = build_documents_frame(df)
+
+    logger.info(f"Inizio indicizzazione di {total_pagamenti} pagamenti in batch da {BATCH_SIZE} ({EMBEDDING_WORKERS} worker embedding, max {EMBEDDING_MAX_RPM:.0f} richieste/min)...")
+
+    def handle_completed(done_futures):
+        """Passa allo stadio di scrittura i batch con embedding pronti, registra i fallimenti."""
+        for future in done_futures:
+            batch_no, batch = in_flight.pop(future)
+            try:
+                batch_embeddings = future.result()
+            except Exception as e:
+                logger.error(f"Errore imprevisto embedding batch {batch_no}: {e}", exc_info=True)
+                batch_embeddings = None
+            if batch_embeddings is None:
+                logger.error(f"Fallimento generazione embedding per batch {batch_no}. Salto questo batch.")
+                # Aggiungi tutti gli indici originali di questo batch ai falliti
+                failed_pagamenti_indices.extend(set(batch['original_indices'])) # set per evitare duplicati
+                continue
+            write_queue.put((batch_no, batch, batch_embeddings)) # Blocca se lo scrittore è indietro
+
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embed") as executor:
+            for batch_no, i in enumerate(range(0, total_pagamenti, BATCH_SIZE), start=1):
+                batch_docs = docs.iloc[i:i + BATCH_SIZE]
+                logger.info(f"Processo batch {batch_no}/{total_batches} (Indici: {i}-{i + len(batch_docs) - 1})")
+                batch = build_batch_documents(batch_docs, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
+                if not batch['chunks']:
+                    logger.info(f"Batch {batch_no}: Nessun chunk valido da processare.")
+                    continue
+
+                logger.info(f"Richiesta embedding per {len(batch['chunks'])} chunk del batch {batch_no}...")
+                future = executor.submit(get_gemini_embeddings_batch, batch['chunks'], rate_limiter=rate_limiter)
+                in_flight[future] = (batch_no, batch)
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    handle_completed(done)
+            handle_completed(wait(in_flight).done)
+    finally:
+        write_queue.put(None) # Segnale di fine per lo scrittore
+        writer.join()
+    failed_pagamenti_indices.extend(writer_stats['failed_indices'])
+    logger.info(f"Chunk scritti su ChromaDB in questa esecuzione: {writer_stats['upserted_chunks']}")
+
+    # 6. Riepilogo Finale
     logger.info("--- Indicizzazione Completata ---")
-    logger.info(f"Pagamenti totali nel CSV: {total_pagamenti}")
+    logger.info(f"Pagamenti totali nel dataset: {total_csv}, da indicizzare in questa esecuzione: {total_pagamenti}")
     # Calcola successo effettivo considerando i fallimenti
     successful_count = total_pagamenti - len(set(failed_pagamenti_indices))
     logger.info(f"Pagamenti processati con successo (almeno un chunk indicizzato): {successful_count}")
@@ -303,13 +339,26 @@ def index_pagamenti_to_chroma():
         # Potresti loggare gli indici falliti se sono pochi:
         # logger.warning(f"Indici DataFrame falliti: {sorted(list(set(failed_pagamenti_indices)))}")
     logger.info(f"Elementi totali nella collezione ChromaDB '{collection.name}': {collection.count()}")
+    if writer_stats['upserted_chunks'] or stale_ids:
+        # Solo a indicizzazione finita: l'app ricarica l'indice (e invalida le risposte in cache) da qui in poi
+        try:
+            write_index_marker(collection, chroma_db_full_path)
+        except OSError as e:
+            logger.error(f"Impossibile scrivere il marcatore di fine indicizzazione: {e}")
+    cache = get_embedding_cache()
+    if cache is not None:
+        logger.info(f"Cache embedding: {cache.stats()}")
 
     return successful_count > 0 or total_pagamenti == 0 # Ritorna True se almeno uno è andato a buon fine o se non c'era nulla da fare
 
 # --- Blocco Esecuzione ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indicizza i pagamenti processati in ChromaDB.")
+    parser.add_argument("--full", action="store_true", help="Re-indicizza tutte le righe invece dei soli pagamenti nuovi/modificati.")
+    args = parser.parse_args()
+
     start_time = time.time()
-    success = index_pagamenti_to_chroma()
+    success = index_pagamenti_to_chroma(incremental=not args.full)
     end_time = time.time()
     duration = end_time - start_time
     logger.info(f"Script terminato in {duration:.2f} secondi. Successo: {success}")
@@ -1,77 +1,265 @@
 # src/load_to_sqlite.py
+import argparse
 import pandas as pd
 import sqlite3
+import time
 from pathlib import Path
 import logging
 
+try:
+    from .tools.db_schema import (beneficiary_norm_column, build_schema, refresh_summaries, check_summaries,
+                                  create_pagamenti_table, enable_wal, pagamenti_table_is_current, stamp_data_version, METADATA_TABLE,
+                                  PAGAMENTI_COLUMNS, PAGAMENTI_KEY_COLUMNS, PAGAMENTI_KEY_EXPRESSIONS, SUMMARY_BENEFICIARIO_ANNO_TABLE, SUMMARY_ANNO_TABLE)
+    from .tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+except ImportError:
+    # Eseguito come script (python src/load_to_sqlite.py)
+    from tools.db_schema import (beneficiary_norm_column, build_schema, refresh_summaries, check_summaries,
+                                 create_pagamenti_table, enable_wal, pagamenti_table_is_current, stamp_data_version, METADATA_TABLE,
+                                 PAGAMENTI_COLUMNS, PAGAMENTI_KEY_COLUMNS, PAGAMENTI_KEY_EXPRESSIONS, SUMMARY_BENEFICIARIO_ANNO_TABLE, SUMMARY_ANNO_TABLE)
+    from tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 PROJECT_ROOT = Path(__file__).parent.parent.resolve()
-PROCESSED_CSV = PROJECT_ROOT / "data" / "processed_data" / "processed_pagamenti.csv"
 DB_DIR = PROJECT_ROOT / "data" / "database"
 DB_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DB_DIR / "busto_pagamenti.db"
 TABLE_NAME = "pagamenti"
+# Colonne che definiscono il contenuto di una riga: se cambiano, la riga viene riscritta
+CONTENT_COLUMNS = ['DataMandato', 'CIG', 'Beneficiario', 'ImportoEuro', 'DescrizioneMandato']
+INSERT_COLUMNS = [name for name, _ in PAGAMENTI_COLUMNS]
+WRITE_BATCH_SIZE = 5000 # Righe per chiamata executemany
 
-logger.info("Leggendo il file CSV processato...")
-try:
-    # Leggi CSV, leggi ImportoEuro come stringa per pulizia manuale
-    df = pd.read_csv(
-        PROCESSED_CSV,
-        parse_dates=['DataMandato'],
-        dtype={'Anno': 'str', 'CIG': 'str', 'Beneficiario': 'str',
-               'DescrizioneMandato': 'str', 'NumeroMandato': 'str', 'ImportoEuro': 'str'} # Leggi come stringa
-    )
-
-    # --- CORREZIONE LOGICA PARSING IMPORTO (per formato XXX.YY) ---
-    logger.info("Pulizia e conversione colonna ImportoEuro...")
-    # Rimuovi solo € e spazi. NON TOCCARE IL PUNTO. NON TOCCARE LA VIRGOLA (non dovrebbe esserci).
-    df['ImportoEuro'] = df['ImportoEuro'].astype(str).str.replace('€', '', regex=False).str.strip()
-    # Converti a numerico (float/REAL). Il punto è già il separatore decimale corretto.
-    df['ImportoEuro'] = pd.to_numeric(df['ImportoEuro'], errors='coerce')
-    # Controlla quanti valori non sono stati convertiti (diventati NaN)
+
+def read_processed_dataset() -> pd.DataFrame:
+    """Legge il dataset processato (già tipizzato) e prepara le colonne della tabella pagamenti (chiave naturale e HashRiga comprese)."""
+    logger.info(f"Leggendo il dataset processato: {PROCESSED_PARQUET}")
+    df = load_processed_dataset()
     null_import_count = df['ImportoEuro'].isnull().sum()
     if null_import_count > 0:
-         logger.warning(f"{null_import_count} valori in ImportoEuro non sono stati convertiti correttamente in numero.")
+         logger.warning(f"{null_import_count} valori in ImportoEuro non sono numerici.")
+    # Beneficiario normalizzato (maiuscolo, spazi compattati): indicizzabile, evita UPPER() nelle query
+    df['BeneficiarioNorm'] = beneficiary_norm_column(df['Beneficiario'])
 
-    # Converti Anno in intero nullable
-    df['Anno'] = pd.to_numeric(df['Anno'], errors='coerce').astype('Int64')
-    # Converti NumeroMandato in intero nullable
-    df['NumeroMandato'] = pd.to_numeric(df['NumeroMandato'], errors='coerce').astype('Int64')
+    # --- Chiave naturale (NumeroMandato, Anno, NomeFileOrigine) ---
+    missing_key = df['NumeroMandato'].isna() | df['Anno'].isna()
+    if missing_key.any():
+        # Caricate con NULL come in passato: nella chiave si distinguono per file e posizione (RigaMandato)
+        logger.warning(f"{int(missing_key.sum())} righe senza NumeroMandato o Anno validi: caricate con NULL, escluse dai riepiloghi per anno.")
+    df['NomeFileOrigine'] = df['NomeFileOrigine'].fillna('').astype(str)
+    # Più righe dello stesso mandato nello stesso file (o senza mandato/anno): numerate in ordine di apparizione
+    df['RigaMandato'] = df.groupby(['NumeroMandato', 'Anno', 'NomeFileOrigine'], sort=False, dropna=False).cumcount()
+    # Firma del contenuto (hash a 64 bit reinterpretato con segno, come INTEGER SQLite)
+    df['HashRiga'] = pd.util.hash_pandas_object(df[CONTENT_COLUMNS], index=False).to_numpy().view('int64')
 
     logger.info("Tipi di dato dopo la conversione in Pandas:")
     df.info() # Verifica che ImportoEuro sia float64
+    return df
 
-except Exception as e:
-    logger.error(f"Errore lettura/conversione CSV {PROCESSED_CSV}: {e}", exc_info=True)
-    exit()
 
-# --- Scrittura DB (come prima, usando stringhe per i tipi) ---
-logger.info(f"Connessione al database SQLite: {DB_PATH}")
-conn = None
-try:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    logger.info(f"Scrittura dati nella tabella '{TABLE_NAME}' (sostituzione)...")
-    dtype_sqlite_strings = {
-        'NumeroMandato': 'INTEGER', 'Anno': 'INTEGER', 'DataMandato': 'TIMESTAMP',
-        'CIG': 'TEXT', 'Beneficiario': 'TEXT', 'ImportoEuro': 'REAL', # Conferma REAL
-        'DescrizioneMandato': 'TEXT', 'NomeFileOrigine': 'TEXT'
-    }
-    df.to_sql( TABLE_NAME, conn, if_exists='replace', index=False,
-               dtype=dtype_sqlite_strings, chunksize=1000, method='multi')
-    logger.info(f"Dati scritti con successo.")
-
-    # --- Verifica Schema e Conteggio (come prima) ---
-    cursor.execute(f"PRAGMA table_info({TABLE_NAME});")
-    logger.info(f"Schema tabella '{TABLE_NAME}' creata:")
-    for col in cursor.fetchall(): logger.info(f"  - Colonna: {col[1]}, Tipo SQLite: {col[2]}")
-    cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
-    count = cursor.fetchone()[0]; logger.info(f"Verifica: la tabella contiene {count} righe.")
-
-except Exception as e: logger.error(f"Errore scrittura DB: {e}", exc_info=True)
-finally:
-    if conn: conn.commit(); conn.close(); logger.info("Connessione DB chiusa.")
-
-logger.info("--- Script caricamento SQLite completato ---")
\ No newline at end of file
+def _python_rows(frame: pd.DataFrame) -> list[tuple]:
+    """Righe per executemany: tipi Python nativi, None al posto di NaN/NA."""
+    return list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+
+def _insert_rows(df: pd.DataFrame) -> list[tuple]:
+    out = df[INSERT_COLUMNS].copy()
+    # Stesso formato testuale di DataMandato scritto in precedenza da to_sql
+    out['DataMandato'] = out['DataMandato'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return _python_rows(out)
+
+
+def _executemany_batched(conn: sqlite3.Connection, sql: str, rows: list[tuple]):
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        conn.executemany(sql, rows[start:start + WRITE_BATCH_SIZE])
+
+
+def _upsert_sql() -> str:
+    updates = ", ".join(f"{col} = excluded.{col}" for col in INSERT_COLUMNS if col not in PAGAMENTI_KEY_COLUMNS)
+    return (f"INSERT INTO {TABLE_NAME} ({', '.join(INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(INSERT_COLUMNS))}) "
+            f"ON CONFLICT ({', '.join(PAGAMENTI_KEY_EXPRESSIONS)}) DO UPDATE SET {updates}")
+
+
+def _summaries_present(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                        (SUMMARY_BENEFICIARIO_ANNO_TABLE, SUMMARY_ANNO_TABLE)).fetchone()[0] == 2
+
+
+def _table_exists(db_path: Path, table: str) -> bool:
+    conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def load_incremental(df: pd.DataFrame) -> bool:
+    """
+    Allinea la tabella pagamenti al dataset processato scrivendo solo la differenza: upsert delle righe nuove o
+    cambiate (HashRiga diverso) e cancellazione di quelle non più presenti, in un'unica transazione
+    insieme ai riepiloghi degli anni toccati. In WAL i lettori continuano a vedere la versione
+    precedente fino al commit.
+    """
+    conn = None
+    try:
+        logger.info(f"Connessione al database SQLite: {DB_PATH}")
+        conn = sqlite3.connect(DB_PATH, timeout=60)
+        enable_wal(conn)
+        create_pagamenti_table(conn)
+
+        existing = pd.read_sql(f"SELECT {', '.join(PAGAMENTI_KEY_COLUMNS)}, HashRiga AS HashDb FROM {TABLE_NAME}", conn,
+                               dtype={'NumeroMandato': 'Int64', 'Anno': 'Int64', 'NomeFileOrigine': 'str', 'RigaMandato': 'Int64'})
+        keyed = df[PAGAMENTI_KEY_COLUMNS + ['HashRiga']].astype({'RigaMandato': 'Int64'}).reset_index()
+        merged = keyed.merge(existing, on=PAGAMENTI_KEY_COLUMNS, how='outer', indicator=True)
+
+        is_new = merged['_merge'] == 'left_only'
+        is_changed = (merged['_merge'] == 'both') & (merged['HashRiga'] != merged['HashDb'])
+        to_write = df.loc[merged.loc[is_new | is_changed, 'index'].astype(int)]
+        to_delete = merged.loc[merged['_merge'] == 'right_only', PAGAMENTI_KEY_COLUMNS]
+        logger.info(f"Righe nel dataset: {len(df)}, nel database: {len(existing)}. Nuove: {int(is_new.sum())}, "
+                    f"modificate: {int(is_changed.sum())}, da eliminare: {len(to_delete)}.")
+
+        had_summaries = _summaries_present(conn)
+        if to_write.empty and to_delete.empty and had_summaries:
+            logger.info("Nessuna modifica da applicare: database già allineato al dataset processato.")
+            return True
+
+        affected_years = {int(y) for y in pd.concat([to_write['Anno'], to_delete['Anno']]).dropna()}
+        where_key = " AND ".join(f"{col} IS ?" for col in PAGAMENTI_KEY_COLUMNS) # IS: confronta anche i NULL
+        with conn: # Un'unica transazione: commit alla fine, rollback in caso di errore
+            _executemany_batched(conn, f"DELETE FROM {TABLE_NAME} WHERE {where_key}", _python_rows(to_delete))
+            _executemany_batched(conn, _upsert_sql(), _insert_rows(to_write))
+            # Senza riepiloghi (primo caricamento) vanno calcolati per tutti gli anni
+            refresh_summaries(conn, years=affected_years if had_summaries else None)
+            stamp_data_version(conn) # Invalida le risposte in cache dell'app, nello stesso commit dei dati
+        logger.info(f"Transazione completata: {len(to_write)} righe scritte, {len(to_delete)} eliminate "
+                    f"(anni interessati: {sorted(affected_years)}).")
+
+        # ANALYZE completo solo al primo caricamento; poi PRAGMA optimize
+        build_schema(conn, analyze=existing.empty)
+        if not check_summaries(conn, years=affected_years if had_summaries else None):
+            logger.warning("Le tabelle riepilogative non coincidono con i pagamenti: verificare il caricamento.")
+        return True
+
+    except Exception as e:
+        logger.error(f"Errore caricamento incrementale DB: {e}", exc_info=True)
+        return False
+    finally:
+        if conn: conn.close(); logger.info("Connessione DB chiusa.")
+
+
+def _copy_other_tables(conn: sqlite3.Connection, source_path: Path):
+    """Copia nel database ombra le tabelle non prodotte da questo script (es. beneficiari_info) con i loro indici."""
+    if not source_path.is_file(): return
+    own_tables = {TABLE_NAME, SUMMARY_BENEFICIARIO_ANNO_TABLE, SUMMARY_ANNO_TABLE, METADATA_TABLE}
+    conn.execute("ATTACH DATABASE ? AS live", (f"{source_path.resolve().as_uri()}?mode=ro",))
+    try:
+        tables = conn.execute("SELECT name, sql FROM live.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+        with conn:
+            for name, create_sql in tables:
+                if name in own_tables or not create_sql: continue
+                conn.execute(create_sql)
+                conn.execute(f'INSERT INTO main."{name}" SELECT * FROM live."{name}"')
+                for (index_sql,) in conn.execute("SELECT sql FROM live.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (name,)).fetchall():
+                    conn.execute(index_sql)
+                logger.info(f"Tabella '{name}' copiata dal database attuale.")
+    finally:
+        conn.execute("DETACH DATABASE live")
+
+
+def rebuild_full(df: pd.DataFrame) -> bool:
+    """
+    Ricostruzione completa senza interruzioni: costruisce un database ombra accanto a quello servito
+    e ne copia il contenuto nel file servito con l'API di backup di SQLite (una sola transazione).
+    Il file resta lo stesso, quindi ogni connessione già aperta (pool dell'app, engine di Flask-Admin)
+    vede i nuovi dati alla lettura successiva, senza riaprire nulla.
+    """
+    shadow_path = DB_PATH.with_name(DB_PATH.name + ".shadow")
+    shadow_path.unlink(missing_ok=True)
+    conn = None
+    try:
+        logger.info(f"Costruzione database ombra: {shadow_path}")
+        conn = sqlite3.connect(shadow_path)
+        create_pagamenti_table(conn)
+        with conn:
+            _executemany_batched(conn, _upsert_sql(), _insert_rows(df))
+            refresh_summaries(conn)
+            stamp_data_version(conn)
+        logger.info(f"Scritte {len(df)} righe nella tabella '{TABLE_NAME}' del database ombra.")
+        _copy_other_tables(conn, DB_PATH)
+        build_schema(conn)
+        if not check_summaries(conn):
+            logger.warning("Le tabelle riepilogative non coincidono con i pagamenti: verificare il caricamento.")
+        conn.close(); conn = None
+
+        # Copia nel file servito (non rename: le connessioni aperte sul vecchio inode leggerebbero dati superati)
+        shadow_conn = sqlite3.connect(shadow_path)
+        try:
+            conn = sqlite3.connect(DB_PATH, timeout=60)
+            shadow_conn.backup(conn)
+        finally:
+            shadow_conn.close()
+        enable_wal(conn)
+        shadow_path.unlink(missing_ok=True)
+        logger.info(f"Database aggiornato dal database ombra (backup SQLite): {DB_PATH}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Errore ricostruzione completa DB: {e}", exc_info=True)
+        if conn: conn.close(); conn = None
+        shadow_path.unlink(missing_ok=True)
+        return False
+    finally:
+        if conn: conn.close(); logger.info("Connessione DB chiusa.")
+
+
+def log_table_overview():
+    """Schema e numero di righe della tabella pagamenti (verifica finale)."""
+    conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({TABLE_NAME});")
+        logger.info(f"Schema tabella '{TABLE_NAME}':")
+        for col in cursor.fetchall(): logger.info(f"  - Colonna: {col[1]}, Tipo SQLite: {col[2]}")
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+        count = cursor.fetchone()[0]; logger.info(f"Verifica: la tabella contiene {count} righe.")
+    finally:
+        conn.close()
+
+
+def is_legacy_database() -> bool:
+    """True se il database ha una tabella pagamenti scritta dalle versioni precedenti (senza chiave naturale o con Anno obbligatorio)."""
+    if not DB_PATH.is_file() or not _table_exists(DB_PATH, TABLE_NAME): return False
+    conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return not pagamenti_table_is_current(conn)
+    finally:
+        conn.close()
+
+
+# --- Blocco Esecuzione ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carica i pagamenti processati nel database SQLite.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ricostruisce il database in un file ombra e lo sostituisce atomicamente, invece di applicare solo le differenze.")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    try:
+        df = read_processed_dataset()
+    except Exception as e:
+        logger.error(f"Errore lettura dataset processato {PROCESSED_PARQUET}: {e}", exc_info=True)
+        exit(1)
+
+    full = args.full
+    if not full and is_legacy_database():
+        logger.info(f"Tabella '{TABLE_NAME}' nel formato precedente (chiave naturale assente o senza righe prive di anno): eseguo una ricostruzione completa.")
+        full = True
+
+    success = rebuild_full(df) if full else load_incremental(df)
+    if success:
+        log_table_overview()
+    logger.info(f"--- Script caricamento SQLite completato in {time.time() - start_time:.2f} secondi. Successo: {success} ---")
+    if not success:
+        exit(1) # Esce con codice di errore se fallito
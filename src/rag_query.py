@@ -9,6 +9,14 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from google.api_core import exceptions as google_exceptions
 
+try:
+    from .tools.chroma_pool import get_collection as get_pooled_collection
+    from .tools.embedding_cache import get_embedding_cache
+except ImportError:
+    # Fallback se eseguito direttamente (python src/rag_query.py)
+    from tools.chroma_pool import get_collection as get_pooled_collection
+    from tools.embedding_cache import get_embedding_cache
+
 # --- Configurazione Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -48,18 +56,27 @@ TASK_TYPE_QUERY = "retrieval_query"
 
 # --- Funzione Helper per Embedding Query (Potrebbe essere in un modulo utils) ---
 def get_embedding_for_query(query: str) -> Optional[list[float]]:
-    """Genera l'embedding per una singola query utente."""
+    """Genera l'embedding per una singola query utente (con cache locale per le domande ripetute)."""
     if not genai: # Se config fallita
         logger.error("Modulo GenAI non configurato correttamente.")
         return None
     if not query or not isinstance(query, str): return None
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached_embedding = cache.get(GEMINI_EMBEDDING_MODEL, TASK_TYPE_QUERY, query)
+        if cached_embedding is not None:
+            logger.debug(f"Embedding query da cache: '{query[:50]}...'")
+            return cached_embedding
     try:
         result = genai.embed_content(
             model=GEMINI_EMBEDDING_MODEL,
             content=query,
             task_type=TASK_TYPE_QUERY
         )
-        return result.get('embedding')
+        embedding = result.get('embedding')
+        if cache is not None and embedding:
+            cache.put(GEMINI_EMBEDDING_MODEL, TASK_TYPE_QUERY, query, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"Errore generazione embedding per query '{query[:50]}...': {e}", exc_info=True)
         return None
@@ -176,10 +193,9 @@ def ask_pagamenti(query: str, n_results: int = RAG_DEFAULT_N_RESULTS) -> Dict:
     # 2. Connetti a ChromaDB e Query
     retrieved_chunks = []
     try:
-        logger.debug(f"Connessione a ChromaDB: {chroma_db_full_path}")
-        client = chromadb.PersistentClient(path=str(chroma_db_full_path))
-        logger.debug(f"Ottenimento collezione: {CHROMA_COLLECTION_NAME}")
-        collection = client.get_collection(name=CHROMA_COLLECTION_NAME) # Usa get_collection, deve esistere!
+        logger.debug(f"Ottenimento collezione dal pool: {CHROMA_COLLECTION_NAME} ({chroma_db_full_path})")
+        # Handle condiviso: il client viene aperto una sola volta e riaperto se l'indice cambia su disco
+        collection = get_pooled_collection(name=CHROMA_COLLECTION_NAME, path=chroma_db_full_path) # Deve esistere!
 
         logger.info(f"Esecuzione query vettoriale su '{collection.name}' (n_results={n_results})...")
         results = collection.query(
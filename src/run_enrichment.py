@@ -3,8 +3,9 @@
 import pandas as pd
 import sqlite3
 from pathlib import Path
+import argparse
 import logging
-import time
+import os
 import sys
 import re
 from tqdm import tqdm # Per una barra di progresso carina
@@ -12,7 +13,12 @@ from tqdm import tqdm # Per una barra di progresso carina
 # Importa le funzioni dal tool
 try:
     # Assumendo che run_enrichment.py sia in src/ e il tool in src/tools/
-    from tools.wikipedia_enricher_tool import get_wikipedia_summary, normalize_string
+    from tools.wikipedia_enricher_tool import enrich_terms, use_wikipedia_stub, normalize_string
+    from tools.wikipedia_cache import get_wikipedia_cache
+    from tools.wikipedia_stub import load_stub_pages
+    from tools.rate_limiter import TokenBucket
+    from tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+    from tools.db_schema import stamp_data_version
 except ImportError:
     # Gestisci il caso in cui l'importazione diretta/relativa fallisca
     # Questo blocco prova ad aggiungere 'src' al path se necessario
@@ -21,7 +27,12 @@ except ImportError:
     if str(src_dir) not in sys.path:
          sys.path.append(str(src_dir))
     try:
-        from tools.wikipedia_enricher_tool import get_wikipedia_summary, normalize_string
+        from tools.wikipedia_enricher_tool import enrich_terms, use_wikipedia_stub, normalize_string
+        from tools.wikipedia_cache import get_wikipedia_cache
+        from tools.wikipedia_stub import load_stub_pages
+        from tools.rate_limiter import TokenBucket
+        from tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+        from tools.db_schema import stamp_data_version
     except ImportError as e:
         logging.critical(f"Errore critico: Impossibile importare da tools.wikipedia_enricher_tool. Assicurati che esista e sia nel PYTHONPATH. Dettagli: {e}")
         sys.exit(1)
@@ -34,23 +45,26 @@ logger = logging.getLogger(__name__)
 # --- Percorsi e Costanti ---
 try:
     PROJECT_ROOT = Path(__file__).parent.parent.resolve()
-    PROCESSED_CSV = PROJECT_ROOT / "data" / "processed_data" / "processed_pagamenti.csv"
     ENRICHED_DIR = PROJECT_ROOT / "data" / "enriched_data"
     ENRICHED_CSV = ENRICHED_DIR / "beneficiari_info.csv"
     DB_PATH = PROJECT_ROOT / "data" / "database" / "busto_pagamenti.db"
     DB_TABLE_NAME = "beneficiari_info"
-    WIKI_REQUEST_DELAY = 0.5 # Riduci a tuo rischio (es. 0.5), ma 1.0 è più sicuro
 except NameError:
     PROJECT_ROOT = Path('.').resolve()
-    PROCESSED_CSV = PROJECT_ROOT / "data" / "processed_data" / "processed_pagamenti.csv"
     ENRICHED_DIR = PROJECT_ROOT / "data" / "enriched_data"
     ENRICHED_CSV = ENRICHED_DIR / "beneficiari_info.csv"
     DB_PATH = PROJECT_ROOT / "data" / "database" / "busto_pagamenti.db"
     DB_TABLE_NAME = "beneficiari_info"
-    WIKI_REQUEST_DELAY = 0.5
     logging.warning(f"__file__ non definito, PROJECT_ROOT impostato su: {PROJECT_ROOT}")
 
 ENRICHED_DIR.mkdir(parents=True, exist_ok=True)
+# Ricerche Wikipedia in parallelo: il ritmo complessivo verso l'API è fissato dal rate limiter condiviso
+# (al posto della pausa fissa dopo ogni chiamata), i worker servono a sovrapporre le latenze
+WIKI_WORKERS = int(os.environ.get("WIKI_WORKERS", 8))
+# Limite in richieste HTTP: una ricerca costa 1 richiesta se la pagina non esiste, 2 se esiste (info + riassunto)
+WIKI_REQUESTS_PER_SECOND = float(os.environ.get("WIKI_REQUESTS_PER_SECOND", 10))
+# Un 429 visto da più worker insieme dimezza la velocità una volta sola per finestra
+WIKI_PENALTY_COOLDOWN_SECONDS = float(os.environ.get("WIKI_PENALTY_COOLDOWN_SECONDS", 5))
 
 # --- Funzione di Filtraggio ---
 # Definisci qui le keyword che indicano una società/ente (e quindi da NON skippare)
@@ -124,19 +138,19 @@ def should_skip_wikipedia_search(original_name: str, normalized_name: str) -> bo
     return False
 
 
-def run_beneficiary_enrichment():
+def run_beneficiary_enrichment(workers: int = WIKI_WORKERS, requests_per_second: float = WIKI_REQUESTS_PER_SECOND):
     logger.info("--- Avvio Script Arricchimento Beneficiari (con Filtri) ---")
 
-    # 1. Leggi CSV e ottieni unici (invariato)
+    # 1. Leggi il dataset (solo la colonna Beneficiario) e ottieni unici
     try:
-        logger.info(f"Lettura file pagamenti: {PROCESSED_CSV}")
-        df_pagamenti = pd.read_csv(PROCESSED_CSV, usecols=['Beneficiario'], encoding='utf-8-sig')
+        logger.info(f"Lettura dataset pagamenti: {PROCESSED_PARQUET}")
+        df_pagamenti = load_processed_dataset(columns=['Beneficiario'])
         beneficiari_unici = df_pagamenti['Beneficiario'].dropna().astype(str).str.strip().unique()
         beneficiari_unici = [b for b in beneficiari_unici if b]
         logger.info(f"Trovati {len(beneficiari_unici)} beneficiari unici iniziali.")
         if not beneficiari_unici: return
     except Exception as e:
-        logger.error(f"Errore lettura CSV pagamenti: {e}", exc_info=True)
+        logger.error(f"Errore lettura dataset pagamenti: {e}", exc_info=True)
         return
 
     # 2. Normalizzazione e Raggruppamento (invariato)
@@ -210,32 +224,24 @@ def run_beneficiary_enrichment():
 
     # 5. Arricchisci solo i gruppi filtrati e non in cache valida (con caching)
     enriched_data_list = []
-    api_calls_made = 0
-    cache_hits_in_loop = 0 # Contatore separato per i cache hit DENTRO il loop
+    representative_names = {normalized_name: max(original_variants, key=len) for normalized_name, original_variants in groups_to_search.items()}
+    rate_limiter = TokenBucket(requests_per_second, capacity=max(1, workers), name="wikipedia",
+                               penalty_cooldown=WIKI_PENALTY_COOLDOWN_SECONDS)
+    wiki_cache = get_wikipedia_cache()
+    cache_stats_before = wiki_cache.stats() if wiki_cache else None
 
-    logger.info("Inizio arricchimento tramite Wikipedia per gruppi filtrati/da ritentare...")
+    logger.info(f"Inizio arricchimento tramite Wikipedia per gruppi filtrati/da ritentare ({workers} worker, max {requests_per_second:.1f} richieste/s)...")
 
-    # Itera sui gruppi con tqdm (ora il totale è corretto per le chiamate API)
-    for normalized_name, original_variants in tqdm(groups_to_search.items(), total=total_groups_to_search, desc="Cercando/Ritentando"):
-
-        wiki_result = {'summary': None, 'url': None, 'status': 'unknown'} # Default
-
-        # Non serve più ricontrollare la cache qui, perché abbiamo già filtrato `groups_to_search`
-        # Procediamo direttamente alla chiamata API per questi gruppi
-
-        representative_name = max(original_variants, key=len)
-        logger.debug(f"Chiamata API per gruppo '{normalized_name}' (usando '{representative_name}')...")
-
-        # --- Chiamata API ---
-        wiki_result = get_wikipedia_summary(representative_name) # O usa normalized_name
-        api_calls_made += 1 # Incrementa qui perché stiamo facendo la chiamata
+    # Ricerche in parallelo (con cache persistente per termine, anche degli esiti negativi); tqdm avanza a ogni gruppo completato
+    with tqdm(total=total_groups_to_search, desc="Cercando/Ritentando") as progress:
+        wiki_results = enrich_terms(representative_names, workers=workers, rate_limiter=rate_limiter, progress=progress)
 
+    for normalized_name, original_variants in groups_to_search.items():
+        wiki_result = wiki_results[normalized_name]
+        representative_name = representative_names[normalized_name]
         # Aggiorna cache in memoria per evitare chiamate duplicate nella stessa run
         already_enriched_normalized[normalized_name] = wiki_result
 
-        # Pausa SOLO dopo una chiamata API
-        time.sleep(WIKI_REQUEST_DELAY)
-
         # Aggiungi record per OGNI variante originale nel gruppo APPENA CERCATO
         for original_beneficiario in original_variants:
             enriched_data_list.append({
@@ -282,7 +288,12 @@ def run_beneficiary_enrichment():
                   })
 
 
-    logger.info(f"Arricchimento completato. Chiamate API Wikipedia effettuate in questa run: {api_calls_made}.")
+    if wiki_cache:
+        cache_stats = wiki_cache.stats()
+        api_lookups = cache_stats['misses'] - cache_stats_before['misses']
+        logger.info(f"Arricchimento completato. Ricerche Wikipedia in questa run: {api_lookups} via API, {cache_stats['hits'] - cache_stats_before['hits']} dalla cache persistente.")
+    else:
+        logger.info(f"Arricchimento completato. Gruppi cercati via API in questa run: {total_groups_to_search} (cache Wikipedia disabilitata).")
 
     # 6. Crea DataFrame finale e salva 
     if not enriched_data_list:
@@ -321,6 +332,7 @@ def run_beneficiary_enrichment():
         logger.info(f"Creazione indici su tabella '{DB_TABLE_NAME}'...")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_beneficiario ON {DB_TABLE_NAME} (Beneficiario);")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_nome_normalizzato ON {DB_TABLE_NAME} (NomeNormalizzato);")
+        stamp_data_version(conn) # I riassunti entrano nelle risposte: invalida la cache delle risposte dell'app
         conn.commit()
         logger.info("Indici creati.")
 
@@ -336,4 +348,10 @@ def run_beneficiary_enrichment():
 
 # --- Esecuzione ---
 if __name__ == "__main__":
-    run_beneficiary_enrichment()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Arricchisce i beneficiari con i riassunti di Wikipedia.")
+    parser.add_argument("--workers", type=int, default=WIKI_WORKERS, help="Ricerche Wikipedia in parallelo (WIKI_WORKERS).")
+    parser.add_argument("--requests-per-second", type=float, default=WIKI_REQUESTS_PER_SECOND, help="Limite globale di richieste HTTP all'API al secondo (WIKI_REQUESTS_PER_SECOND).")
+    parser.add_argument("--wiki-stub", type=Path, default=None, help="File JSON {titolo: testo}: usa un sostituto locale dell'API Wikipedia (nessuna rete).")
+    args = parser.parse_args()
+    if args.wiki_stub: use_wikipedia_stub(load_stub_pages(args.wiki_stub))
+    run_beneficiary_enrichment(args.workers, args.requests_per_second)
\ No newline at end of file
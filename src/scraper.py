@@ -1,5 +1,6 @@
+import hashlib
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import time
 import os
 from urllib.parse import urljoin, urlparse, unquote
@@ -7,16 +8,43 @@ import logging
 import re
 import csv
 import math
+import argparse
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Selenium Imports
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, ElementClickInterceptedException
-from webdriver_manager.firefox import GeckoDriverManager
+def _use_fixture_run_paths(argv):
+    """
+    Con --record/--replay allegati, manifest, stato incrementale ed elenco dei link stanno sotto la cartella delle
+    fixture (DIR/record_state o DIR/replay_state) invece che in data/: un giro su fixture non deve
+    segnare come scaricati gli atti del giro reale. Va fatto prima di importare i tool, che leggono
+    i percorsi all'import; le variabili d'ambiente già impostate hanno la precedenza.
+    """
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--record"); pre_parser.add_argument("--replay")
+    known, _ = pre_parser.parse_known_args(argv)
+    mode, directory = ("record", known.record) if known.record else ("replay", known.replay)
+    if not directory: return
+    run_dir = os.path.join(os.path.abspath(directory), f"{mode}_state")
+    os.environ.setdefault("SCRAPER_DOWNLOAD_DIR", os.path.join(run_dir, "downloads"))
+    os.environ.setdefault("DOWNLOAD_MANIFEST_FILE", os.path.join(run_dir, "download_manifest.db"))
+    os.environ.setdefault("CRAWL_STATE_FILE", os.path.join(run_dir, "crawl_state.db"))
+    os.environ.setdefault("SCRAPER_OUTPUT_CSV", os.path.join(run_dir, "found_excel_links_iframe.csv"))
+if __name__ == "__main__": _use_fixture_run_paths(sys.argv[1:])
+
+try:
+    from .tools.rate_limiter import HostThrottle
+    from .tools.download_manifest import get_download_manifest, file_sha256
+    from .tools.html_extract import parse_html, listing_rows, download_href, next_page_link, NEXT_PAGE_TEXT, LISTING_TABLE_CLASS
+    from .tools.http_fixtures import mount_fixtures
+    from .tools.crawl_state import get_crawl_state
+except ImportError:
+    # Eseguito come script (python src/scraper.py)
+    from tools.rate_limiter import HostThrottle
+    from tools.download_manifest import get_download_manifest, file_sha256
+    from tools.html_extract import parse_html, listing_rows, download_href, next_page_link, NEXT_PAGE_TEXT, LISTING_TABLE_CLASS
+    from tools.http_fixtures import mount_fixtures
+    from tools.crawl_state import get_crawl_state
 
 # --- CONFIGURAZIONE ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,6 +53,12 @@ MAIN_PAGE_URL = "https://bustoarsizio.trasparenza-valutazione-merito.it/"
 MENU_PAGAMENTI_XPATH = "//*[@id='menu-item-header-35125']"
 SUBMENU_DATI_PAGAMENTI_SELECTOR_ID = "menu-item-header-35127"
 IFRAME_SELECTOR_ID = "corrente-iframe"
+# URL diretto dell'elenco (src dell'iframe); se vuoto viene ricavato dalla pagina principale
+SCRAPER_LISTING_URL = os.environ.get("SCRAPER_LISTING_URL", "")
+# Limite pagine dell'elenco (0 = tutte); un limite raggiunto viene sempre segnalato nel log
+SCRAPER_MAX_PAGES = int(os.environ.get("SCRAPER_MAX_PAGES", 0))
+# Esecuzione incrementale (predefinita): paginazione fino alla prima pagina di atti già noti, nessun dettaglio per gli atti già scaricati
+SCRAPER_INCREMENTAL = os.environ.get("SCRAPER_INCREMENTAL", "1").lower() not in ("0", "false", "no")
 
 # --- Percorsi  ---
 # Ottieni la directory dello script corrente (src)
@@ -33,8 +67,9 @@ SRC_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SRC_DIR)
 # Definisci la cartella dei dati relativa alla radice
 DATA_FOLDER = os.path.join(PROJECT_ROOT, "data")
-DOWNLOAD_DIR = os.path.join(DATA_FOLDER, "downloaded_files")
-OUTPUT_CSV = os.path.join(DATA_FOLDER, "found_excel_links_iframe.csv")
+# Cartella degli allegati (sovrascrivibile, es. per le esecuzioni su fixture registrate)
+DOWNLOAD_DIR = os.environ.get("SCRAPER_DOWNLOAD_DIR") or os.path.join(DATA_FOLDER, "downloaded_files")
+OUTPUT_CSV = os.environ.get("SCRAPER_OUTPUT_CSV") or os.path.join(DATA_FOLDER, "found_excel_links_iframe.csv")
 
 # Crea le directory se non esistono
 os.makedirs(DATA_FOLDER, exist_ok=True)
@@ -44,77 +79,266 @@ os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 def is_relevant_object(text): text_upper = text.upper(); return "PAGAMENTI" in text_upper
 ALLOWED_EXTENSIONS = ('.xlsx', '.xls', '.ods')
 DOWNLOAD_LINK_SELECTOR = "a[href*='downloadAllegato']"
+# Estensioni accettate dal ripiego generico quando manca il link 'downloadAllegato'
+FALLBACK_ATTACHMENT_EXTENSIONS = ALLOWED_EXTENSIONS + ('.zip', '.pdf', '.doc', '.p7m')
 DETAIL_LINK_TITLE = "Apri Dettaglio"
+# Fase download concorrente: atti elaborati in parallelo, con limite di richieste contemporanee
+# e intervallo minimo tra due richieste verso lo stesso host (al posto delle pause fisse)
+SCRAPER_WORKERS = int(os.environ.get("SCRAPER_WORKERS", 8))
+SCRAPER_MAX_PER_HOST = int(os.environ.get("SCRAPER_MAX_PER_HOST", 4))
+SCRAPER_MIN_INTERVAL = float(os.environ.get("SCRAPER_MIN_INTERVAL", 0.1))
 session = requests.Session()
 session.headers.update({'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0'})
+# Pool di connessioni keep-alive dimensionato sui worker, condiviso da tutti i thread
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(SCRAPER_WORKERS, 10)))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max(SCRAPER_WORKERS, 10)))
+host_throttle = HostThrottle(SCRAPER_MAX_PER_HOST, SCRAPER_MIN_INTERVAL, name="scraper")
+# Un lock per file di destinazione: due atti con lo stesso allegato non lo scrivono insieme
+_dest_locks = {}; _dest_locks_guard = threading.Lock()
+# Manifest degli allegati (URL, ETag, Last-Modified, dimensione, sha256): guida GET condizionali e riprese
+download_manifest = get_download_manifest()
+# Stato della paginazione tra un'esecuzione e l'altra (atti visti per data-id, ultima data di pubblicazione)
+crawl_state = get_crawl_state()
 # ────────────────────────────────────────────────────────────────────────────────────
 
 # --- Funzioni (Download, Estrazione HTML) - INVARIATE ---
 def sanitize_filename(fn: str) -> str: fn = unquote(fn); fn = re.sub(r"^(?:filename\*=UTF-8'')?", '', fn, flags=re.IGNORECASE); fn = re.sub(r'[\\/*?:"<>|]', '_', fn); fn = fn.strip(); return fn[:150]
+def _dest_lock(dest_path):
+    with _dest_locks_guard: return _dest_locks.setdefault(dest_path, threading.Lock())
 def find_excel_link_in_detail(detail_url):
-    time.sleep(0.3); logging.info(f"Accesso a pagina dettaglio (requests): {detail_url}")
-    try: response = session.get(detail_url, timeout=30); response.raise_for_status(); html_content = response.text
+    """URL dell'allegato nella pagina di dettaglio: "" se la pagina non ha link allegato, None se non è raggiungibile."""
+    logging.info(f"Accesso a pagina dettaglio (requests): {detail_url}")
+    try:
+        with host_throttle.slot(detail_url): response = session.get(detail_url, timeout=30); response.raise_for_status(); html_content = response.text
     except requests.exceptions.RequestException as e: logging.error(f"Errore accesso dettaglio {detail_url}: {e}"); return None
-    soup = BeautifulSoup(html_content, 'lxml'); link_tag = soup.select_one(DOWNLOAD_LINK_SELECTOR)
-    if link_tag and link_tag.has_attr('href'): excel_url = urljoin(BASE_URL, link_tag['href']); logging.info(f"Trovato link download ({DOWNLOAD_LINK_SELECTOR}): {excel_url}"); return excel_url
-    else:
-        for link_tag_fallback in soup.find_all('a', href=True):
-             href = link_tag_fallback['href']
-             if any((href.lower().endswith(ext + '?p_auth=') or href.lower().endswith(ext)) for ext in ALLOWED_EXTENSIONS + ('.zip', '.pdf', '.doc', '.p7m')): excel_url = urljoin(BASE_URL, href); logging.info(f"Trovato link download (fallback generico): {excel_url}"); return excel_url
-        logging.warning(f"Nessun link allegato trovato in: {detail_url}"); return None
+    # Estrazione con XPath compilati su lxml (tools/html_extract.py), senza costruire l'albero BeautifulSoup
+    href, is_fallback = download_href(parse_html(html_content), FALLBACK_ATTACHMENT_EXTENSIONS)
+    if href is None: logging.warning(f"Nessun link allegato trovato in: {detail_url}"); return ""
+    excel_url = urljoin(BASE_URL, href)
+    if is_fallback: logging.info(f"Trovato link download (fallback generico): {excel_url}")
+    else: logging.info(f"Trovato link download ({DOWNLOAD_LINK_SELECTOR}): {excel_url}")
+    return excel_url
+def filename_from_response(response, url: str, publication_object: str, data_id: str) -> str:
+    """Nome file dell'allegato: da Content-Disposition, altrimenti dall'URL finale, altrimenti generato."""
+    final_url = response.url
+    filename = None; match = None; content_disposition = response.headers.get("Content-Disposition", ""); logging.debug(f"Content-Disposition: '{content_disposition}'")
+    if "filename*" in content_disposition: match = re.search(r"filename\*=([^';\s]+)'([^']*)'([^;]+)", content_disposition);
+    if match: filename = sanitize_filename(match.group(3))
+    match = None
+    if not filename and "filename=" in content_disposition: match = re.search(r'filename="?([^";]+)"?', content_disposition);
+    if match: 
+        try: filename = sanitize_filename(match.group(1).encode('latin-1').decode('utf-8')); 
+        except: filename = sanitize_filename(match.group(1))
+    if not filename: logging.debug("Nome file non da CD. Tento da URL."); path_part = urlparse(final_url).path; filename = sanitize_filename(os.path.basename(path_part) or f"download_{data_id}")
+    if not filename or filename == "." or not os.path.splitext(filename)[1] : safe_object_name = "".join(c if c.isalnum() else "_" for c in publication_object[:50]).strip('_'); original_ext = os.path.splitext(urlparse(url).path)[1]; original_ext=original_ext if original_ext and len(original_ext)<=5 else ".tmp"; filename = f"pagamenti_{data_id}_{safe_object_name}{original_ext}"; logging.warning(f"Generato nome file di fallback: {filename}")
+    return filename
+def _is_allowed(filename):
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS: logging.info(f"⏭️  File '{filename}' saltato (estensione '{file_ext}' non consentita)."); return False
+    return True
+def _conditional_headers(entry):
+    """If-None-Match / If-Modified-Since dai validatori salvati nel manifest."""
+    headers = {}
+    if entry.get('etag'): headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'): headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+def _save_response(resp, url, filename, dest_path, offset=0, etag=None, last_modified=None):
+    """
+    Scrive il corpo della risposta in dest_path + '.part' (in coda se offset > 0, ripresa con Range),
+    verifica la lunghezza, rinomina in modo atomico e registra dimensione e sha256 nel manifest.
+    Se il trasferimento si interrompe il .part resta su disco e viene ripreso al giro successivo.
+    """
+    part_path = dest_path + ".part"
+    hasher = file_sha256(part_path) if offset else hashlib.sha256()
+    if not offset: download_manifest.start(url, filename, etag, last_modified)
+    bytes_downloaded = 0; start_time = time.time()
+    with open(part_path, "ab" if offset else "wb") as f:
+        for chunk in resp.iter_content(chunk_size=8192): f.write(chunk); hasher.update(chunk); bytes_downloaded += len(chunk)
+    expected = resp.headers.get("Content-Length")
+    if expected and not resp.headers.get("Content-Encoding") and bytes_downloaded != int(expected):
+        raise IOError(f"download incompleto ({bytes_downloaded}/{expected} byte), riprenderò da {part_path}")
+    os.replace(part_path, dest_path)
+    download_manifest.complete(url, filename, etag, last_modified, offset + bytes_downloaded, hasher.hexdigest())
+    duration = time.time() - start_time; speed_kbps = (bytes_downloaded / 1024 / duration) if duration > 0 else 0
+    logging.info(f"   → Salvato: {dest_path} ({bytes_downloaded/1024:.1f} KB in {duration:.2f}s, {speed_kbps:.1f} KB/s{f', ripreso da {offset} byte' if offset else ''})")
+    return dest_path
+def _refresh_download(url, entry, publication_object, data_id):
+    """GET condizionale di un allegato già scaricato: 304 -> invariato, 200 -> nuova versione."""
+    dest_path = os.path.join(DOWNLOAD_DIR, entry['filename'])
+    with _dest_lock(dest_path), host_throttle.slot(url), session.get(url, headers=_conditional_headers(entry), stream=True, timeout=120) as resp:
+        if resp.status_code == 304: download_manifest.touch(url); logging.info(f"✔️ File invariato (304): {entry['filename']}"); return dest_path
+        resp.raise_for_status()
+        filename = filename_from_response(resp, url, publication_object, data_id)
+        if not _is_allowed(filename): return False
+        dest_path = os.path.join(DOWNLOAD_DIR, filename)
+        logging.info(f"⬇️ Allegato aggiornato sul server, riscarico '{filename}' da {resp.url}")
+        return _save_response(resp, url, filename, dest_path, etag=resp.headers.get("ETag"), last_modified=resp.headers.get("Last-Modified"))
 def download_file(url: str, publication_object: str, data_id: str):
+    """
+    Scarica un allegato usando il manifest: GET condizionale se già scaricato (con ETag/Last-Modified),
+    ripresa con Range di un .part interrotto, altrimenti download completo in un .part rinominato alla fine.
+    Ritorna il percorso locale, False se l'estensione non è consentita, None in caso di errore.
+    """
     try:
-        logging.debug(f"Eseguo HEAD request per: {url}"); head_response = session.head(url, allow_redirects=True, timeout=20); head_response.raise_for_status(); final_url = head_response.url
-        filename = None; match = None; content_disposition = head_response.headers.get("Content-Disposition", ""); logging.debug(f"Content-Disposition: '{content_disposition}'")
-        if "filename*" in content_disposition: match = re.search(r"filename\*=([^';\s]+)'([^']*)'([^;]+)", content_disposition);
-        if match: filename = sanitize_filename(match.group(3))
-        match = None
-        if not filename and "filename=" in content_disposition: match = re.search(r'filename="?([^";]+)"?', content_disposition);
-        if match: 
-            try: filename = sanitize_filename(match.group(1).encode('latin-1').decode('utf-8')); 
-            except: filename = sanitize_filename(match.group(1))
-        if not filename: logging.debug("Nome file non da CD. Tento da URL."); path_part = urlparse(final_url).path; filename = sanitize_filename(os.path.basename(path_part) or f"download_{data_id}")
-        if not filename or filename == "." or not os.path.splitext(filename)[1] : safe_object_name = "".join(c if c.isalnum() else "_" for c in publication_object[:50]).strip('_'); original_ext = os.path.splitext(urlparse(url).path)[1]; original_ext=original_ext if original_ext and len(original_ext)<=5 else ".tmp"; filename = f"pagamenti_{data_id}_{safe_object_name}{original_ext}"; logging.warning(f"Generato nome file di fallback: {filename}")
-        file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext not in ALLOWED_EXTENSIONS: logging.info(f"⏭️  File '{filename}' saltato (estensione '{file_ext}' non consentita)."); return None
+        entry = download_manifest.get(url)
+        if entry and entry['complete'] and (entry['etag'] or entry['last_modified']) and os.path.exists(os.path.join(DOWNLOAD_DIR, entry['filename'])):
+            return _refresh_download(url, entry, publication_object, data_id)
+        logging.debug(f"Eseguo HEAD request per: {url}")
+        with host_throttle.slot(url): head_response = session.head(url, allow_redirects=True, timeout=20); head_response.raise_for_status(); final_url = head_response.url
+        filename = filename_from_response(head_response, url, publication_object, data_id)
+        if not _is_allowed(filename): return False
         # Usa la costante DOWNLOAD_DIR definita correttamente
-        dest_path = os.path.join(DOWNLOAD_DIR, filename)
-        if os.path.exists(dest_path): logging.info(f"✔️ File già presente: {filename}"); return dest_path
-        logging.info(f"⬇️ Scarico '{filename}' da {final_url}")
-        with session.get(final_url, stream=True, timeout=120) as resp:
-            resp.raise_for_status()
-            with open(dest_path, "wb") as f: bytes_downloaded = 0; start_time = time.time(); [f.write(chunk) for chunk in resp.iter_content(chunk_size=8192) if (bytes_downloaded := bytes_downloaded + len(chunk))]; duration = time.time() - start_time; speed_kbps = (bytes_downloaded / 1024 / duration) if duration > 0 else 0; logging.info(f"   → Salvato: {dest_path} ({bytes_downloaded/1024:.1f} KB in {duration:.2f}s, {speed_kbps:.1f} KB/s)")
-        return dest_path
+        dest_path = os.path.join(DOWNLOAD_DIR, filename); part_path = dest_path + ".part"
+        head_size = head_response.headers.get("Content-Length")
+        with _dest_lock(dest_path):
+            if os.path.exists(dest_path) and (not entry or entry['complete']):
+                # File senza validatori (scaricato prima del manifest o server senza ETag): lo tengo se la dimensione coincide
+                if head_size is None or int(head_size) == os.path.getsize(dest_path):
+                    if not entry: download_manifest.complete(url, filename, head_response.headers.get("ETag"), head_response.headers.get("Last-Modified"), os.path.getsize(dest_path), file_sha256(dest_path).hexdigest())
+                    logging.info(f"✔️ File già presente: {filename}"); return dest_path
+                logging.info(f"File '{filename}' presente ma di dimensione diversa da quella sul server: lo riscarico.")
+            headers = {}; offset = 0
+            if entry and not entry['complete'] and entry['filename'] == filename and os.path.exists(part_path):
+                validator = entry['etag'] if entry['etag'] and not entry['etag'].startswith('W/') else entry['last_modified']
+                if validator: offset = os.path.getsize(part_path); headers = {'Range': f"bytes={offset}-", 'If-Range': validator}
+            logging.info(f"⬇️ Scarico '{filename}' da {final_url}{f' (ripresa da {offset} byte)' if offset else ''}")
+            with host_throttle.slot(final_url), session.get(final_url, headers=headers, stream=True, timeout=120) as resp:
+                if resp.status_code == 416: os.remove(part_path); raise IOError("Range non soddisfacibile, .part rimosso: riprovare")
+                resp.raise_for_status()
+                if offset and resp.status_code == 206 and resp.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    return _save_response(resp, url, filename, dest_path, offset, entry['etag'], entry['last_modified'])
+                # 200: il server ha inviato il file intero (nessun .part o allegato cambiato dall'inizio del download)
+                return _save_response(resp, url, filename, dest_path, etag=resp.headers.get("ETag"), last_modified=resp.headers.get("Last-Modified"))
     except UnboundLocalError as e: logging.error(f"!!! UnboundLocalError download {url}: {e}."); return None
     except requests.exceptions.RequestException as e: logging.error(f"Errore rete download/HEAD {url}: {e}"); return None
     except Exception as e: logging.error(f"Errore generico download {url}: {e}"); return None
-def extract_data_from_html(html_content):
-    soup = BeautifulSoup(html_content, 'lxml'); relevant_items = []
-    table = soup.find('table', class_='master-detail-list-table')
-    if not table: logging.error("Tabella ('master-detail-list-table') non trovata nell'HTML (iframe?)."); return relevant_items
-    rows = table.find_all('tr', class_='master-detail-list-line'); logging.info(f"BS4: Trovate {len(rows)} righe.")
+def extract_data_from_html(html_content, page_rows=None):
+    """Atti rilevanti della pagina elenco. Se page_rows è una lista, vi aggiunge tutte le righe della pagina per lo stato incrementale."""
+    relevant_items = []; rows = listing_rows(parse_html(html_content), DETAIL_LINK_TITLE)
+    if rows is None: logging.error(f"Tabella ('{LISTING_TABLE_CLASS}') non trovata nell'HTML (iframe?)."); return relevant_items
+    logging.info(f"lxml: Trovate {len(rows)} righe.")
     items_added_count = 0
     for row in rows:
-        object_cell = row.find('td', class_='oggetto'); action_cell = row.find('td', class_='actions')
-        if object_cell and action_cell:
-            object_text = object_cell.get_text(strip=True)
-            # Filtro keyword applicato
-            if is_relevant_object(object_text):
-                logging.info(f" Oggetto RILEVANTE trovato: '{object_text[:60]}...'")
-                detail_link_tag = action_cell.find('a', title=DETAIL_LINK_TITLE)
-                if detail_link_tag and detail_link_tag.has_attr('href'):
-                    detail_url = urljoin(BASE_URL, detail_link_tag['href']); item_info = {'object': object_text, 'detail_url': detail_url, 'data_id': row.get('data-id', detail_url)}; relevant_items.append(item_info); items_added_count += 1
-                else: logging.warning(f" Riga rilevante '{object_text[:60]}...' ma senza link dettaglio.")
-            # else: logging.debug(f" Oggetto scartato (no keyword): '{object_text[:60]}...'")
-        # else: logging.debug(" Riga saltata (mancano celle oggetto/azioni).")
-    logging.info(f"BS4: Estratti {items_added_count} atti rilevanti da questo HTML.")
+        object_text = row['object']; detail_url = urljoin(BASE_URL, row['detail_href']) if row['detail_href'] is not None else None
+        if page_rows is not None: page_rows.append({'data_id': row['data_id'] if row['data_id'] is not None else detail_url, 'object': object_text, 'detail_url': detail_url, 'published': row['published'], 'relevant': is_relevant_object(object_text) and detail_url is not None})
+        # Filtro keyword applicato
+        if is_relevant_object(object_text):
+            logging.info(f" Oggetto RILEVANTE trovato: '{object_text[:60]}...'")
+            if detail_url is not None:
+                item_info = {'object': object_text, 'detail_url': detail_url, 'data_id': row['data_id'] if row['data_id'] is not None else detail_url}; relevant_items.append(item_info); items_added_count += 1
+            else: logging.warning(f" Riga rilevante '{object_text[:60]}...' ma senza link dettaglio.")
+        # else: logging.debug(f" Oggetto scartato (no keyword): '{object_text[:60]}...'")
+    logging.info(f"lxml: Estratti {items_added_count} atti rilevanti da questo HTML.")
     return relevant_items
+def _known_download(item_info):
+    """(excel_url, percorso locale) di un atto già scaricato in un'esecuzione precedente, oppure (None, None)."""
+    excel_url = crawl_state.attachment(item_info['data_id']); entry = download_manifest.get(excel_url) if excel_url else None
+    if not entry or not entry['complete']: return None, None
+    local_path = os.path.join(DOWNLOAD_DIR, entry['filename'])
+    return (excel_url, local_path) if os.path.exists(local_path) else (None, None)
+def process_item_download(position, total, item_info, incremental=SCRAPER_INCREMENTAL):
+    """
+    Risolve il link allegato dalla pagina di dettaglio e lo scarica. Ritorna (excel_url, riepilogo o None).
+    In modalità incrementale un atto il cui allegato è già nel manifest, o il cui dettaglio era senza allegati, non viene riaperto.
+    """
+    if incremental and crawl_state.done_without_attachment(item_info['data_id']):
+        logging.info(f"[{position}/{total}] Dettaglio già letto senza allegati, salto: '{item_info['object'][:80]}...'"); return None, None
+    excel_url, downloaded_path = _known_download(item_info) if incremental else (None, None)
+    if downloaded_path: logging.info(f"[{position}/{total}] ✔️ Già scaricato, salto il dettaglio: '{item_info['object'][:80]}...'")
+    else:
+        logging.info(f"[{position}/{total}] Processo Download: '{item_info['object'][:80]}...'")
+        excel_url = find_excel_link_in_detail(item_info['detail_url'])
+        if excel_url == "": crawl_state.mark_done(item_info['data_id'], None) # Dettaglio letto ma senza allegato: non riproporlo a ogni giro
+        if not excel_url: return None, None
+        item_id_for_download = item_info['data_id'] if item_info['data_id'] != item_info['detail_url'] else item_info['detail_url'].split('/')[-1]
+        downloaded_path = download_file(excel_url, item_info['object'], item_id_for_download)
+        if downloaded_path is not None: crawl_state.mark_done(item_info['data_id'], excel_url) # Scaricato o saltato per estensione: atto noto
+        if not downloaded_path: return excel_url, None
+    return excel_url, {'object': item_info['object'], 'source_url': item_info['detail_url'], 'excel_url': excel_url, 'local_path': downloaded_path, 'data_id': item_info['data_id'] }
 
 
-# --- CICLO PRINCIPALE CON IFRAME SENZA CLICK INTERNI ---
-def run_scraper_main():
-    all_items_found = []; processed_detail_urls = set(); excel_links_found = []
-    downloaded_files_summary = [] # Inizializzazione per riepilogo
+# --- FASE ELENCO: requests sull'iframe (predefinita), Selenium come ripiego ---
+def _get_html(url):
+    with host_throttle.slot(url): response = session.get(url, timeout=30); response.raise_for_status(); return response.text
+def find_listing_url():
+    """URL dell'elenco pagamenti (src dell'iframe #corrente-iframe), senza browser. None se non individuabile."""
+    if SCRAPER_LISTING_URL: return SCRAPER_LISTING_URL
+    logging.info(f"Ricerca iframe elenco dalla pagina principale: {MAIN_PAGE_URL}")
+    page_url = MAIN_PAGE_URL; root = parse_html(_get_html(page_url))
+    iframe = root.xpath("//iframe[@id = $id]", id=IFRAME_SELECTOR_ID) if root is not None else []
+    if not iframe and root is not None:
+        # L'iframe compare nella pagina della voce "Dati sui pagamenti" del menu
+        menu_item = root.xpath("//*[@id = $id]", id=SUBMENU_DATI_PAGAMENTI_SELECTOR_ID); link = None
+        if menu_item: link = menu_item[0] if menu_item[0].tag == 'a' and menu_item[0].get('href') is not None else next(iter(menu_item[0].xpath(".//a[@href]")), None)
+        if link is None or link.get('href').startswith(('#', 'javascript')): logging.warning(f"Voce di menu #{SUBMENU_DATI_PAGAMENTI_SELECTOR_ID} senza link seguibile."); return None
+        page_url = urljoin(MAIN_PAGE_URL, link.get('href')); logging.info(f"Pagina 'Dati sui pagamenti': {page_url}")
+        page_root = parse_html(_get_html(page_url))
+        iframe = page_root.xpath("//iframe[@id = $id]", id=IFRAME_SELECTOR_ID) if page_root is not None else []
+    if not iframe or not iframe[0].get('src'): logging.warning(f"Iframe #{IFRAME_SELECTOR_ID} non trovato in {page_url}."); return None
+    return urljoin(page_url, iframe[0].get('src'))
+def find_next_page_url(html_content, current_url):
+    """
+    Link 'Avanti' della paginazione: (URL pagina successiva o None, True se il link è attivo).
+    Un link attivo ma non seguibile senza JavaScript restituisce (None, True).
+    """
+    href, is_active = next_page_link(parse_html(html_content))
+    if not is_active: return None, False
+    if not href or href.startswith(('#', 'javascript')): return None, True
+    return urljoin(current_url, href), True
+def _stop_at_known_pages(incremental):
+    """La paginazione può fermarsi agli atti noti solo se una paginazione precedente è arrivata in fondo all'elenco."""
+    if not incremental: return False
+    if not crawl_state.is_complete(): logging.info("Nessuna paginazione completa registrata: scorro tutto l'elenco."); return False
+    logging.info(f"Paginazione incrementale: mi fermo alla prima pagina di soli atti già noti (ultima pubblicazione nota: {crawl_state.last_published() or 'n/d'}).")
+    return True
+def _page_is_known(page_rows, stop_at_known, page_count):
+    """Controlla (prima di registrarle) se le righe della pagina sono tutte note, poi le registra nello stato."""
+    known = stop_at_known and crawl_state.all_known(page_rows)
+    crawl_state.record_rows(page_rows)
+    if known: logging.info(f"Pagina {page_count} composta solo da atti già noti: fine paginazione incrementale.")
+    return known
+def collect_items_requests(max_pages=SCRAPER_MAX_PAGES, incremental=SCRAPER_INCREMENTAL):
+    """Scorre le pagine dell'elenco con la sessione requests condivisa. Solleva RuntimeError se serve il browser."""
+    listing_url = find_listing_url()
+    if not listing_url: raise RuntimeError("URL dell'elenco (iframe) non individuato")
+    logging.info(f"--- Inizio Paginazione & Estrazione (requests): {listing_url} ---")
+    stop_at_known = _stop_at_known_pages(incremental)
+    all_items_found = []; processed_detail_urls = set(); visited_urls = set(); url = listing_url; page_count = 1; interrupted = False
+    while url and (not max_pages or page_count <= max_pages):
+        if url in visited_urls: logging.warning(f"Pagina già visitata ({url}): interrompo la paginazione."); url = None; break
+        visited_urls.add(url); logging.info(f"--- Processo Pagina {page_count} (requests) ---")
+        try: html_content = _get_html(url)
+        except requests.exceptions.RequestException as e:
+            if page_count == 1: raise
+            # Errore a metà elenco: tengo gli atti già raccolti, ma la paginazione non conta come completa
+            logging.error(f"Errore lettura pagina {page_count} dell'elenco ({e}): interrompo la paginazione con {len(all_items_found)} atti raccolti."); interrupted = True; break
+        if LISTING_TABLE_CLASS not in html_content:
+            if page_count == 1: raise RuntimeError(f"Tabella '{LISTING_TABLE_CLASS}' assente nella risposta (pagina generata da JavaScript?)")
+            logging.warning(f"Tabella assente a pagina {page_count}: fine paginazione."); url = None; break
+        newly_added_count = 0; page_rows = []; items_on_page = extract_data_from_html(html_content, page_rows)
+        if _page_is_known(page_rows, stop_at_known, page_count): return all_items_found
+        for item in items_on_page:
+            if item['detail_url'] not in processed_detail_urls: processed_detail_urls.add(item['detail_url']); all_items_found.append(item); newly_added_count += 1
+        logging.info(f"Aggiunti {newly_added_count} nuovi atti da pagina {page_count}. Totale: {len(all_items_found)}")
+        next_url, has_next = find_next_page_url(html_content, url)
+        if has_next and not next_url: raise RuntimeError(f"Link '{NEXT_PAGE_TEXT}' non seguibile senza JavaScript a pagina {page_count}")
+        url = next_url; page_count += 1
+    if interrupted: logging.warning("Elenco incompleto per errore di rete: le pagine mancanti saranno rilette alla prossima esecuzione.")
+    elif url: logging.warning(f"Raggiunto limite pagine {max_pages}: l'elenco potrebbe essere incompleto.")
+    else: crawl_state.mark_complete()
+    return all_items_found
+def collect_items_selenium(max_pages=SCRAPER_MAX_PAGES, incremental=SCRAPER_INCREMENTAL):
+    """Percorso con Firefox (Selenium): clic sul menu, passaggio all'iframe e paginazione con 'Avanti'."""
+    # Import locali: Selenium e geckodriver servono solo in questo ripiego
+    from selenium import webdriver
+    from selenium.webdriver.firefox.service import Service as FirefoxService
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException, ElementClickInterceptedException
+    from webdriver_manager.firefox import GeckoDriverManager
+    all_items_found = []; processed_detail_urls = set(); stop_at_known = _stop_at_known_pages(incremental)
     driver = None
     try:
         logging.info("Inizializzazione WebDriver Firefox..."); service = FirefoxService(GeckoDriverManager().install())
@@ -150,14 +374,15 @@ def run_scraper_main():
         logging.info("Assumendo vista iframe corretta, estraggo direttamente...")
 
         # 6. Estrazione/Paginazione DENTRO l'iframe
-        logging.info("--- Inizio Paginazione & Estrazione (Iframe) ---"); page_count = 1; max_pages_selenium = 5 # Messo limite basso per testare paginazione se serve
-        while page_count <= max_pages_selenium:
+        logging.info("--- Inizio Paginazione & Estrazione (Iframe) ---"); page_count = 1
+        while not max_pages or page_count <= max_pages:
              logging.info(f"--- Processo Pagina Selenium {page_count} (Iframe) ---")
              try:
                  # Attendi la tabella
                  table_locator_css = "table.master-detail-list-table"; table_row_locator_css = f"{table_locator_css} tr.master-detail-list-line"
                  wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, table_locator_css))); logging.debug(f"Tabella visibile (Pag {page_count})")
-                 current_html = driver.page_source; items_on_page = extract_data_from_html(current_html)                
+                 current_html = driver.page_source; page_rows = []; items_on_page = extract_data_from_html(current_html, page_rows)
+                 if _page_is_known(page_rows, stop_at_known, page_count): break
 
                  # Aggiungi elementi trovati
                  newly_added_count = 0
@@ -168,7 +393,7 @@ def run_scraper_main():
 
                  # Paginazione (se necessaria)
                  try:
-                     next_button_locator = (By.LINK_TEXT, "Avanti"); next_button = driver.find_element(*next_button_locator)
+                     next_button_locator = (By.LINK_TEXT, NEXT_PAGE_TEXT); next_button = driver.find_element(*next_button_locator)
                      parent_li = next_button.find_element(By.XPATH, "./.."); is_disabled = 'disabled' in parent_li.get_attribute('class')
                      if not is_disabled:
                          logging.info("Bottone 'Avanti' (iframe) attivo. Click..."); old_table_row = None
@@ -181,32 +406,67 @@ def run_scraper_main():
                              except TimeoutException: logging.warning("Timeout attesa aggiornamento iframe."); break
                          else: time.sleep(3)
                          page_count += 1
-                     else: logging.info("Bottone 'Avanti' (iframe) disabilitato."); break
-                 except NoSuchElementException: logging.info("Bottone 'Avanti' (iframe) non trovato."); break # Fine paginazione
+                     else: logging.info("Bottone 'Avanti' (iframe) disabilitato."); crawl_state.mark_complete(); break
+                 except NoSuchElementException: logging.info("Bottone 'Avanti' (iframe) non trovato."); crawl_state.mark_complete(); break # Fine paginazione
 
              except TimeoutException: logging.error("Timeout attesa elementi iframe."); break
              except Exception as e: logging.error(f"Errore loop iframe: {e}"); break
-        if page_count > max_pages_selenium: logging.warning(f"Raggiunto limite pagine Selenium {max_pages_selenium}.")
+        if max_pages and page_count > max_pages: logging.warning(f"Raggiunto limite pagine Selenium {max_pages}: l'elenco potrebbe essere incompleto.")
 
     finally:
         if driver: logging.info("Chiusura WebDriver Firefox..."); driver.quit()
     logging.info(f"--- Fine Fase Selenium: Trovati {len(all_items_found)} atti totali rilevanti. ---")
+    return all_items_found
+def _with_pending_items(items):
+    """Aggiunge gli atti rilevanti rimasti da scaricare nelle esecuzioni precedenti (su pagine che la paginazione incrementale non rivisita)."""
+    known_detail_urls = {item['detail_url'] for item in items}
+    pending = [item for item in crawl_state.pending_items() if item['detail_url'] not in known_detail_urls]
+    if pending: logging.info(f"Riprendo {len(pending)} atti non scaricati nelle esecuzioni precedenti.")
+    return items + pending
+def collect_listing_items(listing_mode="auto", incremental=SCRAPER_INCREMENTAL):
+    """Elenco degli atti rilevanti: 'requests' (senza browser), 'selenium', oppure 'auto' (requests con ripiego su Selenium)."""
+    if listing_mode in ("auto", "requests"):
+        try:
+            items = collect_items_requests(incremental=incremental)
+            logging.info(f"--- Fine Fase Elenco (requests): Trovati {len(items)} atti totali rilevanti. ---")
+            return _with_pending_items(items) if incremental else items
+        except (requests.exceptions.RequestException, RuntimeError) as e:
+            if listing_mode == "requests": logging.error(f"Elenco via requests non riuscito: {e}"); return _with_pending_items([]) if incremental else []
+            logging.warning(f"Elenco via requests non riuscito ({e}): ripiego su Selenium.")
+    items = collect_items_selenium(incremental=incremental)
+    return _with_pending_items(items) if incremental else items
 
-    # --- Download e Riepilogo ---
+
+# --- FIXTURE HTTP: registrazione e riproduzione offline ---
+def use_http_fixtures(mode, directory, latency=0.0):
+    """
+    'record': salva nella cartella ogni risposta ricevuta (pagine elenco, dettaglio, allegati).
+    'replay': risponde dalla cartella senza rete (304/206 emulati, `latency` secondi per richiesta).
+    """
+    return mount_fixtures(session, mode, directory, latency=latency)
+
+
+# --- CICLO PRINCIPALE ---
+def download_items(all_items_found, workers=SCRAPER_WORKERS, incremental=SCRAPER_INCREMENTAL):
+    """Fase download: dettaglio, HEAD e download di ogni atto. Ritorna (riepilogo file scaricati, link allegato trovati)."""
+    excel_links_found = []; downloaded_files_summary = []
     logging.info(f"--- FASE DOWNLOAD: Scarico allegati ({', '.join(ALLOWED_EXTENSIONS)}) ---")
-    processed_urls=set()
-    if not all_items_found: logging.warning("Nessun atto da processare.")
-    else:
-        for i, item_info in enumerate(all_items_found):
-            logging.info(f"[{i+1}/{len(all_items_found)}] Processo Download: '{item_info['object'][:80]}...'")
-            excel_url = find_excel_link_in_detail(item_info['detail_url'])
-            if excel_url:
-                if excel_url not in excel_links_found: excel_links_found.append(excel_url)
-                processed_urls.add(excel_url)
-                item_id_for_download = item_info['data_id'] if item_info['data_id'] != item_info['detail_url'] else item_info['detail_url'].split('/')[-1]
-                time.sleep(0.5 + (i % 10 * 0.05))
-                downloaded_path = download_file(excel_url, item_info['object'], item_id_for_download)
-                if downloaded_path: downloaded_files_summary.append({'object': item_info['object'], 'source_url': item_info['detail_url'], 'excel_url': excel_url, 'local_path': downloaded_path, 'data_id': item_info['data_id'] })
+    if not all_items_found: logging.warning("Nessun atto da processare."); return downloaded_files_summary, excel_links_found
+    # Dettaglio, HEAD e download in pipeline su più thread; i risultati restano nell'ordine degli atti
+    logging.info(f"Download concorrente: {workers} worker, max {SCRAPER_MAX_PER_HOST} richieste per host, intervallo {SCRAPER_MIN_INTERVAL}s.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scraper") as executor:
+        results = executor.map(process_item_download, range(1, len(all_items_found) + 1), [len(all_items_found)] * len(all_items_found), all_items_found, [incremental] * len(all_items_found))
+        for excel_url, file_summary in results:
+            if not excel_url: continue
+            if excel_url not in excel_links_found: excel_links_found.append(excel_url)
+            if file_summary: downloaded_files_summary.append(file_summary)
+    return downloaded_files_summary, excel_links_found
+def run_scraper_main(listing_mode="auto", incremental=SCRAPER_INCREMENTAL):
+    all_items_found = collect_listing_items(listing_mode, incremental)
+    processed_detail_urls = {item['detail_url'] for item in all_items_found}
+
+    # --- Download e Riepilogo ---
+    downloaded_files_summary, excel_links_found = download_items(all_items_found, incremental=incremental)
 
     logging.info("--- FASE RIEPILOGO ---")
     logging.info(f"Scraping completato. File consentiti scaricati: {len(downloaded_files_summary)}. Link allegato trovati: {len(excel_links_found)}.")
@@ -225,7 +485,16 @@ def run_scraper_main():
 
 # --- Esecuzione ---
 if __name__ == "__main__":
-    start_time_script = time.time(); downloaded_summary, links_found = run_scraper_main(); end_time_script = time.time()
+    parser = argparse.ArgumentParser(description="Scarica gli allegati dei pagamenti dalla sezione Trasparenza.")
+    parser.add_argument("--listing", choices=["auto", "requests", "selenium"], default="auto", help="Come leggere l'elenco degli atti: requests sull'iframe (auto ripiega su Selenium se non basta).")
+    parser.add_argument("--full", action="store_true", help="Ignora lo stato incrementale: scorre tutto l'elenco e riverifica ogni allegato (GET condizionali).")
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument("--record", metavar="DIR", help="Salva tutte le risposte HTTP nella cartella indicata (fixture per --replay e benchmark). Allegati e stato in DIR/record_state.")
+    fixtures.add_argument("--replay", metavar="DIR", help="Esegue offline rispondendo dalle fixture registrate (l'elenco viene letto con requests). Allegati e stato in DIR/replay_state.")
+    args = parser.parse_args()
+    if args.record: use_http_fixtures("record", args.record)
+    if args.replay: use_http_fixtures("replay", args.replay); args.listing = "requests"
+    start_time_script = time.time(); downloaded_summary, links_found = run_scraper_main(args.listing, incremental=SCRAPER_INCREMENTAL and not args.full); end_time_script = time.time()
     print("\n" + "="*40); print("--- RIEPILOGO SCRAPING COMPLETATO ---"); print("="*40)
     # Usa la costante DOWNLOAD_DIR definita correttamente
     if downloaded_summary: print(f"Sono stati scaricati {len(downloaded_summary)} file ({', '.join(ALLOWED_EXTENSIONS)}) nella cartella '{DOWNLOAD_DIR}':");
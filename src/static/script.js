@@ -216,6 +216,22 @@ document.addEventListener('DOMContentLoaded', () => {
             chatWindow.removeChild(messageElement);
         }
     }
+
+    // Messaggio bot aggiornato man mano che arrivano gli eventi 'token' (streaming LLM)
+    function startStreamingMessage() {
+        const messageDiv = document.createElement('div');
+        messageDiv.classList.add('message', 'bot-message');
+        const paragraph = document.createElement('p');
+        messageDiv.appendChild(paragraph);
+        chatWindow.appendChild(messageDiv);
+        return { element: messageDiv, paragraph: paragraph, text: '' };
+    }
+    function appendStreamingText(streamingMessage, delta) {
+        if (!delta) return;
+        streamingMessage.text += delta;
+        streamingMessage.paragraph.innerHTML = stripMarkdown(streamingMessage.text).replace(/\n/g, '<br>');
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+    }
     
 
 
@@ -233,6 +249,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const loadingMessageElement = addStatusMessage("Inizio elaborazione...");
         let resultReceived = false; // Flag per tracciare se abbiamo ricevuto l'evento 'result'
+        let streamingMessage = null; // Messaggio bot in costruzione dagli eventi 'token'
 
         try {
             const response = await fetch('/ask', {
@@ -306,9 +323,18 @@ document.addEventListener('DOMContentLoaded', () => {
 
                              if (eventType === 'status') {
                                  updateStatusMessage(eventData.status, loadingMessageElement);
+                             } else if (eventType === 'token') {
+                                 // Primo frammento: il messaggio di caricamento lascia il posto alla risposta in arrivo
+                                 if (!streamingMessage) {
+                                     removeMessage(loadingMessageElement);
+                                     streamingMessage = startStreamingMessage();
+                                 }
+                                 appendStreamingText(streamingMessage, eventData.delta);
                              } else if (eventType === 'result') {
                                  resultReceived = true; // Imposta il flag!
                                  removeMessage(loadingMessageElement); // Rimuovi il messaggio di caricamento
+                                 // Il risultato finale (con riferimenti/tabella) sostituisce il testo parziale
+                                 if (streamingMessage) removeMessage(streamingMessage.element);
 
                                  if (eventData.success) {
                                      addMessage(eventData.answer, 'bot', eventData.references, eventData.table_data);
@@ -0,0 +1,129 @@
+# src/tools/amount_parser.py
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Numero normalizzato (punto decimale, esponente opzionale), come accettato da float()
+NUMBER_PATTERN = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+# Importo all'italiana "pulito" ('1.234,56', '1234,5', '12.500'): il caso comune, convertito senza altri controlli
+ITALIAN_PATTERN = r'[+-]?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?'
+# Simbolo dell'euro, sigla EUR e spazi (anche non separabili) ovunque nel testo
+NOISE_PATTERN = '[\\s\u00a0\u202f€]|EUR|Eur|eur'
+# Valori "vuoti" (cella vuota o trattino): NaN ma non contati come scartati
+BLANK_TOKENS = ['', '-', '–', '—']
+# Virgola seguita da un altro separatore: le virgole raggruppano le migliaia ('1,234.56', '1,234,567')
+COMMA_GROUPING_PATTERN = r',.*[.,]'
+# Solo punti a gruppi di tre cifre: migliaia all'italiana ('1.234', '12.345.678')
+DOT_THOUSANDS_PATTERN = r'[+-]?\d{1,3}(?:\.\d{3})+'
+
+
+def _fullmatch(text, pattern: str):
+    import pyarrow.compute as pc
+    return pc.match_substring_regex(text, f'^(?:{pattern})$')
+
+
+def _italian_to_plain(text):
+    """'1.234,56' -> '1234.56' (toglie i punti delle migliaia, virgola decimale -> punto)."""
+    import pyarrow.compute as pc
+    return pc.replace_substring(pc.replace_substring(text, '.', ''), ',', '.')
+
+
+def _to_float(text, valid) -> np.ndarray:
+    """Converte in float64 le stringhe valide (NaN per le altre). Il cast arrotonda come float()."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    return pc.cast(pc.if_else(valid, text, None), pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def _parse_general(text, dot_thousands: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Percorso completo per i testi fuori dal formato comune: €, spazi, trattini, punto decimale, virgole delle migliaia."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    cleaned = pc.replace_substring_regex(text, NOISE_PATTERN, '')
+    blank = pc.is_in(cleaned, value_set=pa.array(BLANK_TOKENS))
+
+    has_comma = pc.match_substring(cleaned, ',')
+    grouped = pc.and_(has_comma, pc.match_substring_regex(cleaned, COMMA_GROUPING_PATTERN))
+    normalized = pc.if_else(pc.and_not(has_comma, grouped), _italian_to_plain(cleaned), cleaned)
+    normalized = pc.if_else(grouped, pc.replace_substring(cleaned, ',', ''), normalized)
+    if dot_thousands:
+        normalized = pc.if_else(_fullmatch(cleaned, DOT_THOUSANDS_PATTERN), pc.replace_substring(cleaned, '.', ''), normalized)
+
+    valid = pc.and_not(_fullmatch(normalized, NUMBER_PATTERN), blank)
+    rejected = pc.and_not(pc.invert(valid), blank)
+    return _to_float(normalized, valid), rejected.to_numpy(zero_copy_only=False)
+
+
+def _parse_text(text, dot_thousands: bool) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Converte un array Arrow di stringhe. I valori nel formato comune (all'italiana per i file
+    sorgente, col punto decimale per il testo normalizzato) passano per il percorso veloce,
+    gli altri per _parse_general.
+    """
+    import pyarrow.compute as pc
+    amounts = np.full(len(text), np.nan)
+    rejected = np.zeros(len(text), dtype=bool)
+
+    fast = _fullmatch(text, ITALIAN_PATTERN if dot_thousands else NUMBER_PATTERN)
+    fast_positions = np.flatnonzero(fast.to_numpy(zero_copy_only=False))
+    if len(fast_positions):
+        fast_text = text.take(fast_positions)
+        if dot_thousands:
+            fast_text = _italian_to_plain(fast_text)
+        amounts[fast_positions] = pc.cast(fast_text, 'float64').to_numpy(zero_copy_only=False)
+
+    other_positions = np.flatnonzero(~fast.to_numpy(zero_copy_only=False))
+    if len(other_positions):
+        amounts[other_positions], rejected[other_positions] = _parse_general(text.take(other_positions), dot_thousands)
+    return amounts, rejected
+
+
+def parse_amounts(values, dot_thousands: bool = True):
+    """
+    Converte in blocco una colonna di importi (pd.Series o array NumPy) in float64.
+
+    Gestisce numeri già tipizzati, testo all'italiana ('1.234,56 €'), testo con il punto
+    decimale ('1234.56'), separatori delle migliaia, simbolo € / EUR e spazi.
+    La virgola è il separatore decimale salvo quando è seguita da un altro separatore.
+    Con dot_thousands=True (file sorgente) un testo con soli punti a gruppi di tre cifre
+    ('1.234') è un intero con le migliaia; con False (testo già normalizzato, es. il CSV
+    processato) il punto è sempre decimale.
+
+    Ritorna (importi, scartati): importi è float64 con NaN per i valori vuoti ('', '-', NaN)
+    e per quelli non interpretabili; scartati è la maschera booleana di questi ultimi.
+    Con un array in ingresso restituisce due array NumPy.
+    """
+    import pyarrow as pa
+
+    if isinstance(values, np.ndarray):
+        amounts, rejected = parse_amounts(pd.Series(values, dtype=object), dot_thousands)
+        return amounts.to_numpy(), rejected.to_numpy()
+
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype('float64'), pd.Series(False, index=values.index)
+
+    # Lavora per posizione (l'indice in ingresso può avere duplicati) e reindicizza solo alla fine
+    amounts = np.full(len(values), np.nan)
+    rejected = np.zeros(len(values), dtype=bool)
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        is_text = values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    else:
+        is_text = values.notna().to_numpy(dtype=bool)
+
+    # Numeri già tipizzati dentro colonne miste (celle numeriche del foglio di calcolo)
+    others = np.flatnonzero(~is_text & values.notna().to_numpy(dtype=bool))
+    if len(others):
+        numbers = pd.to_numeric(values.iloc[others].reset_index(drop=True), errors='coerce').astype('float64').to_numpy()
+        amounts[others] = numbers
+        rejected[others] = np.isnan(numbers)
+
+    text_positions = np.flatnonzero(is_text)
+    if len(text_positions):
+        text = pa.array(values.iloc[text_positions], from_pandas=True).cast(pa.string())
+        amounts[text_positions], rejected[text_positions] = _parse_text(text, dot_thousands)
+    return pd.Series(amounts, index=values.index), pd.Series(rejected, index=values.index)
@@ -0,0 +1,249 @@
+# src/tools/answer_cache.py
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from cachetools import LRUCache
+from dotenv import load_dotenv
+
+try:
+    from .chroma_pool import index_stamp
+    from .db_schema import read_data_version
+    from .sqlite_pool import get_pool
+except ImportError:
+    from chroma_pool import index_stamp
+    from db_schema import read_data_version
+    from sqlite_pool import get_pool
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+DB_PATH = PROJECT_ROOT / os.environ.get("DATABASE_FILE", "data/database/busto_pagamenti.db")
+ANSWER_CACHE_FILE = os.environ.get("ANSWER_CACHE_FILE", "data/cache/answer_cache.db")
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 128)) # Dimensione del livello in memoria
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Ogni quanti secondi (al massimo) ricalcolare la versione dei dati da disco
+DATASET_VERSION_CHECK_SECONDS = float(os.environ.get("DATASET_VERSION_CHECK_SECONDS", 5))
+
+
+def _file_signature(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _sqlite_data_version(db_path: Path):
+    """
+    VersioneDati scritta da load_to_sqlite.py e run_enrichment.py nella tabella metadati: non cambia con
+    un semplice checkpoint del WAL. Per i database che non la hanno, la firma del solo file principale.
+    """
+    if not db_path.is_file():
+        return None
+    try:
+        with get_pool(db_path).connection() as conn:
+            version = read_data_version(conn)
+    except sqlite3.Error as e:
+        logger.debug(f"Versione dati non leggibile da {db_path}: {e}")
+        version = None
+    return version if version is not None else _file_signature(db_path)
+
+
+def compute_dataset_version(db_path: Path = DB_PATH) -> str:
+    """
+    Firma dei dati serviti dall'app: versione dei dati del database SQLite e indice ChromaDB.
+    Cambia quando load_to_sqlite.py, run_enrichment.py o l'indicizzatore aggiornano i dati.
+    """
+    parts = (
+        _sqlite_data_version(Path(db_path)),
+        index_stamp(),
+    )
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_query(query: str) -> str:
+    """Normalizzazione della domanda per la chiave: minuscole e spazi compattati."""
+    return re.sub(r'\s+', ' ', str(query)).strip().lower()
+
+
+class AnswerCache:
+    """
+    Cache delle risposte di /ask su due livelli:
+    - in memoria (LRU, per processo) per le domande ripetute più di frequente;
+    - su SQLite, condivisa tra i worker e persistente tra i riavvii.
+
+    Ogni voce ha una scadenza (TTL). La chiave include la versione dei dati, quindi dopo
+    un ricaricamento del database o dell'indice le risposte precedenti non vengono più servite
+    (e vengono eliminate alla prima occasione).
+    """
+
+    def __init__(self, db_path: Path | str, memory_size: int = QUERY_CACHE_SIZE,
+                 default_ttl: float = ANSWER_CACHE_TTL_SECONDS):
+        self.db_path = Path(db_path)
+        self.default_ttl = default_ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._memory = LRUCache(maxsize=memory_size) # chiave -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._version = None
+        self._version_checked_at = 0.0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = self._connection_locked()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    dataset_version TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_expires_at ON answers (expires_at)")
+            conn.commit()
+        logger.info(f"Cache risposte aperta: {self.db_path} (memoria {memory_size} voci, TTL {default_ttl:.0f}s).")
+
+    def _connection_locked(self) -> sqlite3.Connection:
+        """Connessione SQLite del processo corrente (riaperta dopo un fork, es. worker gunicorn)."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def dataset_version(self) -> str:
+        """Versione corrente dei dati (ricalcolata al massimo ogni DATASET_VERSION_CHECK_SECONDS)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._version is not None and now - self._version_checked_at < DATASET_VERSION_CHECK_SECONDS:
+                return self._version
+            self._version_checked_at = now
+            version = compute_dataset_version()
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Versione dati cambiata ({self._version} -> {version}): invalido la cache risposte.")
+                self._version = version
+                self._memory.clear()
+                self._purge_locked()
+            return self._version
+
+    def make_key(self, query: str) -> str:
+        """Chiave per una domanda, legata alla versione dei dati al momento della richiesta ("versione:hash")."""
+        version = self.dataset_version()
+        payload = f"{version}\x1f{normalize_query(query)}"
+        return f"{version}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> dict | None:
+        """Risposta in cache per la chiave (prima memoria, poi disco) o None se assente/scaduta."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory_hits += 1
+                    return entry[1]
+                self._memory.pop(key, None)
+            try:
+                row = self._connection_locked().execute(
+                    "SELECT payload, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Errore lettura cache risposte su disco: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            payload = json.loads(row[0])
+            self._memory[key] = (row[1], payload) # Promuove la voce nel livello in memoria
+            self.disk_hits += 1
+            return payload
+
+    def put(self, key: str, payload: dict, query: str = "", ttl: float | None = None):
+        """
+        Salva una risposta su entrambi i livelli con scadenza `ttl` secondi (default da .env), etichettata
+        con la versione dei dati contenuta nella chiave. Non salva le risposte calcolate su una versione
+        già superata (non sarebbero mai più lette).
+        """
+        now = time.time()
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        key_version = key.split(":", 1)[0]
+        with self._lock:
+            if key_version != self._version:
+                logger.info(f"Risposta calcolata sulla versione dati {key_version}, ora {self._version}: non salvata in cache.")
+                return
+            self._memory[key] = (expires_at, payload)
+            try:
+                conn = self._connection_locked()
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, dataset_version, query, payload, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, key_version, normalize_query(query), json.dumps(payload), now, expires_at))
+                conn.commit()
+                self.stores += 1
+            except sqlite3.Error as e:
+                logger.warning(f"Errore scrittura cache risposte su disco: {e}")
+
+    def _purge_locked(self):
+        """Elimina dal disco le voci scadute o di versioni dati precedenti. Da chiamare con il lock acquisito."""
+        try:
+            conn = self._connection_locked()
+            deleted = conn.execute("DELETE FROM answers WHERE expires_at <= ? OR dataset_version != ?",
+                                   (time.time(), self._version or "")).rowcount
+            conn.commit()
+            if deleted:
+                logger.info(f"Cache risposte: eliminate {deleted} voci scadute o obsolete.")
+        except sqlite3.Error as e:
+            logger.warning(f"Errore pulizia cache risposte: {e}")
+
+    def stats(self) -> dict:
+        """Contatori di utilizzo della cache per questo processo (hit per livello e hit rate)."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            try:
+                disk_entries = self._connection_locked().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            except sqlite3.Error:
+                disk_entries = None
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "stores": self.stores,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "dataset_version": self._version,
+            }
+
+
+_default_cache = None
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache | None:
+    """Restituisce la cache risposte configurata da .env (None se disabilitata o non apribile)."""
+    global _default_cache, _default_cache_failed
+    if not ANSWER_CACHE_ENABLED or _default_cache_failed: return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = AnswerCache(PROJECT_ROOT / ANSWER_CACHE_FILE)
+            except Exception as e:
+                logger.error(f"Impossibile aprire la cache risposte ({ANSWER_CACHE_FILE}): {e}. Proseguo senza cache.", exc_info=True)
+                _default_cache_failed = True
+                return None
+        return _default_cache
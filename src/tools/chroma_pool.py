@@ -0,0 +1,162 @@
+# src/tools/chroma_pool.py
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import chromadb
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+CHROMA_DB_PATH = os.environ.get("CHROMA_DB_PATH", "data/database/chroma_db_pagamenti")
+CHROMA_COLLECTION_NAME = os.environ.get("CHROMA_COLLECTION_NAME", "pagamenti_busto")
+# Ogni quanti secondi (al massimo) ricontrollare se l'indice su disco è cambiato
+CHROMA_RELOAD_CHECK_SECONDS = float(os.environ.get("CHROMA_RELOAD_CHECK_SECONDS", 5))
+# Dopo un ricaricamento, per quanto tenere attivo il System precedente (query ancora in corso sui vecchi handle)
+CHROMA_RETIRE_GRACE_SECONDS = float(os.environ.get("CHROMA_RETIRE_GRACE_SECONDS", 120))
+# File scritto dall'indicizzatore a fine esecuzione: la sua presenza/contenuto è la "versione" dell'indice
+INDEX_MARKER_FILE = "index_version.txt"
+
+chroma_db_full_path = PROJECT_ROOT / CHROMA_DB_PATH
+
+# --- Stato condiviso del pool (protetto da _lock) ---
+# Un client per directory e una collezione per (directory, nome), riusati da tutti i thread.
+_lock = threading.Lock()
+_clients = {}      # path -> chromadb.PersistentClient
+_collections = {}  # (path, nome) -> Collection
+_stamps = {}       # path -> firma della directory al momento dell'apertura
+_last_check = {}   # path -> time.monotonic() dell'ultimo controllo firma
+_retired = []      # (time.monotonic() del ritiro, System) dei client sostituiti, fermati dopo il periodo di grazia
+
+
+def index_stamp(path: Path | str = chroma_db_full_path) -> tuple | None:
+    """
+    Firma della directory ChromaDB: inode della directory e contenuto del marcatore scritto
+    dall'indicizzatore a fine esecuzione (write_index_marker). Non cambia mentre l'indicizzatore
+    sta ancora scrivendo, solo quando ha finito (o se la directory viene ricreata).
+    None se la directory non esiste.
+    """
+    path = Path(path)
+    try:
+        dir_stat = path.stat()
+        marker = (path / INDEX_MARKER_FILE).read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        if not path.exists():
+            return None
+        marker = None # Indice creato prima del marcatore: resta valido finché non viene riscritto
+    return (dir_stat.st_ino, marker)
+
+
+def write_index_marker(collection, path: Path | str = chroma_db_full_path):
+    """Segna la fine di un'indicizzazione (scrittura atomica): i processi che servono l'indice lo ricaricano."""
+    path = Path(path)
+    marker = path / INDEX_MARKER_FILE
+    tmp = marker.with_name(marker.name + ".tmp")
+    tmp.write_text(f"{time.time_ns()} {collection.id} {collection.count()}\n", encoding='utf-8')
+    os.replace(tmp, marker)
+
+
+def _stop_retired_locked(force: bool = False):
+    """Ferma i System ritirati da più di CHROMA_RETIRE_GRACE_SECONDS (tutti con force). Con _lock acquisito."""
+    now = time.monotonic()
+    keep = []
+    for retired_at, system in _retired:
+        if force or now - retired_at >= CHROMA_RETIRE_GRACE_SECONDS:
+            try:
+                system.stop()
+            except Exception as e:
+                logger.debug(f"Arresto del System ChromaDB ritirato non riuscito: {e}")
+        else:
+            keep.append((retired_at, system))
+    _retired[:] = keep
+
+
+def _drop_path_locked(key: str):
+    """
+    Rilascia client e collezioni per una directory. Da chiamare con _lock acquisito.
+
+    Chroma tiene in cache un "System" per path a livello di classe: senza toglierlo un nuovo client
+    riuserebbe i segmenti già caricati. Lo si stacca solo per questo path, senza fermarlo
+    (clear_system_cache li fermerebbe tutti, anche sotto le query in corso sui vecchi handle):
+    viene fermato da _stop_retired_locked trascorso il periodo di grazia.
+    """
+    client = _clients.pop(key, None)
+    for coll_key in [k for k in _collections if k[0] == key]:
+        _collections.pop(coll_key, None)
+    _stamps.pop(key, None)
+    _last_check.pop(key, None)
+    if client is not None:
+        systems = getattr(client, "_identifer_to_system", None) # Attributo di classe di SharedSystemClient
+        system = systems.pop(getattr(client, "_identifier", None), None) if isinstance(systems, dict) else None
+        if system is not None:
+            _retired.append((time.monotonic(), system))
+        else:
+            logger.warning(f"System ChromaDB per {key} non staccabile da questa versione di chromadb: il nuovo client potrebbe riusare i segmenti già caricati.")
+
+
+def _is_stale_locked(key: str, path: Path) -> bool:
+    """Verifica (con throttling) se l'indice su disco è cambiato dall'apertura."""
+    now = time.monotonic()
+    if now - _last_check.get(key, 0.0) < CHROMA_RELOAD_CHECK_SECONDS:
+        return False
+    _last_check[key] = now
+    return index_stamp(path) != _stamps.get(key)
+
+
+def get_collection(name: str = CHROMA_COLLECTION_NAME, path: Path | str = chroma_db_full_path):
+    """
+    Restituisce un handle condiviso alla collezione ChromaDB, aprendo il client una sola volta.
+    Se la directory dell'indice è cambiata su disco (re-indicizzazione), client e collezione
+    vengono riaperti. Solleva le stesse eccezioni di `client.get_collection` (es. collezione mancante).
+    """
+    path = Path(path)
+    key = str(path.resolve())
+    with _lock:
+        if _retired: _stop_retired_locked()
+        if key in _clients and _is_stale_locked(key, path):
+            logger.info(f"Indice ChromaDB modificato su disco ({key}). Ricarico client e collezioni.")
+            _drop_path_locked(key)
+
+        collection = _collections.get((key, name))
+        if collection is not None:
+            return collection
+
+        client = _clients.get(key)
+        if client is None:
+            logger.info(f"Apertura client ChromaDB persistente condiviso: {key}")
+            client = chromadb.PersistentClient(path=key)
+            _clients[key] = client
+            _stamps[key] = index_stamp(path)
+            _last_check[key] = time.monotonic()
+
+        collection = client.get_collection(name=name)
+        _collections[(key, name)] = collection
+        logger.info(f"Collezione ChromaDB '{name}' pronta nel pool ({collection.count()} elementi).")
+        return collection
+
+
+def warm_up(name: str = CHROMA_COLLECTION_NAME, path: Path | str = chroma_db_full_path) -> bool:
+    """Apre in anticipo client e collezione (es. all'avvio dell'app). Ritorna True se pronta."""
+    if not Path(path).exists():
+        logger.warning(f"Warm-up ChromaDB saltato: directory {path} non trovata.")
+        return False
+    try:
+        get_collection(name=name, path=path)
+        return True
+    except Exception as e:
+        logger.warning(f"Warm-up ChromaDB fallito per '{name}': {e}")
+        return False
+
+
+def reset_pool():
+    """Chiude tutti gli handle del pool (la prossima richiesta riaprirà client e collezioni)."""
+    with _lock:
+        for key in list(_clients):
+            _drop_path_locked(key)
+        _stop_retired_locked(force=True)
@@ -0,0 +1,150 @@
+# src/tools/crawl_state.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+CRAWL_STATE_FILE = os.environ.get("CRAWL_STATE_FILE", "data/cache/crawl_state.db")
+
+
+class CrawlState:
+    """
+    Stato persistente della paginazione dell'elenco atti, su SQLite, tra un'esecuzione e l'altra.
+
+    Ogni riga dell'elenco vista è registrata per data-id con la data di pubblicazione. Una riga
+    è "nota" (done=1) se non riguarda i pagamenti, se il suo allegato è stato scaricato oppure se
+    la pagina di dettaglio è stata letta ma non contiene allegati:
+    gli atti rilevanti ancora da scaricare restano done=0 e vengono ripresi al giro successivo.
+    La chiave 'complete' indica che almeno una paginazione è arrivata all'ultima pagina: solo
+    allora ci si può fermare alla prima pagina fatta di soli atti noti.
+    Thread-safe (una connessione condivisa con lock).
+    """
+
+    def __init__(self, db_path: Path | str):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS acts (
+                data_id TEXT PRIMARY KEY,
+                object TEXT,
+                detail_url TEXT,
+                published TEXT,
+                excel_url TEXT,
+                done INTEGER NOT NULL DEFAULT 0,
+                seen_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        logger.info(f"Stato paginazione aperto: {self.db_path}")
+
+    def _get_value(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_value(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def is_complete(self) -> bool:
+        """True se una paginazione precedente ha raggiunto l'ultima pagina dell'elenco."""
+        return self._get_value('complete') == '1'
+
+    def mark_complete(self):
+        self._set_value('complete', '1')
+
+    def last_published(self) -> str | None:
+        """Data di pubblicazione (ISO) più recente tra gli atti noti: la "filigrana" dell'elenco."""
+        return self._get_value('last_published')
+
+    def all_known(self, rows: list[dict]) -> bool:
+        """
+        True se tutte le righe della pagina sono note. Le righe senza data-id contano come note
+        solo se pubblicate prima della filigrana.
+        """
+        if not rows:
+            return False
+        ids = [row['data_id'] for row in rows if row['data_id'] is not None]
+        watermark = self.last_published()
+        for row in rows:
+            if row['data_id'] is None and not (watermark and row['published'] and row['published'] < watermark):
+                return False
+        if not ids:
+            return True
+        with self._lock:
+            known = self._conn.execute(
+                f"SELECT COUNT(*) FROM acts WHERE done = 1 AND data_id IN ({','.join('?' * len(ids))})", ids).fetchone()[0]
+        return known == len(set(ids))
+
+    def record_rows(self, rows: list[dict]):
+        """
+        Registra le righe di una pagina dell'elenco (dict con data_id, object, detail_url, published,
+        relevant). Le righe non rilevanti diventano subito note; quelle già presenti non cambiano.
+        """
+        now = time.time()
+        values = [(row['data_id'], row['object'], row['detail_url'], row['published'], 0 if row['relevant'] else 1, now)
+                  for row in rows if row['data_id'] is not None]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO acts (data_id, object, detail_url, published, done, seen_at) VALUES (?, ?, ?, ?, ?, ?)", values)
+            self._update_watermark_locked()
+            self._conn.commit()
+
+    def _update_watermark_locked(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state (key, value) SELECT 'last_published', MAX(published) FROM acts "
+            "WHERE done = 1 HAVING MAX(published) IS NOT NULL")
+
+    def attachment(self, data_id: str) -> str | None:
+        """URL dell'allegato di un atto già scaricato (None se l'atto non è noto)."""
+        with self._lock:
+            row = self._conn.execute("SELECT excel_url FROM acts WHERE data_id = ? AND done = 1", (data_id,)).fetchone()
+        return row['excel_url'] if row else None
+
+    def done_without_attachment(self, data_id: str) -> bool:
+        """True se il dettaglio dell'atto è già stato letto e non conteneva allegati."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM acts WHERE data_id = ? AND done = 1 AND excel_url IS NULL AND detail_url IS NOT NULL", (data_id,)).fetchone()
+        return row is not None
+
+    def mark_done(self, data_id: str, excel_url: str | None):
+        """Registra l'allegato scaricato di un atto (None se il dettaglio non ne ha) e aggiorna la filigrana."""
+        with self._lock:
+            self._conn.execute("UPDATE acts SET excel_url = ?, done = 1 WHERE data_id = ?", (excel_url, data_id))
+            self._update_watermark_locked()
+            self._conn.commit()
+
+    def pending_items(self) -> list[dict]:
+        """Atti rilevanti visti in esecuzioni precedenti ma non ancora scaricati, nel formato dell'elenco."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data_id, object, detail_url FROM acts WHERE done = 0 AND detail_url IS NOT NULL ORDER BY seen_at").fetchall()
+        return [dict(row) for row in rows]
+
+
+_default_state = None
+_default_state_lock = threading.Lock()
+
+def get_crawl_state() -> CrawlState:
+    """Restituisce lo stato di paginazione condiviso configurato da .env."""
+    global _default_state
+    with _default_state_lock:
+        if _default_state is None:
+            _default_state = CrawlState(PROJECT_ROOT / CRAWL_STATE_FILE)
+        return _default_state
@@ -0,0 +1,235 @@
+# src/tools/db_schema.py
+import logging
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGAMENTI_TABLE = "pagamenti"
+BENEFICIARI_INFO_TABLE = "beneficiari_info"
+# Tabelle riepilogative materializzate al caricamento (lette dai tool SQL)
+SUMMARY_BENEFICIARIO_ANNO_TABLE = "riepilogo_beneficiario_anno"
+SUMMARY_ANNO_TABLE = "riepilogo_anno"
+# Chiave/valore scritti dai caricamenti: VersioneDati cambia solo quando cambiano i dati serviti
+METADATA_TABLE = "metadati"
+DATA_VERSION_KEY = "VersioneDati"
+SUMMARY_TOLERANCE = 0.01 # Differenza massima (euro) tollerata nel controllo di coerenza
+
+# Colonne della tabella pagamenti (ordine di inserimento) e chiave naturale usata dagli upsert.
+# RigaMandato distingue le righe con stessi NumeroMandato/Anno/NomeFileOrigine (0 nel caso comune);
+# HashRiga è la firma del contenuto, per aggiornare solo le righe cambiate.
+# NumeroMandato e Anno possono mancare (es. file sorgente senza colonna anno): le righe restano,
+# con NULL, e nella chiave valgono -1 (indice univoco su espressioni, i NULL non entrerebbero in conflitto).
+PAGAMENTI_COLUMNS = [
+    ("NumeroMandato", "INTEGER"),
+    ("Anno", "INTEGER"),
+    ("DataMandato", "TIMESTAMP"),
+    ("CIG", "TEXT"),
+    ("Beneficiario", "TEXT"),
+    ("ImportoEuro", "REAL"),
+    ("DescrizioneMandato", "TEXT"),
+    ("NomeFileOrigine", "TEXT NOT NULL"),
+    ("BeneficiarioNorm", "TEXT"),
+    ("RigaMandato", "INTEGER NOT NULL"),
+    ("HashRiga", "INTEGER NOT NULL"),
+]
+PAGAMENTI_KEY_COLUMNS = ["NumeroMandato", "Anno", "NomeFileOrigine", "RigaMandato"]
+PAGAMENTI_KEY_EXPRESSIONS = ["COALESCE(NumeroMandato, -1)", "COALESCE(Anno, -1)", "NomeFileOrigine", "RigaMandato"]
+PAGAMENTI_KEY_INDEX = "idx_pagamenti_chiave"
+
+# (nome, tabella, colonne). (Anno, BeneficiarioNorm, ImportoEuro) copre sia le somme/conteggi
+# per beneficiario e anno sia il GROUP BY dei fornitori principali senza leggere la tabella.
+INDEXES = [
+    ("idx_pagamenti_anno_beneficiario", PAGAMENTI_TABLE, "Anno, BeneficiarioNorm, ImportoEuro"),
+    ("idx_pagamenti_anno_importo", PAGAMENTI_TABLE, "Anno, ImportoEuro"),
+    ("idx_nome_normalizzato", BENEFICIARI_INFO_TABLE, "NomeNormalizzato"), # Stesso nome usato da run_enrichment.py
+]
+
+
+def normalize_beneficiary(name) -> str:
+    """Chiave di confronto del beneficiario: spazi compattati e maiuscolo (Unicode)."""
+    if name is None: return ""
+    return re.sub(r'\s+', ' ', str(name)).strip().upper()
+
+
+def beneficiary_norm_column(beneficiari: pd.Series) -> pd.Series:
+    """Versione colonnare di normalize_beneficiary (stesso risultato riga per riga)."""
+    return beneficiari.fillna('').astype(str).str.replace(r'\s+', ' ', regex=True).str.strip().str.upper()
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Limite superiore per la ricerca per prefisso con un range sull'indice (col >= p AND col < bound)."""
+    return prefix + '\U0010ffff'
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def enable_wal(conn: sqlite3.Connection):
+    """Journal WAL (persistente nel file): i lettori non vengono bloccati durante i caricamenti."""
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    conn.execute("PRAGMA synchronous = NORMAL") # Sicuro in WAL, evita un fsync per ogni commit
+    if str(mode).lower() != "wal":
+        logger.warning(f"Impossibile attivare il journal WAL (modalità attuale: {mode}).")
+
+
+def pagamenti_table_is_current(conn: sqlite3.Connection) -> bool:
+    """True se la tabella pagamenti esiste e ha le colonne e l'indice univoco per gli upsert (chiave naturale e HashRiga)."""
+    return _table_exists(conn, PAGAMENTI_TABLE) and all(
+        _column_exists(conn, PAGAMENTI_TABLE, column) for column in ("RigaMandato", "HashRiga")) and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (PAGAMENTI_KEY_INDEX,)).fetchone() is not None
+
+
+def create_pagamenti_table(conn: sqlite3.Connection):
+    """Crea la tabella pagamenti (se non esiste) con indice univoco sulla chiave naturale, target degli upsert."""
+    columns = ",\n            ".join(f"{name} {sql_type}" for name, sql_type in PAGAMENTI_COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PAGAMENTI_TABLE} (
+            {columns}
+        )""")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {PAGAMENTI_KEY_INDEX} ON {PAGAMENTI_TABLE} ({', '.join(PAGAMENTI_KEY_EXPRESSIONS)})")
+
+
+def stamp_data_version(conn: sqlite3.Connection):
+    """Registra una nuova versione dei dati, nella transazione del chiamante (firma usata dalla cache delle risposte)."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (Chiave TEXT PRIMARY KEY, Valore TEXT)")
+    conn.execute(f"INSERT OR REPLACE INTO {METADATA_TABLE} (Chiave, Valore) VALUES (?, ?)", (DATA_VERSION_KEY, str(time.time_ns())))
+
+
+def read_data_version(conn: sqlite3.Connection) -> str | None:
+    """Versione dei dati scritta dall'ultimo caricamento (None per i database caricati prima della tabella metadati)."""
+    if not _table_exists(conn, METADATA_TABLE): return None
+    row = conn.execute(f"SELECT Valore FROM {METADATA_TABLE} WHERE Chiave = ?", (DATA_VERSION_KEY,)).fetchone()
+    return row[0] if row else None
+
+
+def build_schema(conn: sqlite3.Connection, analyze: bool = True):
+    """
+    Prepara il database per le query dei tool SQL: colonna BeneficiarioNorm (se manca viene
+    aggiunta e calcolata), indici compositi su pagamenti e beneficiari_info, statistiche ANALYZE.
+    Idempotente: si può eseguire dopo ogni caricamento. Con analyze=False usa PRAGMA optimize,
+    che ricalcola le statistiche solo se sono cambiate molto (adatto ai caricamenti incrementali).
+    """
+    if _table_exists(conn, PAGAMENTI_TABLE) and not _column_exists(conn, PAGAMENTI_TABLE, "BeneficiarioNorm"):
+        logger.info("Aggiunta colonna BeneficiarioNorm a una tabella pagamenti esistente...")
+        conn.create_function("normalize_beneficiary", 1, normalize_beneficiary, deterministic=True)
+        conn.execute(f"ALTER TABLE {PAGAMENTI_TABLE} ADD COLUMN BeneficiarioNorm TEXT")
+        conn.execute(f"UPDATE {PAGAMENTI_TABLE} SET BeneficiarioNorm = normalize_beneficiary(Beneficiario)")
+
+    for index_name, table, columns in INDEXES:
+        if not _table_exists(conn, table):
+            logger.info(f"Tabella '{table}' assente: indice {index_name} non creato.")
+            continue
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})")
+        logger.info(f"Indice {index_name} su {table} ({columns}) pronto.")
+    conn.commit()
+
+    conn.execute("ANALYZE" if analyze else "PRAGMA optimize") # Statistiche per il query planner
+    conn.commit()
+    logger.info("Schema e statistiche del database aggiornati.")
+
+
+def _year_filter(years) -> tuple[str, list]:
+    """Clausola WHERE (e parametri) per limitare un'operazione a un insieme di anni (None = tutti)."""
+    if years is None: return "", []
+    years = sorted({int(y) for y in years})
+    return f"WHERE Anno IN ({','.join('?' * len(years))})", years
+
+
+def refresh_summaries(conn: sqlite3.Connection, years=None):
+    """
+    (Ri)calcola le tabelle riepilogative dai pagamenti grezzi, per tutti gli anni o solo per `years`:
+    - riepilogo_beneficiario_anno: totale, numero pagamenti e posizione in classifica per beneficiario e anno
+      (chiave primaria Anno + BeneficiarioNorm, indice Anno + Rango per i primi N);
+    - riepilogo_anno: totale, numero pagamenti e numero beneficiari per anno.
+    Non fa commit: il chiamante decide la transazione.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_BENEFICIARIO_ANNO_TABLE} (
+            Anno INTEGER NOT NULL,
+            BeneficiarioNorm TEXT NOT NULL,
+            Beneficiario TEXT,
+            TotaleSpeso REAL,
+            NumeroPagamenti INTEGER NOT NULL,
+            Rango INTEGER NOT NULL,
+            PRIMARY KEY (Anno, BeneficiarioNorm)
+        ) WITHOUT ROWID""")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_riepilogo_anno_rango ON {SUMMARY_BENEFICIARIO_ANNO_TABLE} (Anno, Rango)")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_ANNO_TABLE} (
+            Anno INTEGER PRIMARY KEY,
+            TotaleSpeso REAL,
+            NumeroPagamenti INTEGER NOT NULL,
+            NumeroBeneficiari INTEGER NOT NULL
+        )""")
+
+    where, params = _year_filter(years)
+    conn.execute(f"DELETE FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE} {where}", params)
+    conn.execute(f"DELETE FROM {SUMMARY_ANNO_TABLE} {where}", params)
+    raw_filter = f"{where} AND Anno IS NOT NULL" if where else "WHERE Anno IS NOT NULL"
+    # Rango: 1 = beneficiario con la spesa maggiore nell'anno (i totali NULL finiscono in fondo)
+    conn.execute(f"""
+        INSERT INTO {SUMMARY_BENEFICIARIO_ANNO_TABLE} (Anno, BeneficiarioNorm, Beneficiario, TotaleSpeso, NumeroPagamenti, Rango)
+        SELECT Anno, BeneficiarioNorm, Beneficiario, TotaleSpeso, NumeroPagamenti,
+               ROW_NUMBER() OVER (PARTITION BY Anno ORDER BY TotaleSpeso DESC, BeneficiarioNorm)
+        FROM (
+            SELECT Anno, COALESCE(BeneficiarioNorm, '') AS BeneficiarioNorm, MIN(Beneficiario) AS Beneficiario,
+                   SUM(ImportoEuro) AS TotaleSpeso, COUNT(*) AS NumeroPagamenti
+            FROM {PAGAMENTI_TABLE} {raw_filter}
+            GROUP BY Anno, COALESCE(BeneficiarioNorm, '')
+        )""", params)
+    conn.execute(f"""
+        INSERT INTO {SUMMARY_ANNO_TABLE} (Anno, TotaleSpeso, NumeroPagamenti, NumeroBeneficiari)
+        SELECT Anno, SUM(TotaleSpeso), SUM(NumeroPagamenti), COUNT(*)
+        FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE} {where}
+        GROUP BY Anno""", params)
+    scope = "tutti gli anni" if years is None else f"anni {', '.join(str(y) for y in params)}"
+    logger.info(f"Tabelle riepilogative aggiornate ({scope}).")
+
+
+def check_summaries(conn: sqlite3.Connection, years=None) -> bool:
+    """
+    Confronta le tabelle riepilogative con i pagamenti grezzi (totali e conteggi per anno e per
+    beneficiario/anno). Logga le differenze e ritorna True se sono coerenti.
+    """
+    where, params = _year_filter(years)
+    raw_filter = f"{where} AND Anno IS NOT NULL" if where else "WHERE Anno IS NOT NULL"
+    raw = {(anno, benef): (totale, conteggio) for anno, benef, totale, conteggio in conn.execute(f"""
+        SELECT Anno, COALESCE(BeneficiarioNorm, ''), SUM(ImportoEuro), COUNT(*)
+        FROM {PAGAMENTI_TABLE} {raw_filter}
+        GROUP BY Anno, COALESCE(BeneficiarioNorm, '')""", params)}
+    summary = {(anno, benef): (totale, conteggio) for anno, benef, totale, conteggio in conn.execute(
+        f"SELECT Anno, BeneficiarioNorm, TotaleSpeso, NumeroPagamenti FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE} {where}", params)}
+    raw_years = {anno: (totale, conteggio) for anno, totale, conteggio in conn.execute(
+        f"SELECT Anno, SUM(ImportoEuro), COUNT(*) FROM {PAGAMENTI_TABLE} {raw_filter} GROUP BY Anno", params)}
+    summary_years = {anno: (totale, conteggio) for anno, totale, conteggio in conn.execute(
+        f"SELECT Anno, TotaleSpeso, NumeroPagamenti FROM {SUMMARY_ANNO_TABLE} {where}", params)}
+
+    def differs(expected, actual) -> bool:
+        if expected is None or actual is None: return expected != actual
+        return expected[1] != actual[1] or abs((expected[0] or 0) - (actual[0] or 0)) > SUMMARY_TOLERANCE
+
+    mismatches = [key for key in raw.keys() | summary.keys() if differs(raw.get(key), summary.get(key))]
+    year_mismatches = [anno for anno in raw_years.keys() | summary_years.keys() if differs(raw_years.get(anno), summary_years.get(anno))]
+    for anno, beneficiario in sorted(mismatches)[:20]:
+        logger.warning(f"Riepilogo incoerente per {beneficiario!r} ({anno}): grezzo {raw.get((anno, beneficiario))}, riepilogo {summary.get((anno, beneficiario))}.")
+    for anno in sorted(year_mismatches):
+        logger.warning(f"Totale annuale incoerente nel riepilogo per l'anno {anno}: grezzo {raw_years.get(anno)}, riepilogo {summary_years.get(anno)}.")
+    without_year = conn.execute(f"SELECT COUNT(*), SUM(ImportoEuro) FROM {PAGAMENTI_TABLE} WHERE Anno IS NULL").fetchone()
+    if without_year[0]:
+        logger.warning(f"{without_year[0]} pagamenti senza Anno (totale {without_year[1] or 0:.2f} euro): presenti in {PAGAMENTI_TABLE}, esclusi dai riepiloghi per anno.")
+    if mismatches or year_mismatches:
+        logger.warning(f"Controllo coerenza tabelle riepilogative: {len(mismatches)} righe beneficiario/anno e {len(year_mismatches)} anni non coincidono.")
+        return False
+    logger.info("Controllo coerenza tabelle riepilogative: OK.")
+    return True
@@ -0,0 +1,145 @@
+# src/tools/document_builder.py
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+
+try:
+    from .amount_parser import parse_amounts
+except ImportError:
+    from amount_parser import parse_amounts
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+DEFAULT_CHUNK_SIZE = int(os.environ.get("DEFAULT_CHUNK_SIZE_WORDS", 250))
+DEFAULT_CHUNK_OVERLAP = int(os.environ.get("DEFAULT_CHUNK_OVERLAP_WORDS", 40))
+DESCRIPTION_METADATA_MAX_CHARS = 500 # Limita lunghezza per sicurezza metadati
+
+
+def split_text_into_chunks(
+    text: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> list[str]:
+    """Divide un testo lungo in chunk basandosi su parole."""
+    if not isinstance(text, str) or not text.strip(): return [] # Gestisce None o stringhe vuote
+    words = text.split()
+    if len(words) <= chunk_size: return [text]
+
+    chunks = []
+    start_index = 0
+    step = max(1, chunk_size - chunk_overlap) # Assicura avanzamento minimo
+
+    while start_index < len(words):
+        end_index = min(start_index + chunk_size, len(words))
+        chunks.append(" ".join(words[start_index:end_index]))
+        start_index += step
+
+    #logger.debug(f"Diviso testo ({len(words)} parole) in {len(chunks)} chunk.")
+    return chunks
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Colonna come stringa (vuota se assente), equivalente a str(row.get(name, ''))."""
+    if name not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[name].astype(str)
+
+
+def parse_importo_column(importi: pd.Series) -> pd.Series:
+    """
+    Converte la colonna ImportoEuro in float con il parser condiviso (tools/amount_parser.py):
+    il punto è il separatore decimale nel dataset processato. NaN se vuoto o non convertibile.
+    """
+    return parse_amounts(importi, dot_thousands=False)[0]
+
+
+def build_documents_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Costruisce in un solo passaggio colonnare (senza iterrows) il testo da indicizzare,
+    il numero di parole, l'importo numerico e le colonne dei metadati per ogni pagamento.
+
+    Colonne restituite: doc_text, n_words, importo_float (NaN se non convertibile),
+    anno, numero_mandato, beneficiario, importo_str, descrizione, file_origine e,
+    se presente in input, row_key. L'indice è quello del DataFrame in ingresso.
+    """
+    anno = _text_column(df, 'Anno')
+    beneficiario = _text_column(df, 'Beneficiario')
+    descrizione = _text_column(df, 'DescrizioneMandato')
+    importo_str = _text_column(df, 'ImportoEuro')
+
+    doc_text = "Anno: " + anno + ". Beneficiario: " + beneficiario + ". Descrizione: " + descrizione
+    doc_text = doc_text.str.replace(r'\s+', ' ', regex=True).str.strip() # Come ' '.join(text.split())
+
+    docs = pd.DataFrame({
+        'doc_text': doc_text,
+        'n_words': doc_text.str.count(' ') + 1,
+        'importo_float': parse_importo_column(importo_str),
+        'anno': anno,
+        'numero_mandato': _text_column(df, 'NumeroMandato'),
+        'beneficiario': beneficiario,
+        'importo_str': importo_str,
+        'descrizione': descrizione.str.slice(0, DESCRIPTION_METADATA_MAX_CHARS),
+        'file_origine': _text_column(df, 'NomeFileOrigine'),
+    }, index=df.index)
+    if 'row_key' in df.columns:
+        docs['row_key'] = df['row_key']
+    return docs
+
+
+def build_batch_documents(
+    docs: pd.DataFrame,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> dict:
+    """
+    Espande un blocco di `build_documents_frame` in chunk, metadati e ID ChromaDB.
+    Solo i documenti più lunghi di `chunk_size` parole passano da split_text_into_chunks.
+    Ritorna un dizionario con liste parallele 'chunks', 'metadatas', 'ids' e 'original_indices'.
+    """
+    batch_chunks = []
+    batch_metadatas = []
+    batch_ids = []
+    original_indices = [] # Per tenere traccia degli indici originali del DataFrame
+
+    row_keys = docs['row_key'].tolist() if 'row_key' in docs.columns else [str(idx) for idx in docs.index]
+    columns = zip(
+        docs.index.tolist(), row_keys, docs['doc_text'].tolist(), docs['n_words'].tolist(),
+        docs['importo_float'].tolist(), docs['anno'].tolist(), docs['numero_mandato'].tolist(),
+        docs['beneficiario'].tolist(), docs['importo_str'].tolist(), docs['descrizione'].tolist(),
+        docs['file_origine'].tolist(),
+    )
+    for idx, row_key, doc_text, n_words, importo_float, anno, numero, beneficiario, importo_str, descrizione, file_origine in columns:
+        if not doc_text:
+            logger.warning(f"Pagamento indice {idx} saltato: testo combinato vuoto.")
+            continue
+        chunks = [doc_text] if n_words <= chunk_size else split_text_into_chunks(doc_text, chunk_size, chunk_overlap)
+
+        for chunk_idx, chunk_text in enumerate(chunks):
+            original_indices.append(idx) # Salva indice originale
+            batch_chunks.append(chunk_text)
+            batch_ids.append(f"pag_{row_key}_chunk_{chunk_idx}") # ID stabile: dipende dal contenuto, non dalla posizione
+
+            # Metadati per ChromaDB (SOLO stringhe, numeri o booleani)
+            metadata = {
+                "row_key": row_key, # Usata dalla modalità incrementale
+                "original_index": str(idx),
+                "chunk_index": str(chunk_idx),
+                "anno": anno,
+                "numero_mandato": numero,
+                "beneficiario": beneficiario,
+                "importo_str": importo_str, # Salva sempre come stringa per sicurezza
+                "descrizione": descrizione,
+                "file_origine": file_origine,
+            }
+            if importo_float == importo_float: # Aggiungi solo se la conversione ha avuto successo (NaN != NaN)
+                metadata['importo_float'] = importo_float
+            batch_metadatas.append(metadata)
+
+    return {"chunks": batch_chunks, "metadatas": batch_metadatas, "ids": batch_ids, "original_indices": original_indices}
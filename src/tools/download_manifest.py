@@ -0,0 +1,102 @@
+# src/tools/download_manifest.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+DOWNLOAD_MANIFEST_FILE = os.environ.get("DOWNLOAD_MANIFEST_FILE", "data/cache/download_manifest.db")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: Path | str, hasher=None):
+    """Aggiorna (o crea) un hasher sha256 con il contenuto del file e lo restituisce."""
+    hasher = hasher or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+class DownloadManifest:
+    """
+    Manifest persistente degli allegati scaricati, su SQLite (una riga per URL):
+    nome file, ETag, Last-Modified, dimensione e sha256 del contenuto.
+
+    Una riga con complete=0 descrive un download in corso (file .part): i validatori sono
+    quelli della risposta con cui è iniziato, così la ripresa con Range/If-Range non mescola
+    versioni diverse dello stesso allegato. Thread-safe (una connessione condivisa con lock).
+    """
+
+    def __init__(self, db_path: Path | str):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                url TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                complete INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )""")
+        self._conn.commit()
+        logger.info(f"Manifest download aperto: {self.db_path}")
+
+    def get(self, url: str) -> dict | None:
+        """Voce del manifest per l'URL (None se mai scaricato)."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM downloads WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def start(self, url: str, filename: str, etag: str | None, last_modified: str | None):
+        """Registra l'inizio di un download (complete=0) con i validatori della risposta."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (url, filename, etag, last_modified, size, sha256, complete, updated_at) "
+                "VALUES (?, ?, ?, ?, NULL, NULL, 0, ?)", (url, filename, etag, last_modified, time.time()))
+            self._conn.commit()
+
+    def complete(self, url: str, filename: str, etag: str | None, last_modified: str | None, size: int, sha256: str):
+        """Registra un allegato scaricato per intero (o già presente e verificato)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (url, filename, etag, last_modified, size, sha256, complete, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1, ?)", (url, filename, etag, last_modified, size, sha256, time.time()))
+            self._conn.commit()
+
+    def touch(self, url: str):
+        """Aggiorna solo l'istante di verifica (risposta 304: allegato invariato)."""
+        with self._lock:
+            self._conn.execute("UPDATE downloads SET updated_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+
+_default_manifest = None
+_default_manifest_lock = threading.Lock()
+
+def get_download_manifest() -> DownloadManifest:
+    """Restituisce il manifest condiviso configurato da .env."""
+    global _default_manifest
+    with _default_manifest_lock:
+        if _default_manifest is None:
+            _default_manifest = DownloadManifest(PROJECT_ROOT / DOWNLOAD_MANIFEST_FILE)
+        return _default_manifest
@@ -0,0 +1,171 @@
+# src/tools/embedding_cache.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+EMBEDDING_CACHE_FILE = os.environ.get("EMBEDDING_CACHE_FILE", "data/cache/embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Quando si supera il limite si scende a questa frazione, per non fare eviction a ogni inserimento
+EVICTION_TARGET_RATIO = 0.9
+SQLITE_MAX_VARIABLES = 900 # Sotto il limite storico di 999 parametri per statement
+# last_used viene aggiornato solo se più vecchio di così: una run di sola lettura non diventa una scrittura per batch
+LAST_USED_REFRESH_SECONDS = float(os.environ.get("EMBEDDING_CACHE_LAST_USED_REFRESH_SECONDS", 3600))
+
+
+def normalize_text_for_cache(text: str) -> str:
+    """Normalizza il testo per la chiave di cache: Unicode NFC e spazi compattati."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', str(text))).strip()
+
+
+def make_cache_key(model_name: str, task_type: str, text: str) -> str:
+    """Chiave della cache: sha256 di (modello, task_type, testo normalizzato)."""
+    payload = f"{model_name}\x1f{task_type}\x1f{normalize_text_for_cache(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache persistente degli embedding su SQLite, condivisa tra indicizzatore e query (anche tra processi).
+    I vettori sono salvati come float32. L'eviction rimuove le voci usate meno di recente
+    quando si supera `max_entries`. Contatori hit/miss disponibili con `stats()`.
+    """
+
+    def __init__(self, db_path: Path | str, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entry_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Cache embedding aperta: {self.db_path} ({self._entry_count} voci, max {self.max_entries}).")
+
+    def get_many(self, model_name: str, task_type: str, texts: list[str]) -> list[list[float] | None]:
+        """Restituisce gli embedding in cache nello stesso ordine di `texts` (None per i miss)."""
+        keys = [make_cache_key(model_name, task_type, t) for t in texts]
+        found = {}
+        now = time.time(); stale_keys = []
+        with self._lock:
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                key_slice = list(set(keys[i:i + SQLITE_MAX_VARIABLES]))
+                placeholders = ",".join("?" * len(key_slice))
+                rows = self._conn.execute(f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", key_slice)
+                for key, blob, last_used in rows:
+                    found[key] = array('f', blob).tolist()
+                    if now - last_used > LAST_USED_REFRESH_SECONDS: stale_keys.append(key)
+            # Per l'eviction LRU basta una precisione di LAST_USED_REFRESH_SECONDS: scrivo solo le voci non toccate da allora
+            if stale_keys:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in stale_keys])
+                self._conn.commit()
+            results = [found.get(k) for k in keys]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def get(self, model_name: str, task_type: str, text: str) -> list[float] | None:
+        """Versione a singolo testo di `get_many`."""
+        return self.get_many(model_name, task_type, [text])[0]
+
+    def put_many(self, model_name: str, task_type: str, texts: list[str], embeddings: list[list[float]]):
+        """Salva gli embedding calcolati e applica l'eviction se la cache supera la dimensione massima."""
+        now = time.time()
+        rows = [
+            (make_cache_key(model_name, task_type, t), model_name, task_type, len(e), array('f', e).tobytes(), now)
+            for t, e in zip(texts, embeddings) if e
+        ]
+        if not rows: return
+        with self._lock:
+            # Conta solo le chiavi davvero nuove: un REPLACE di una voce esistente non fa crescere la cache
+            new_keys = {row[0] for row in rows}
+            for i in range(0, len(rows), SQLITE_MAX_VARIABLES):
+                key_slice = list({row[0] for row in rows[i:i + SQLITE_MAX_VARIABLES]})
+                placeholders = ",".join("?" * len(key_slice))
+                new_keys.difference_update(k for (k,) in self._conn.execute(f"SELECT key FROM embeddings WHERE key IN ({placeholders})", key_slice))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, task_type, dim, vector, last_used) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._entry_count += len(new_keys)
+            if self._entry_count > self.max_entries:
+                self._evict_locked()
+
+    def put(self, model_name: str, task_type: str, text: str, embedding: list[float]):
+        """Versione a singolo testo di `put_many`."""
+        self.put_many(model_name, task_type, [text], [embedding])
+
+    def _evict_locked(self):
+        """Rimuove le voci meno usate di recente. Da chiamare con il lock acquisito."""
+        # Il conteggio locale è approssimato (altri processi scrivono): lo riallineo prima di decidere
+        self._entry_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._entry_count - int(self.max_entries * EVICTION_TARGET_RATIO)
+        if excess <= 0 or self._entry_count <= self.max_entries: return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,))
+        self._conn.commit()
+        self._entry_count -= excess
+        self.evictions += excess
+        logger.info(f"Cache embedding: rimosse {excess} voci meno recenti (ora {self._entry_count}).")
+
+    def stats(self) -> dict:
+        """Contatori di utilizzo della cache per questo processo."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": self._entry_count,
+                "max_entries": self.max_entries,
+            }
+
+
+_default_cache = None
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Restituisce la cache condivisa configurata da .env (None se disabilitata o non apribile)."""
+    global _default_cache, _default_cache_failed
+    if not EMBEDDING_CACHE_ENABLED or _default_cache_failed: return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = EmbeddingCache(PROJECT_ROOT / EMBEDDING_CACHE_FILE)
+            except Exception as e:
+                logger.error(f"Impossibile aprire la cache embedding ({EMBEDDING_CACHE_FILE}): {e}. Proseguo senza cache.", exc_info=True)
+                _default_cache_failed = True
+                return None
+        return _default_cache
@@ -0,0 +1,108 @@
+# src/tools/html_extract.py
+import logging
+import re
+
+from lxml import etree, html as lxml_html
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LISTING_TABLE_CLASS = "master-detail-list-table"
+LISTING_ROW_CLASS = "master-detail-list-line"
+DOWNLOAD_LINK_MARKER = "downloadAllegato"
+NEXT_PAGE_TEXT = "Avanti"
+# Data di pubblicazione nella riga dell'elenco (gg/mm/aaaa)
+DATE_PATTERN = re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{4})\b')
+
+
+def _has_class(name: str) -> str:
+    """Condizione XPath 1.0 equivalente a class_=name di BeautifulSoup (uno dei token di @class)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Espressioni compilate una sola volta e riusate per ogni pagina
+_LISTING_TABLE = etree.XPath(f"(//table[{_has_class(LISTING_TABLE_CLASS)}])[1]")
+_LISTING_ROWS = etree.XPath(f".//tr[{_has_class(LISTING_ROW_CLASS)}]")
+_OBJECT_CELL = etree.XPath(f"(.//td[{_has_class('oggetto')}])[1]")
+_ACTION_CELL = etree.XPath(f"(.//td[{_has_class('actions')}])[1]")
+_DETAIL_LINK = etree.XPath("(.//a[@title = $title])[1]")
+_DOWNLOAD_LINK = etree.XPath(f"(//a[contains(@href, '{DOWNLOAD_LINK_MARKER}')])[1]/@href")
+_ALL_HREFS = etree.XPath("//a/@href")
+_NEXT_LINKS = etree.XPath("//a")
+
+
+def parse_html(html_content):
+    """
+    Albero lxml della pagina (str o bytes), None se vuota o non interpretabile.
+    Il testo viene passato come UTF-8 perché lxml rifiuta le stringhe con dichiarazione di encoding.
+    """
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8', errors='replace')
+    if not html_content or not html_content.strip():
+        return None
+    try:
+        return lxml_html.document_fromstring(html_content, parser=lxml_html.HTMLParser(encoding='utf-8'))
+    except (etree.ParserError, ValueError) as e:
+        logger.debug(f"Pagina HTML non interpretabile: {e}")
+        return None
+
+
+def _text(element) -> str:
+    """Come get_text(strip=True) di BeautifulSoup: frammenti di testo ripuliti e concatenati."""
+    return "".join(fragment.strip() for fragment in element.itertext() if fragment.strip())
+
+
+def listing_rows(root, detail_link_title: str) -> list[dict] | None:
+    """
+    Righe della tabella dell'elenco atti: dict con object (testo della cella oggetto), detail_href
+    (href grezzo del link di dettaglio o None), data_id (attributo data-id o None) e published
+    (prima data gg/mm/aaaa della riga in formato ISO, o None).
+    Le righe senza cella oggetto o azioni sono escluse. None se la tabella non c'è.
+    """
+    tables = _LISTING_TABLE(root) if root is not None else []
+    if not tables:
+        return None
+    rows = []
+    for row in _LISTING_ROWS(tables[0]):
+        object_cells = _OBJECT_CELL(row)
+        action_cells = _ACTION_CELL(row)
+        if not object_cells or not action_cells:
+            continue
+        links = _DETAIL_LINK(action_cells[0], title=detail_link_title)
+        href = links[0].get('href') if links else None
+        date = DATE_PATTERN.search(" ".join(row.itertext()))
+        published = f"{date.group(3)}-{int(date.group(2)):02d}-{int(date.group(1)):02d}" if date else None
+        rows.append({'object': _text(object_cells[0]), 'detail_href': href, 'data_id': row.get('data-id'), 'published': published})
+    return rows
+
+
+def download_href(root, fallback_extensions: tuple) -> tuple[str | None, bool]:
+    """
+    Href dell'allegato in una pagina di dettaglio: il primo link 'downloadAllegato' oppure,
+    in mancanza, il primo link che termina con una delle estensioni (anche seguita da '?p_auth=').
+    Ritorna (href o None, True se trovato con il ripiego generico).
+    """
+    if root is None:
+        return None, False
+    hrefs = _DOWNLOAD_LINK(root)
+    if hrefs:
+        return str(hrefs[0]), False
+    suffixes = tuple(ext + '?p_auth=' for ext in fallback_extensions) + tuple(fallback_extensions)
+    for href in _ALL_HREFS(root):
+        if href.lower().endswith(suffixes):
+            return str(href), True
+    return None, False
+
+
+def next_page_link(root) -> tuple[str | None, bool]:
+    """Link 'Avanti' della paginazione: (href grezzo o None, True se il link esiste e non è disabilitato)."""
+    if root is None:
+        return None, False
+    next_link = next((a for a in _NEXT_LINKS(root) if _text(a) == NEXT_PAGE_TEXT), None)
+    if next_link is None:
+        return None, False
+    parent = next_link.getparent()
+    if parent is not None and 'disabled' in (parent.get('class') or '').split():
+        return None, False
+    return next_link.get('href'), True
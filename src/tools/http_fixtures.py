@@ -0,0 +1,172 @@
+# src/tools/http_fixtures.py
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+BODIES_DIR = "bodies"
+# Header che non descrivono il corpo salvato (già decompresso e letto per intero)
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'connection', 'keep-alive', 'set-cookie'}
+
+
+class FixtureStore:
+    """
+    Risposte HTTP salvate su disco, una per URL: index.json (stato, header, file del corpo)
+    e i corpi in bodies/. Le risposte a HEAD vengono salvate solo se l'URL non ha già un GET.
+    Thread-safe; l'indice viene riscritto in modo atomico a ogni registrazione.
+    """
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        index_path = self.directory / INDEX_FILE
+        self._index = json.loads(index_path.read_text(encoding='utf-8')) if index_path.is_file() else {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, url: str) -> dict | None:
+        """Voce salvata per l'URL (status, reason, headers, body: bytes o None per le sole HEAD)."""
+        with self._lock:
+            entry = self._index.get(url)
+        if entry is None:
+            return None
+        body = (self.directory / entry['body']).read_bytes() if entry.get('body') else None
+        return {**entry, 'body': body}
+
+    def put(self, url: str, status: int, headers: dict, body: bytes | None, reason: str = ""):
+        """Salva (o sostituisce) la risposta per l'URL. body=None per una risposta HEAD."""
+        headers = {k: v for k, v in headers.items() if k.lower() not in DROPPED_HEADERS}
+        entry = {'status': status, 'reason': reason, 'headers': headers, 'body': None}
+        with self._lock:
+            existing = self._index.get(url)
+            if body is None and existing and existing.get('body'):
+                return # Un HEAD non sovrascrive un GET già registrato
+            if body is not None:
+                headers['Content-Length'] = str(len(body))
+                body_name = f"{BODIES_DIR}/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.bin"
+                (self.directory / BODIES_DIR).mkdir(parents=True, exist_ok=True)
+                (self.directory / body_name).write_bytes(body)
+                entry['body'] = body_name
+            self._index[url] = entry
+            self._save_index_locked()
+
+    def _save_index_locked(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / (INDEX_FILE + ".tmp")
+        tmp_path.write_text(json.dumps(self._index, indent=1, sort_keys=True, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self.directory / INDEX_FILE)
+
+
+class _FixtureBody(io.BytesIO):
+    """Corpo in memoria con la firma di read() di urllib3 (requests passa decode_content nei redirect)."""
+
+    def read(self, amt=None, decode_content=None):
+        return super().read(amt)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Adapter requests che esegue le richieste reali e salva ogni risposta (redirect compresi) nel FixtureStore."""
+
+    def __init__(self, store: FixtureStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 or response.status_code == 206:
+            return response # Risposte parziali/condizionali: non descrivono la risorsa intera
+        body = None if request.method == 'HEAD' else response.content # Legge il corpo: resta disponibile al chiamante
+        self.store.put(request.url, response.status_code, dict(response.headers), body, response.reason or "")
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Adapter requests che risponde dal FixtureStore senza rete, emulando il server:
+    HEAD (solo header), GET condizionali (304 su ETag/Last-Modified) e Range (206) sulla risposta salvata.
+    Un URL non registrato risponde 404. `latency` simula il tempo di risposta (secondi per richiesta).
+    """
+
+    def __init__(self, store: FixtureStore, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        entry = self.store.get(request.url)
+        if entry is None or (request.method != 'HEAD' and entry['body'] is None and entry['status'] == 200):
+            logger.warning(f"Fixture mancante per {request.method} {request.url}: rispondo 404.")
+            return self._response(request, 404, {}, b"", "Not Found (fixture mancante)")
+        headers = dict(entry['headers'])
+        body = entry['body'] or b""
+        if request.method == 'HEAD':
+            return self._response(request, entry['status'], headers, b"", entry['reason'])
+        if entry['status'] == 200:
+            etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+            # RFC 7232 §6: If-None-Match ha la precedenza, If-Modified-Since conta solo se manca
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match is not None:
+                not_modified = bool(etag) and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')])
+            else:
+                not_modified = bool(last_modified) and request.headers.get('If-Modified-Since') == last_modified
+            if not_modified:
+                return self._response(request, 304, {k: v for k, v in headers.items() if k.lower() != 'content-length'}, b"", "Not Modified")
+            range_header = request.headers.get('Range', '')
+            if_range = request.headers.get('If-Range')
+            if range_header.startswith('bytes=') and range_header.endswith('-') and if_range in (None, etag, last_modified):
+                start = int(range_header[len('bytes='):-1])
+                if start < len(body):
+                    headers['Content-Range'] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                    headers['Content-Length'] = str(len(body) - start)
+                    return self._response(request, 206, headers, body[start:], "Partial Content")
+        return self._response(request, entry['status'], headers, body, entry['reason'])
+
+    def _response(self, request, status: int, headers: dict, body: bytes, reason: str) -> Response:
+        response = Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _FixtureBody(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def mount_fixtures(session, mode: str, directory: Path | str, latency: float = 0.0) -> FixtureStore:
+    """
+    Collega alla sessione requests la registrazione ('record') o la riproduzione ('replay')
+    delle risposte HTTP nella cartella indicata, per http:// e https://.
+    """
+    store = FixtureStore(directory)
+    if mode == 'record':
+        adapter = RecordingAdapter(store, pool_maxsize=32)
+    elif mode == 'replay':
+        adapter = ReplayAdapter(store, latency=latency)
+    else:
+        raise ValueError(f"Modalità fixture non valida: {mode} (attese 'record' o 'replay')")
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.info(f"Fixture HTTP in modalità {mode}: {store.directory} ({len(store)} risposte salvate).")
+    return store
@@ -0,0 +1,147 @@
+# src/tools/processed_dataset.py
+import logging
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+
+try:
+    from .amount_parser import parse_amounts
+except ImportError:
+    from amount_parser import parse_amounts
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+# Dataset canonico prodotto dall'ETL (Parquet tipizzato) ed esportazione CSV per ispezione
+PROCESSED_PARQUET = PROJECT_ROOT / os.environ.get("PROCESSED_DATASET_FILE", "data/processed_data/processed_pagamenti.parquet")
+PROCESSED_CSV = PROJECT_ROOT / os.environ.get("PROCESSED_CSV_FILE", "data/processed_data/processed_pagamenti.csv")
+
+# Schema del dataset (ordine delle colonne compreso)
+SCHEMA = {
+    'NumeroMandato': 'Int64',
+    'Anno': 'Int64',
+    'DataMandato': 'datetime64[ns]',
+    'CIG': 'string',
+    'Beneficiario': 'string',
+    'ImportoEuro': 'float64',
+    'DescrizioneMandato': 'string',
+    'NomeFileOrigine': 'string',
+}
+ISO_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    arrow_types = {'Int64': pa.int64(), 'datetime64[ns]': pa.timestamp('ns'), 'string': pa.string(), 'float64': pa.float64()}
+    return pa.schema([(name, arrow_types[dtype]) for name, dtype in SCHEMA.items()])
+
+
+def parse_date_column(values: pd.Series) -> pd.Series:
+    """
+    Converte DataMandato in datetime: date già tipizzate dal foglio di calcolo, testo ISO
+    (es. '2021-02-01 00:00:00') e testo all'italiana con il giorno per primo ('01/02/2021').
+    NaT se non interpretabile.
+    """
+    values = values.astype(object)
+    is_iso = values.map(lambda v: isinstance(v, str) and ISO_DATE_PATTERN.match(v.strip()) is not None).astype(bool)
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if is_iso.any():
+        result[is_iso] = pd.to_datetime(values[is_iso].str.strip(), errors='coerce', format='ISO8601')
+    others = ~is_iso & values.notna()
+    if others.any():
+        result[others] = pd.to_datetime(values[others], errors='coerce', dayfirst=True, format='mixed')
+    return result
+
+
+def coerce_to_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Porta un DataFrame (colonne mancanti comprese) allo SCHEMA del dataset: interi nullable,
+    importo float, data datetime, testo come string. Logga i valori non convertibili.
+    """
+    out = pd.DataFrame(index=df.index)
+    for name, dtype in SCHEMA.items():
+        column = df[name] if name in df.columns else pd.Series(pd.NA, index=df.index, dtype=object)
+        if dtype == 'Int64':
+            converted = pd.to_numeric(column, errors='coerce')
+            non_integer = converted.notna() & (converted % 1 != 0)
+            converted = converted.where(~non_integer).astype('Int64')
+        elif dtype == 'float64':
+            # Testo già normalizzato (es. CSV processato): il punto è sempre il separatore decimale
+            converted = parse_amounts(column, dot_thousands=False)[0]
+        elif dtype == 'datetime64[ns]':
+            converted = parse_date_column(column)
+        else:
+            converted = column.astype(object).where(column.notna(), None).map(lambda v: v if v is None else str(v)).astype('string')
+        lost = int((column.notna() & converted.isna()).sum())
+        if lost:
+            logger.warning(f"{lost} valori della colonna {name} non convertibili in {dtype}: impostati a vuoto.")
+        out[name] = converted
+    return out
+
+
+def write_processed_dataset(df: pd.DataFrame, parquet_path: Path = PROCESSED_PARQUET, csv_path: Path | None = PROCESSED_CSV):
+    """
+    Salva il dataset canonico in Parquet (schema esplicito, un row group per anno così le letture
+    filtrate per anno saltano gli altri) e, se csv_path è indicato, l'esportazione CSV.
+    La scrittura è atomica (file temporaneo + os.replace).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = coerce_to_schema(df)
+    schema = _arrow_schema()
+    tmp_path = parquet_path.with_name(parquet_path.name + ".tmp")
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for _, part in df.groupby('Anno', dropna=False, sort=True):
+            writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+    os.replace(tmp_path, parquet_path)
+    logger.info(f"Dataset Parquet salvato in: {parquet_path} ({len(df)} righe)")
+
+    if csv_path is not None:
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig') # utf-8-sig per Excel compatibility
+        logger.info(f"Esportazione CSV salvata in: {csv_path}")
+
+
+def load_processed_dataset(columns: list[str] | None = None, years=None,
+                           parquet_path: Path = PROCESSED_PARQUET) -> pd.DataFrame:
+    """
+    Legge il dataset dei pagamenti con i tipi dello SCHEMA.
+    - columns: legge solo queste colonne (proiezione, le altre non vengono decodificate);
+    - years: legge solo questi anni (i row group degli altri anni vengono saltati).
+    Se il Parquet non esiste ancora (ETL precedente) ripiega sul CSV esportato.
+    Solleva FileNotFoundError se manca anche il CSV.
+    """
+    unknown = set(columns or []) - set(SCHEMA)
+    if unknown:
+        raise ValueError(f"Colonne sconosciute nel dataset pagamenti: {sorted(unknown)}")
+    years = sorted({int(y) for y in years}) if years is not None else None
+
+    if parquet_path.is_file():
+        filters = [('Anno', 'in', years)] if years is not None else None
+        df = pd.read_parquet(parquet_path, columns=columns, filters=filters)
+        # Interi con valori mancanti arrivano come float, il testo come object: riallinea allo schema
+        return df.astype({name: SCHEMA[name] for name in df.columns})
+
+    if not PROCESSED_CSV.is_file():
+        raise FileNotFoundError(f"Dataset processato non trovato: {parquet_path} (né {PROCESSED_CSV})")
+    logger.warning(f"Dataset Parquet non trovato ({parquet_path}): leggo il CSV {PROCESSED_CSV}. Rieseguire l'ETL per generarlo.")
+    usecols = None if columns is None else list(dict.fromkeys(columns + (['Anno'] if years is not None else [])))
+    df = pd.read_csv(PROCESSED_CSV, usecols=usecols, dtype=str, keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+    df = coerce_to_schema(df)
+    if years is not None:
+        df = df[df['Anno'].isin(years)]
+    return df[columns] if columns is not None else df
+
+
+def to_text_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Versione testuale del dataset (stringa vuota per i valori mancanti), con la stessa resa dei valori
+    del CSV: per chi costruisce testi e chiavi a partire dalle stringhe (es. l'indicizzatore ChromaDB).
+    """
+    return df.astype(object).where(df.notna(), None).map(lambda v: '' if v is None else str(v))
@@ -0,0 +1,118 @@
+# src/tools/rate_limiter.py
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe con velocità adattiva (AIMD).
+
+    `acquire()` blocca finché non è disponibile un token. Quando l'API segnala un limite
+    (es. ResourceExhausted) chiamare `penalize()`: la velocità viene dimezzata (fino a `min_rate`).
+    Ogni `acquire()` riuscita dopo una penalità la fa risalire gradualmente verso `max_rate`.
+    Con `penalty_cooldown` le penalità ravvicinate contano una volta sola: più worker che vedono
+    lo stesso limite nello stesso momento non dimezzano la velocità una volta ciascuno.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float | None = None,
+                 min_rate: float | None = None, recovery_step: float | None = None, name: str = "rate-limiter",
+                 penalty_cooldown: float = 0.0):
+        if rate_per_second <= 0: raise ValueError("rate_per_second deve essere > 0")
+        self.name = name
+        self.max_rate = float(rate_per_second)
+        self.rate = float(rate_per_second)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 20
+        # Incremento additivo per token concesso: ~5% del massimo ogni 20 richieste
+        self.recovery_step = float(recovery_step) if recovery_step else self.max_rate / 400
+        self.capacity = float(capacity) if capacity else max(1.0, self.max_rate)
+        self.penalty_cooldown = max(0.0, float(penalty_cooldown))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._last_penalty = None
+        self._lock = threading.Lock()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Attende finché non sono disponibili `tokens` token e li consuma."""
+        while True:
+            with self._lock:
+                self._refill_locked()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    if self.rate < self.max_rate:
+                        self.rate = min(self.max_rate, self.rate + self.recovery_step)
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def penalize(self, factor: float = 0.5):
+        """Riduce la velocità dopo un errore di quota e svuota i token accumulati (una volta per `penalty_cooldown`)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._last_penalty is not None and now - self._last_penalty < self.penalty_cooldown:
+                return
+            self._last_penalty = now
+            self._refill_locked()
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * factor)
+            self._tokens = 0.0
+        logger.warning(f"[{self.name}] Limite API segnalato: velocità ridotta da {old_rate:.2f}/s a {self.rate:.2f}/s.")
+
+
+class HostThrottle:
+    """
+    Limite di cortesia per host, thread-safe: al massimo `max_concurrent` richieste in corso
+    verso lo stesso host e almeno `min_interval` secondi tra l'avvio di due richieste.
+    Sostituisce le pause fisse: i thread attendono solo quanto serve per rispettare il limite.
+
+    Uso: `with throttle.slot(url): session.get(url, ...)` (lo slot resta occupato per tutta
+    la durata del blocco, quindi anche durante un download in streaming).
+    """
+
+    def __init__(self, max_concurrent: int = 4, min_interval: float = 0.25, name: str = "host-throttle"):
+        if max_concurrent < 1: raise ValueError("max_concurrent deve essere >= 1")
+        self.name = name
+        self.max_concurrent = int(max_concurrent)
+        self.min_interval = max(0.0, float(min_interval))
+        self._hosts = {} # host -> (semaforo, lock, [istante minimo del prossimo avvio])
+        self._lock = threading.Lock()
+
+    def _host_state(self, url: str):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.BoundedSemaphore(self.max_concurrent), threading.Lock(), [0.0])
+            return self._hosts[host]
+
+    @contextmanager
+    def slot(self, url: str):
+        """Occupa uno slot per l'host di `url`, rispettando l'intervallo minimo tra gli avvii."""
+        semaphore, lock, next_start = self._host_state(url)
+        semaphore.acquire()
+        try:
+            with lock:
+                now = time.monotonic()
+                start = max(now, next_start[0])
+                next_start[0] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            semaphore.release()
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """Attesa esponenziale con jitter (attempt parte da 0)."""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
@@ -0,0 +1,146 @@
+# src/tools/semantic_cache.py
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Similarità coseno minima per considerare due domande equivalenti
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 2000))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", 24 * 3600))
+
+
+def query_numbers(query: str) -> frozenset:
+    """Numeri presenti nella domanda (anni, top N...): devono coincidere perché due domande siano equivalenti."""
+    return frozenset(re.findall(r'\d+', str(query)))
+
+
+class SemanticCache:
+    """
+    Cache in memoria delle risposte RAG indicizzata per similarità dell'embedding della domanda.
+
+    Gli embedding (normalizzati) stanno in una matrice numpy preallocata: con poche migliaia di voci
+    la ricerca esatta con un prodotto matrice-vettore costa meno di un millisecondo.
+    Una voce viene restituita solo se la similarità coseno supera `threshold` e i numeri della
+    domanda (es. l'anno) coincidono: "spesa AGESP 2023" e "spesa AGESP 2024" sono vicine nello spazio
+    degli embedding ma hanno risposte diverse. Oltre `max_entries` viene rimossa la voce usata
+    meno di recente; le voci scadono dopo `ttl` secondi e tutte vengono scartate quando cambia la
+    versione dei dati.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl: float = SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._vectors = None # np.ndarray (max_entries, dim) float32, creata al primo inserimento
+        self._last_used = np.zeros(max_entries) # 0 = slot libero
+        self._entries = [None] * max_entries # slot -> (query, numeri, payload, expires_at)
+        self._dataset_version = None
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _check_version_locked(self, dataset_version: str | None):
+        if dataset_version != self._dataset_version:
+            if self._dataset_version is not None:
+                logger.info("Versione dati cambiata: svuoto la cache semantica.")
+            self._last_used[:] = 0
+            self._entries = [None] * self.max_entries
+            self._dataset_version = dataset_version
+
+    def lookup(self, query: str, embedding, dataset_version: str | None = None) -> dict | None:
+        """Payload di una domanda già risposta abbastanza simile a `query`, oppure None."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version_locked(dataset_version)
+            if vector is None or self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            now = time.time()
+            similarities = self._vectors @ vector
+            similarities[self._last_used == 0] = -1.0
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            numbers = query_numbers(query)
+            for slot in candidates[np.argsort(-similarities[candidates])]:
+                cached_query, cached_numbers, payload, expires_at = self._entries[slot]
+                if expires_at <= now:
+                    self._last_used[slot] = 0
+                    self._entries[slot] = None
+                    continue
+                if cached_numbers != numbers:
+                    continue
+                self._last_used[slot] = time.monotonic()
+                self.hits += 1
+                logger.info(f"Cache semantica: '{query[:50]}' ~ '{cached_query[:50]}' (similarità {similarities[slot]:.3f}).")
+                return payload
+            self.misses += 1
+            return None
+
+    def add(self, query: str, embedding, payload: dict, dataset_version: str | None = None):
+        """Memorizza la risposta a `query`; se la cache è piena rimuove la voce usata meno di recente."""
+        vector = self._normalize(embedding)
+        if vector is None: return
+        with self._lock:
+            self._check_version_locked(dataset_version)
+            if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                # Prima voce (o modello di embedding cambiato): alloca la matrice per questa dimensione
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._last_used[:] = 0
+                self._entries = [None] * self.max_entries
+            free_slots = np.flatnonzero(self._last_used == 0)
+            if free_slots.size:
+                slot = free_slots[0]
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[slot] = vector
+            self._entries[slot] = (query, query_numbers(query), payload, time.time() + self.ttl)
+            self._last_used[slot] = time.monotonic()
+
+    def stats(self) -> dict:
+        """Contatori di utilizzo della cache semantica per questo processo."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": int(np.count_nonzero(self._last_used)),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache | None:
+    """Restituisce la cache semantica configurata da .env (None se disabilitata)."""
+    global _default_cache
+    if not SEMANTIC_CACHE_ENABLED: return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SemanticCache()
+            logger.info(f"Cache semantica attiva (soglia {_default_cache.threshold}, max {_default_cache.max_entries} voci).")
+        return _default_cache
@@ -0,0 +1,109 @@
+# src/tools/single_flight.py
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+# Attesa massima di un follower tra un evento e il successivo del leader
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_TIMEOUT_SECONDS", 120))
+
+
+class _Flight:
+    """Esecuzione in corso per una chiave: eventi prodotti finora e stato di completamento."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Deduplica le esecuzioni concorrenti dello stesso lavoro (es. la stessa domanda su /ask).
+
+    Il primo richiedente per una chiave (leader) avvia il generatore in un thread di background;
+    chi arriva mentre è ancora in corso (follower) si iscrive allo stesso flusso e riceve tutti
+    gli eventi dall'inizio, senza rieseguire la pipeline. Il generatore gira in background così
+    la disconnessione del client leader non interrompe i follower.
+    """
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self.leaders = 0
+        self.followers = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def stream(self, key: str, generator_factory: Callable[[], Iterable]) -> Iterator:
+        """
+        Restituisce gli eventi dell'esecuzione per `key`, avviandola solo se non è già in corso.
+        Solleva TimeoutError se il leader non produce eventi entro `timeout` secondi.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.leaders += 1
+            else:
+                self.followers += 1
+            flight.subscribers += 1
+
+        if is_leader:
+            threading.Thread(target=self._run, args=(key, flight, generator_factory),
+                             name=f"single-flight-{key[:12]}", daemon=True).start()
+        else:
+            logger.info(f"Richiesta accodata a un'esecuzione già in corso ({flight.subscribers} iscritti).")
+        return self._subscribe(flight)
+
+    def _run(self, key: str, flight: _Flight, generator_factory: Callable[[], Iterable]):
+        try:
+            for event in generator_factory():
+                with flight.cond:
+                    flight.events.append(event)
+                    flight.cond.notify_all()
+        except Exception as e:
+            logger.error(f"Errore nell'esecuzione condivisa '{key[:12]}': {e}", exc_info=True)
+        finally:
+            # Chi arriva da qui in poi avvia una nuova esecuzione (o trova la risposta in cache)
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _subscribe(self, flight: _Flight) -> Iterator:
+        position = 0
+        while True:
+            with flight.cond:
+                if not flight.cond.wait_for(lambda: position < len(flight.events) or flight.done, timeout=self.timeout):
+                    raise TimeoutError("Nessun evento dall'esecuzione condivisa entro il timeout.")
+                pending = flight.events[position:]
+                finished = flight.done
+            yield from pending
+            position += len(pending)
+            if finished and position >= len(flight.events):
+                return
+
+    def stats(self) -> dict:
+        """Esecuzioni avviate (leader) e richieste servite da un'esecuzione già in corso (follower)."""
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalesced_rate": (self.followers / total) if total else 0.0,
+                "in_flight": len(self._flights),
+            }
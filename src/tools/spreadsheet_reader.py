@@ -0,0 +1,78 @@
+# src/tools/spreadsheet_reader.py
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Parole chiave attese nell'intestazione dei file dei pagamenti (condivise da ETL e verifica)
+EXPECTED_KEYWORDS = {'numero', 'anno', 'data', 'importo', 'nominativo', 'descrizione'}
+MIN_HEADER_KEYWORDS = 3 # Soglia: almeno 3 keyword per considerare una riga come intestazione
+HEADER_SCAN_ROWS = 10 # Righe iniziali esaminate alla ricerca dell'intestazione
+
+
+def read_raw_sheet(file_path: Path) -> pd.DataFrame:
+    """
+    Legge il primo foglio del file una sola volta, senza intestazione (header=None).
+    .ods con il motore odf; per gli altri formati il motore predefinito, con openpyxl come ripiego.
+    """
+    if file_path.suffix.lower() == '.ods':
+        return pd.read_excel(file_path, header=None, engine='odf')
+    try:
+        return pd.read_excel(file_path, header=None)
+    except Exception as e:
+        logger.debug(f"  -> {file_path.name}: lettura con motore predefinito fallita ({e}), ritento con openpyxl.")
+        return pd.read_excel(file_path, header=None, engine='openpyxl')
+
+
+def header_score(values, expected_keywords: set = EXPECTED_KEYWORDS) -> int:
+    """Numero di keyword attese contenute (come sottostringa, senza maiuscole) nei valori di una riga."""
+    cells = {str(value).lower().strip() for value in values if not pd.isna(value)}
+    return sum(any(key in cell for cell in cells) for key in expected_keywords)
+
+
+def find_header_row(raw: pd.DataFrame, expected_keywords: set = EXPECTED_KEYWORDS,
+                    max_rows: int = HEADER_SCAN_ROWS, min_keywords: int = MIN_HEADER_KEYWORDS) -> int | None:
+    """Prima riga (posizione) tra le prime `max_rows` che sembra un'intestazione; None se nessuna supera la soglia."""
+    for position in range(min(max_rows, len(raw))):
+        if header_score(raw.iloc[position].tolist(), expected_keywords) >= min_keywords:
+            return position
+    return None
+
+
+def _column_names(values) -> list[str]:
+    """Nomi colonna dalla riga di intestazione, come li produrrebbe pandas (celle vuote 'Unnamed: i', duplicati '.1')."""
+    names, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if pd.isna(value) else str(value).strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def promote_header_row(raw: pd.DataFrame, header_row: int) -> pd.DataFrame:
+    """Usa la riga `header_row` come intestazione e restituisce le righe successive (tipi dedotti come in read_excel)."""
+    df = raw.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = _column_names(raw.iloc[header_row].tolist())
+    return df.infer_objects()
+
+
+def read_sheet_with_header(file_path: Path, expected_keywords: set = EXPECTED_KEYWORDS,
+                           max_rows: int = HEADER_SCAN_ROWS) -> tuple[pd.DataFrame, int | None]:
+    """
+    Legge il file con una sola lettura e individua l'intestazione in memoria.
+    Ritorna (DataFrame con l'intestazione promossa, posizione della riga di intestazione),
+    oppure (foglio grezzo senza intestazione, None) se nessuna riga supera la soglia di keyword.
+    """
+    raw = read_raw_sheet(file_path)
+    header_row = find_header_row(raw, expected_keywords, max_rows)
+    if header_row is None:
+        return raw, None
+    return promote_header_row(raw, header_row), header_row
@@ -5,6 +5,13 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    from .sqlite_pool import get_read_cursor
+    from .db_schema import normalize_beneficiary, prefix_upper_bound, SUMMARY_BENEFICIARIO_ANNO_TABLE
+except ImportError:
+    from sqlite_pool import get_read_cursor
+    from db_schema import normalize_beneficiary, prefix_upper_bound, SUMMARY_BENEFICIARIO_ANNO_TABLE
+
 try:
     from .wikipedia_enricher_tool import normalize_string
 except ImportError:
@@ -40,25 +47,35 @@ except Exception as e:
     logger.error(f"Errore config DB per aggregazioni: {e}", exc_info=True)
     DB_PATH = None
 
+def _summaries_available(cursor: sqlite3.Cursor) -> bool:
+    """True se il database contiene le tabelle riepilogative (create da load_to_sqlite.py)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SUMMARY_BENEFICIARIO_ANNO_TABLE,))
+    return cursor.fetchone() is not None
+
 def get_total_spend_beneficiary_year(beneficiary_name: str, year: int | str) -> dict | None:
-    """Calcola somma totale per beneficiario/anno (Case-Insensitive)."""
+    """
+    Calcola somma totale per beneficiario/anno (Case-Insensitive, tramite BeneficiarioNorm).
+    Legge la riga precalcolata in riepilogo_beneficiario_anno; sui database senza riepiloghi aggrega i pagamenti.
+    """
     # ... (controlli DB_PATH e parametri) ...
-    conn = None; total = None; record_count = 0
-    beneficiary_col = "Beneficiario"; year_col = "Anno"; amount_col = "ImportoEuro"
+    cursor = None; total = None; record_count = 0
+    beneficiary_col = "BeneficiarioNorm"; year_col = "Anno"; amount_col = "ImportoEuro"
 
     try:
-        conn = sqlite3.connect(DB_PATH); cursor = conn.cursor()
+        cursor = get_read_cursor(DB_PATH) # Connessione in prestito dal pool (sola lettura, riusata)
         year_param = int(year)
 
-        # Usa UPPER per confronto case-insensitive sul beneficiario
-        # Assicurati che i nomi colonna siano esatti!
-        query = f"SELECT SUM({amount_col}), COUNT(*) FROM pagamenti WHERE UPPER({beneficiary_col}) = UPPER(?) AND {year_col} = ?"
+        if _summaries_available(cursor):
+            # Lookup sulla chiave primaria (Anno, BeneficiarioNorm) del riepilogo
+            query = f"SELECT TotaleSpeso, NumeroPagamenti FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE} WHERE {year_col} = ? AND {beneficiary_col} = ?"
+        else:
+            # Confronto case-insensitive su colonna già normalizzata: usa l'indice (Anno, BeneficiarioNorm, ImportoEuro)
+            query = f"SELECT SUM({amount_col}), COUNT(*) FROM pagamenti WHERE {year_col} = ? AND {beneficiary_col} = ?"
 
-        # Passa il nome beneficiario e il parametro anno corretto
-        logger.debug(f"Esecuzione query SQL: {query} con parametri (UPPER): ('{beneficiary_name}', '{year_param}')")
-        cursor.execute(query, (beneficiary_name, year_param)) # Passa il nome originale, UPPER è nella query
-                                                               # oppure: cursor.execute(query, (beneficiary_name.upper(), year_param))
-                                                               # Verifica quale funziona meglio con la tua versione sqlite3/python
+        # Passa il parametro anno corretto e il nome normalizzato come nella colonna
+        beneficiary_param = normalize_beneficiary(beneficiary_name)
+        logger.debug(f"Esecuzione query SQL: {query} con parametri: ({year_param}, '{beneficiary_param}')")
+        cursor.execute(query, (year_param, beneficiary_param))
         result = cursor.fetchone()
 
         if result and result[0] is not None:
@@ -80,36 +97,34 @@ def get_total_spend_beneficiary_year(beneficiary_name: str, year: int | str) ->
          logger.error(f"Errore generico SQL: {e_gen}", exc_info=True)
          return None
     finally:
-        if conn: conn.close()
+        if cursor: cursor.close() # Rilascia lo statement e restituisce la connessione al pool
 
 def find_official_beneficiary_name(query_name: str) -> str | None:
     """
-    Cerca un nome nella tabella beneficiari_info usando LIKE sul nome normalizzato
+    Cerca un nome nella tabella beneficiari_info per prefisso del nome normalizzato
     e restituisce il nome ufficiale (Beneficiario) corrispondente.
     """
     # ... (controlli DB_PATH, query_name) ...
-    conn = None; official_name = None
+    cursor = None; official_name = None
     normalized_query_name = normalize_string(query_name)
     if not normalized_query_name: return query_name # Fallback
 
     try:
-        conn = sqlite3.connect(DB_PATH); cursor = conn.cursor()
-        # --- MODIFICA QUERY: Usa LIKE ---
-        # Cerca nomi normalizzati che INIZIANO con la query normalizzata
-        # Aggiungiamo '%' alla fine del parametro per il matching LIKE
-        search_pattern = normalized_query_name + '%'
-        query = "SELECT Beneficiario, NomeNormalizzato FROM beneficiari_info WHERE NomeNormalizzato LIKE ? ORDER BY LENGTH(NomeNormalizzato) ASC LIMIT 1"
-        logger.debug(f"Esecuzione lookup SQL (LIKE): {query} con parametro: '{search_pattern}'")
-        cursor.execute(query, (search_pattern,))
+        cursor = get_read_cursor(DB_PATH) # Connessione in prestito dal pool (sola lettura, riusata)
+        # Cerca nomi normalizzati che INIZIANO con la query normalizzata.
+        # Range sul prefisso invece di LIKE 'x%' (case-insensitive, non userebbe l'indice su NomeNormalizzato)
+        query = "SELECT Beneficiario, NomeNormalizzato FROM beneficiari_info WHERE NomeNormalizzato >= ? AND NomeNormalizzato < ? ORDER BY LENGTH(NomeNormalizzato) ASC LIMIT 1"
+        logger.debug(f"Esecuzione lookup SQL (prefisso): {query} con parametro: '{normalized_query_name}'")
+        cursor.execute(query, (normalized_query_name, prefix_upper_bound(normalized_query_name)))
         result = cursor.fetchone()
         # -----------------------------
 
         if result:
             official_name = result[0] # Colonna Beneficiario (originale)
             found_normalized = result[1] # Colonna NomeNormalizzato trovata
-            logger.info(f"Lookup (LIKE) per '{query_name}' (norm: '{normalized_query_name}') -> Trovato: '{official_name}' (norm db: '{found_normalized}')")
+            logger.info(f"Lookup (prefisso) per '{query_name}' (norm: '{normalized_query_name}') -> Trovato: '{official_name}' (norm db: '{found_normalized}')")
         else:
-            logger.info(f"Lookup (LIKE) beneficiario: Nessun nome ufficiale trovato per '{query_name}' (norm: '{normalized_query_name}'). Uso originale.")
+            logger.info(f"Lookup (prefisso) beneficiario: Nessun nome ufficiale trovato per '{query_name}' (norm: '{normalized_query_name}'). Uso originale.")
             official_name = query_name.strip()
 
     except sqlite3.Error as e:
@@ -119,7 +134,7 @@ def find_official_beneficiary_name(query_name: str) -> str | None:
         logger.error(f"Errore generico lookup beneficiario: {e_gen}", exc_info=True)
         official_name = query_name.strip()
     finally:
-        if conn: conn.close()
+        if cursor: cursor.close() # Rilascia lo statement e restituisce la connessione al pool
 
     return official_name
 
@@ -127,6 +142,7 @@ def get_top_suppliers_by_year(year: int | str, top_n: int = 5) -> list[dict] | N
     """
     Trova i primi N beneficiari per importo totale speso in un anno specifico.
     Ritorna una lista di dizionari [{'Beneficiario': nome, 'TotaleSpeso': importo}] o None.
+    Usa la classifica precalcolata (Rango) di riepilogo_beneficiario_anno quando disponibile.
     """
     if not DB_PATH or not DB_PATH.exists():
         logger.error("Percorso DB non valido per query SQL top suppliers.")
@@ -135,23 +151,34 @@ def get_top_suppliers_by_year(year: int | str, top_n: int = 5) -> list[dict] | N
          logger.warning("Anno o top_n non validi per query SQL top suppliers.")
          return None
 
-    conn = None
+    cursor = None
     results_list = []
     beneficiary_col = "Beneficiario"; year_col = "Anno"; amount_col = "ImportoEuro"
 
     try:
-        conn = sqlite3.connect(DB_PATH); cursor = conn.cursor()
+        cursor = get_read_cursor(DB_PATH) # Connessione in prestito dal pool (sola lettura, riusata)
         year_param = int(year) # Assumendo Anno sia INTEGER nel DB
 
-        query = f"""
-            SELECT {beneficiary_col}, SUM({amount_col}) as TotaleSpeso
-            FROM pagamenti
-            WHERE {year_col} = ?
-            GROUP BY {beneficiary_col}
-            HAVING TotaleSpeso > 0 -- Escludi totali nulli o zero se necessario
-            ORDER BY TotaleSpeso DESC
-            LIMIT ?
-        """
+        if _summaries_available(cursor):
+            # Range sull'indice (Anno, Rango): legge solo le prime top_n righe dell'anno
+            query = f"""
+                SELECT {beneficiary_col}, TotaleSpeso
+                FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE}
+                WHERE {year_col} = ? AND Rango <= ? AND TotaleSpeso > 0
+                ORDER BY Rango
+            """
+        else:
+            # Raggruppa sulla colonna normalizzata (indicizzata con Anno): varianti di maiuscole/spazi
+            # dello stesso beneficiario vengono sommate, coerentemente con la query di spesa totale
+            query = f"""
+                SELECT MIN({beneficiary_col}), SUM({amount_col}) as TotaleSpeso
+                FROM pagamenti
+                WHERE {year_col} = ?
+                GROUP BY BeneficiarioNorm
+                HAVING TotaleSpeso > 0 -- Escludi totali nulli o zero se necessario
+                ORDER BY TotaleSpeso DESC
+                LIMIT ?
+            """
         logger.debug(f"Esecuzione query SQL Top Suppliers: {query} con parametri: ({year_param}, {top_n})")
         cursor.execute(query, (year_param, top_n))
         results = cursor.fetchall()
@@ -172,7 +199,7 @@ def get_top_suppliers_by_year(year: int | str, top_n: int = 5) -> list[dict] | N
     except sqlite3.Error as e: logger.error(f"Errore DB SQL Top Suppliers: {e}"); return None
     except Exception as e_gen: logger.error(f"Errore generico SQL Top Suppliers: {e_gen}"); return None
     finally:
-        if conn: conn.close()
+        if cursor: cursor.close() # Rilascia lo statement e restituisce la connessione al pool
 
 def get_payment_count_beneficiary_year(beneficiary_name: str, year: int | str) -> dict | None:
     """
@@ -186,21 +213,24 @@ def get_payment_count_beneficiary_year(beneficiary_name: str, year: int | str) -
          logger.warning("Nome beneficiario o anno non validi per query SQL conteggio pagamenti.")
          return None # O ritorna un dizionario con errore? Per ora None.
 
-    conn = None
+    cursor = None
     count = 0 # Default a 0
-    beneficiary_col = "Beneficiario"; year_col = "Anno"
+    beneficiary_col = "BeneficiarioNorm"; year_col = "Anno"
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        cursor = get_read_cursor(DB_PATH) # Connessione in prestito dal pool (sola lettura, riusata)
         year_param = int(year) # Converti anno a intero
 
-        # Usa UPPER per confronto case-insensitive sul beneficiario
-        # Assicurati che i nomi colonna siano corretti (Beneficiario, Anno)
-        query = f"SELECT COUNT(*) FROM pagamenti WHERE UPPER({beneficiary_col}) = UPPER(?) AND {year_col} = ?"
+        if _summaries_available(cursor):
+            # Una sola riga per (Anno, BeneficiarioNorm); nessuna riga = nessun pagamento
+            query = f"SELECT COALESCE(SUM(NumeroPagamenti), 0) FROM {SUMMARY_BENEFICIARIO_ANNO_TABLE} WHERE {year_col} = ? AND {beneficiary_col} = ?"
+        else:
+            # Confronto case-insensitive su colonna già normalizzata (indice su Anno, BeneficiarioNorm)
+            query = f"SELECT COUNT(*) FROM pagamenti WHERE {year_col} = ? AND {beneficiary_col} = ?"
 
-        logger.debug(f"Esecuzione query SQL Conteggio: {query} con parametri (UPPER): ('{beneficiary_name}', {year_param})")
-        cursor.execute(query, (beneficiary_name, year_param)) # Passa il nome originale, UPPER è nella query
+        beneficiary_param = normalize_beneficiary(beneficiary_name)
+        logger.debug(f"Esecuzione query SQL Conteggio: {query} con parametri: ({year_param}, '{beneficiary_param}')")
+        cursor.execute(query, (year_param, beneficiary_param))
         result = cursor.fetchone()
 
         # COUNT(*) ritorna sempre una riga, anche se il conteggio è 0
@@ -225,7 +255,7 @@ def get_payment_count_beneficiary_year(beneficiary_name: str, year: int | str) -
          logger.error(f"Errore generico SQL Conteggio Pagamenti: {e_gen}", exc_info=True)
          return None # Errore generico grave
     finally:
-        if conn: conn.close()
+        if cursor: cursor.close() # Rilascia lo statement e restituisce la connessione al pool
 
 # --- Test (come prima) ---
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+# src/tools/sqlite_pool.py
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)) # Byte mappati in memoria
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024)) # Page cache per connessione
+# Statement compilati tenuti in cache da ogni connessione (riusati se il testo SQL è identico)
+SQLITE_CACHED_STATEMENTS = int(os.environ.get("SQLITE_CACHED_STATEMENTS", 256))
+# Connessioni aperte al massimo per database, condivise tra i thread delle richieste
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+SQLITE_POOL_TIMEOUT_SECONDS = float(os.environ.get("SQLITE_POOL_TIMEOUT_SECONDS", 30))
+
+
+def _file_identity(path: Path) -> tuple | None:
+    """(device, inode) del file: cambia quando il database viene sostituito (es. os.replace)."""
+    try:
+        st = path.stat()
+        return (st.st_dev, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+
+class PooledCursor(sqlite3.Cursor):
+    """Cursore di una connessione presa in prestito dal pool: `close()` la restituisce al pool."""
+
+    _release = None
+
+    def close(self):
+        super().close()
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class ReadOnlyConnectionPool:
+    """
+    Pool limitato di connessioni SQLite in sola lettura (URI mode=ro, PRAGMA query_only) condivise
+    tra i thread: ogni query prende in prestito una connessione già aperta e la restituisce alla fine,
+    invece di aprirne una nuova (con i suoi PRAGMA e la sua page cache) per ogni richiesta o thread.
+    Al massimo `max_size` connessioni; oltre, si attende che una torni libera (fino a `timeout`).
+
+    Le connessioni vengono riaperte quando il file del database viene sostituito su disco
+    (cambia l'inode, es. un nuovo file rinominato sopra quello servito) oppure dopo `invalidate()`. La ricostruzione
+    di load_to_sqlite.py aggiorna lo stesso file con l'API di backup: le connessioni restano valide.
+    """
+
+    def __init__(self, db_path: Path | str, max_size: int = SQLITE_POOL_SIZE, timeout: float = SQLITE_POOL_TIMEOUT_SECONDS):
+        if max_size < 1: raise ValueError("max_size deve essere >= 1")
+        self.db_path = Path(db_path).resolve()
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connects = 0
+        self._idle = queue.LifoQueue() # (connessione, identità del file, generazione); LIFO: riusa la più "calda"
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        uri = f"{self.db_path.as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30, cached_statements=SQLITE_CACHED_STATEMENTS, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            self.connects += 1
+        logger.debug(f"Aperta connessione SQLite in sola lettura su {self.db_path} ({self.connects} aperture).")
+        return conn
+
+    def _checkout(self) -> tuple:
+        identity = _file_identity(self.db_path)
+        if identity is None:
+            raise sqlite3.OperationalError(f"Database non trovato: {self.db_path}")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(f"Nessuna connessione libera su {self.db_path.name} entro {self.timeout}s (pool da {self.max_size}).")
+        try:
+            while True:
+                try:
+                    conn, conn_identity, generation = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open(), identity, self._generation
+                if conn_identity == identity and generation == self._generation:
+                    return conn, conn_identity, generation
+                logger.info(f"Database {self.db_path.name} sostituito o invalidato: riapro la connessione.")
+                conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn: sqlite3.Connection, identity: tuple, generation: int):
+        try:
+            if identity == _file_identity(self.db_path) and generation == self._generation:
+                self._idle.put((conn, identity, generation))
+            else:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Connessione in prestito per la durata del blocco `with` (non va chiusa dal chiamante).
+        Solleva sqlite3.OperationalError se il database non esiste o il pool resta pieno oltre `timeout`.
+        """
+        conn, identity, generation = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn, identity, generation)
+
+    def cursor(self) -> PooledCursor:
+        """Cursore su una connessione in prestito: la connessione torna al pool con `cursor.close()`."""
+        conn, identity, generation = self._checkout()
+        try:
+            cursor = conn.cursor(PooledCursor)
+        except BaseException:
+            self._checkin(conn, identity, generation)
+            raise
+        cursor._release = lambda: self._checkin(conn, identity, generation)
+        return cursor
+
+    def invalidate(self):
+        """Forza la riapertura di tutte le connessioni al prossimo prestito."""
+        with self._lock:
+            self._generation += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: Path | str) -> ReadOnlyConnectionPool:
+    """Pool condiviso per un file di database (uno per percorso)."""
+    key = str(Path(db_path).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ReadOnlyConnectionPool(key)
+            _pools[key] = pool
+        return pool
+
+def get_read_cursor(db_path: Path | str) -> PooledCursor:
+    """Scorciatoia: cursore in sola lettura per `db_path`; chiuderlo restituisce la connessione al pool."""
+    return get_pool(db_path).cursor()
+
+def invalidate_all():
+    """Invalida tutti i pool (es. dopo aver sostituito il database nello stesso processo)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.invalidate()
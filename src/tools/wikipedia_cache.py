@@ -0,0 +1,105 @@
+# src/tools/wikipedia_cache.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Configurazione logger e percorsi (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.resolve()
+load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+WIKI_CACHE_FILE = os.environ.get("WIKI_CACHE_FILE", "data/cache/wikipedia_cache.db")
+WIKI_CACHE_ENABLED = os.environ.get("WIKI_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Durata delle voci per esito: le pagine trovate cambiano di rado, le assenze più spesso, gli errori sono transitori
+WIKI_CACHE_FOUND_TTL_SECONDS = float(os.environ.get("WIKI_CACHE_FOUND_TTL_SECONDS", 90 * 24 * 3600))
+WIKI_CACHE_NOT_FOUND_TTL_SECONDS = float(os.environ.get("WIKI_CACHE_NOT_FOUND_TTL_SECONDS", 14 * 24 * 3600))
+WIKI_CACHE_ERROR_TTL_SECONDS = float(os.environ.get("WIKI_CACHE_ERROR_TTL_SECONDS", 3600))
+
+
+class WikipediaCache:
+    """
+    Cache persistente delle ricerche Wikipedia su SQLite, una voce per termine cercato
+    (lingua, lunghezza del riassunto e termine esatto).
+
+    Oltre alle pagine trovate conserva anche gli esiti negativi ('not_found', 'error'),
+    ciascuno con la propria scadenza: un termine senza pagina non viene richiesto di nuovo
+    a ogni esecuzione, un errore transitorio viene ritentato dopo poco.
+    Thread-safe (una connessione condivisa con lock). Contatori hit/miss con `stats()`.
+    """
+
+    def __init__(self, db_path: Path | str, found_ttl: float = WIKI_CACHE_FOUND_TTL_SECONDS,
+                 not_found_ttl: float = WIKI_CACHE_NOT_FOUND_TTL_SECONDS, error_ttl: float = WIKI_CACHE_ERROR_TTL_SECONDS):
+        self.db_path = Path(db_path)
+        self.ttl_by_status = {'found': found_ttl, 'not_found': not_found_ttl, 'error': error_ttl}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                summary TEXT,
+                url TEXT,
+                fetched_at REAL NOT NULL
+            )""")
+        self._conn.commit()
+        entries = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+        logger.info(f"Cache Wikipedia aperta: {self.db_path} ({entries} voci).")
+
+    @staticmethod
+    def make_key(language: str, summary_chars: int, term: str) -> str:
+        return f"{language}\x1f{summary_chars}\x1f{term}"
+
+    def get(self, key: str) -> dict | None:
+        """Esito salvato per la chiave ({'summary', 'url', 'status'}), None se assente o scaduto."""
+        with self._lock:
+            row = self._conn.execute("SELECT status, summary, url, fetched_at FROM lookups WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[3] > self.ttl_by_status.get(row[0], 0):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {'summary': row[1], 'url': row[2], 'status': row[0]}
+
+    def put(self, key: str, result: dict):
+        """Salva l'esito di una ricerca (solo 'found', 'not_found' ed 'error')."""
+        if result['status'] not in self.ttl_by_status: return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lookups (key, status, summary, url, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (key, result['status'], result['summary'], result['url'], time.time()))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Contatori di utilizzo della cache per questo processo."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / lookups) if lookups else 0.0}
+
+
+_default_cache = None
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+def get_wikipedia_cache() -> WikipediaCache | None:
+    """Restituisce la cache condivisa configurata da .env (None se disabilitata o non apribile)."""
+    global _default_cache, _default_cache_failed
+    if not WIKI_CACHE_ENABLED or _default_cache_failed: return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = WikipediaCache(PROJECT_ROOT / WIKI_CACHE_FILE)
+            except Exception as e:
+                logger.error(f"Impossibile aprire la cache Wikipedia ({WIKI_CACHE_FILE}): {e}. Proseguo senza cache.", exc_info=True)
+                _default_cache_failed = True
+                return None
+        return _default_cache
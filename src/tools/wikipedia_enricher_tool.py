@@ -2,7 +2,16 @@ import wikipediaapi
 import logging
 import time
 import re
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from .wikipedia_cache import WikipediaCache, get_wikipedia_cache
+    from .wikipedia_stub import WikipediaStubAdapter
+except ImportError:
+    from wikipedia_cache import WikipediaCache, get_wikipedia_cache
+    from wikipedia_stub import WikipediaStubAdapter
 
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
@@ -32,10 +41,64 @@ wiki_wiki = wikipediaapi.Wikipedia(
     user_agent='OsservatorioStatisticoBustoArsizioBot/1.0 (...)' # AGGIORNA!
 )
 
-def get_wikipedia_summary(term: str, summary_chars: int = 500) -> dict:
+# Segnali di limite dell'API visti dal thread corrente: wikipediaapi non espone lo stato HTTP,
+# quindi un hook di risposta sulla sua sessione li annota qui (gli hook girano nel thread chiamante)
+_throttle_signals = threading.local()
+
+def _record_throttling(response, *args, **kwargs):
+    """Hook di risposta: annota 429 e 503 con Retry-After (limite o sovraccarico dichiarato dall'API)."""
+    if response.status_code == 429 or (response.status_code == 503 and 'Retry-After' in response.headers):
+        _throttle_signals.throttled = True
+
+wiki_wiki._session.hooks['response'].append(_record_throttling)
+
+def use_wikipedia_stub(pages: dict[str, str], latency: float = 0.0, fail_titles=()) -> WikipediaStubAdapter:
+    """Sostituisce l'API Wikipedia con il sostituto locale (tools/wikipedia_stub.py): nessuna richiesta in rete."""
+    adapter = WikipediaStubAdapter(pages, latency=latency, fail_titles=fail_titles)
+    wiki_wiki._session.mount("https://", adapter)
+    logger.info(f"API Wikipedia sostituita da {len(adapter.pages)} pagine locali (latenza {latency}s).")
+    return adapter
+
+def _lookup_term(search_term: str, summary_chars: int, rate_limiter=None) -> dict:
+    """
+    Una ricerca di pagina (con cache persistente): 'found', 'not_found' oppure 'error'.
+    Il rate limiter condiviso viene consultato solo per le ricerche che vanno davvero all'API,
+    un token per richiesta HTTP: prop=info per l'esistenza e, se la pagina c'è, prop=extracts
+    per il riassunto. Viene rallentato solo se l'API segnala un limite (429, 503 con Retry-After).
+    """
+    cache = get_wikipedia_cache()
+    cache_key = WikipediaCache.make_key(wiki_wiki.language, summary_chars, search_term)
+    cached = cache.get(cache_key) if cache else None
+    if cached is not None:
+        logger.debug(f"Cache Wikipedia ({cached['status']}) per '{search_term}'")
+        return cached
+
+    _throttle_signals.throttled = False
+    try:
+        page = wiki_wiki.page(search_term)
+        if rate_limiter: rate_limiter.acquire() # prop=info
+        if not page.exists():
+            logger.debug(f"page.exists()=False per '{search_term}'. Info Page Object: Title='{page.title}', Namespace={page.namespace}")
+            result = {'summary': None, 'url': None, 'status': 'not_found'}
+        else:
+            logger.info(f"Pagina trovata per '{search_term}': {page.fullurl}")
+            if rate_limiter: rate_limiter.acquire() # prop=extracts
+            summary = page.summary[:summary_chars]
+            if len(page.summary) > summary_chars: summary += "..."
+            result = {'summary': summary, 'url': page.fullurl, 'status': 'found'}
+    except Exception as e:
+        logger.error(f"Errore durante ricerca Wikipedia per '{search_term}': {e}", exc_info=False) # Meno verboso nel log
+        # Solo un limite dichiarato dall'API rallenta TUTTI i worker (limiter condiviso); gli altri errori restano del termine
+        if rate_limiter and _throttle_signals.throttled: rate_limiter.penalize()
+        result = {'summary': None, 'url': None, 'status': 'error'}
+    if cache: cache.put(cache_key, result)
+    return result
+
+def get_wikipedia_summary(term: str, summary_chars: int = 500, rate_limiter=None) -> dict:
     """
     Cerca un termine su Wikipedia Italia e restituisce un riassunto e URL.
-    Include fallback e logging migliorato.
+    Include fallback e logging migliorato. Ogni ricerca di pagina passa per la cache
+    persistente (anche per gli esiti negativi) e, se fornito, per il rate limiter condiviso.
     """
     default_result = {'summary': None, 'url': None, 'status': 'unknown'}
     if not term or not isinstance(term, str) or term.strip() == "":
@@ -55,42 +118,39 @@ def get_wikipedia_summary(term: str, summary_chars: int = 500) -> dict:
 
     for current_search_term in search_terms_to_try:
         logger.debug(f"Tentativo ricerca Wikipedia per: '{current_search_term}' (Originale: '{term}')")
-        try:
-            page = wiki_wiki.page(current_search_term)
-
-            # --- Log di Debug per capire cosa trova la libreria ---
-            if not page.exists():
-                 logger.debug(f"page.exists()=False per '{current_search_term}'. Info Page Object: Title='{page.title}', Namespace={page.namespace}")
-                 # Qui potresti controllare page.links o altro se la libreria lo espone facilmente
-                 # per vedere se è una pagina di disambiguazione o suggerimenti
-                 # if 'disambigua' in page.categories: # Esempio ipotetico
-                 #     logger.info(f"Pagina '{current_search_term}' è una disambiguazione.")
-                 #     default_result['status'] = 'disambiguation'
-                 #     return default_result # Esce dal loop se trova disambiguazione
-                 continue # Prova il prossimo termine nella lista search_terms_to_try
-
-            # --- Pagina Esiste ---
-            logger.info(f"Pagina trovata per '{current_search_term}': {page.fullurl}")
-            summary = page.summary[:summary_chars]
-            if len(page.summary) > summary_chars: summary += "..."
-
-            return {
-                'summary': summary,
-                'url': page.fullurl,
-                'status': 'found'
-            }
-
-        except Exception as e:
-            logger.error(f"Errore durante ricerca Wikipedia per '{current_search_term}': {e}", exc_info=False) # Meno verboso nel log
-            default_result['status'] = 'error'
+        result = _lookup_term(current_search_term, summary_chars, rate_limiter)
+        if result['status'] == 'found':
+            return dict(result)
+        if result['status'] == 'error':
             # Non ritentare se c'è un errore API, esci dal loop
+            default_result['status'] = 'error'
             return default_result
+        # 'not_found': prova il prossimo termine nella lista search_terms_to_try
 
     # Se il loop finisce senza trovare nulla
     logger.info(f"Pagina non trovata per nessuna variante di '{term}'.")
     default_result['status'] = 'not_found'
     return default_result
 
+def enrich_terms(terms: dict, workers: int = 8, rate_limiter=None, progress=None) -> dict:
+    """
+    Esegue get_wikipedia_summary per molti termini in parallelo ({chiave: termine} -> {chiave: esito}).
+    Il ritmo verso l'API è fissato dal rate limiter condiviso, non dal numero di worker.
+    `progress` (es. una barra tqdm) riceve update(1) a ogni termine completato.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="wiki") as executor:
+        futures = {executor.submit(get_wikipedia_summary, term, rate_limiter=rate_limiter): key for key, term in terms.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                logger.error(f"Errore imprevisto ricerca Wikipedia per '{terms[key]}': {e}", exc_info=True)
+                results[key] = {'summary': None, 'url': None, 'status': 'error'}
+            if progress is not None: progress.update(1)
+    return results
+
 # Blocco per testare la funzione se esegui direttamente questo file
 if __name__ == '__main__':
     print("Test della funzione get_wikipedia_summary:")
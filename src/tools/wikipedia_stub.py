@@ -0,0 +1,83 @@
+# src/tools/wikipedia_stub.py
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+# Configurazione logger (come negli altri tool)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _canonical_title(title: str) -> str:
+    """Titolo come lo normalizza MediaWiki: underscore -> spazi, prima lettera maiuscola."""
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+def load_stub_pages(path: Path | str) -> dict[str, str]:
+    """Pagine del sostituto da un file JSON {titolo: testo della voce}."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class WikipediaStubAdapter(HTTPAdapter):
+    """
+    Sostituto locale dell'API MediaWiki (w/api.php) per la sessione requests di wikipediaapi:
+    risponde alle query prop=info e prop=extracts dalle pagine in memoria, senza rete.
+    I titoli assenti rispondono come pagine inesistenti (pageid -1); quelli in `fail_titles`
+    con un errore 503. `latency` simula il tempo di risposta (secondi per richiesta).
+    """
+
+    def __init__(self, pages: dict[str, str], latency: float = 0.0, fail_titles=(), **kwargs):
+        super().__init__(**kwargs)
+        self.pages = {_canonical_title(title): text for title, text in pages.items()}
+        self.page_ids = {title: n for n, title in enumerate(self.pages, start=1)}
+        self.fail_titles = {_canonical_title(title) for title in fail_titles}
+        self.latency = latency
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests_served += 1
+        url = urlparse(request.url)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        title = _canonical_title(params.get('titles', ''))
+        if title in self.fail_titles:
+            return self._response(request, 503, b"Service Unavailable")
+        if params.get('action') != 'query' or params.get('prop') not in ('info', 'extracts'):
+            return self._response(request, 400, json.dumps({'error': {'code': 'badparams'}}).encode('utf-8'))
+
+        if title not in self.pages:
+            pages = {'-1': {'ns': 0, 'title': title, 'missing': ''}}
+        else:
+            page = {'pageid': self.page_ids[title], 'ns': 0, 'title': title}
+            if params['prop'] == 'info':
+                page['fullurl'] = f"https://{url.netloc}/wiki/{quote(title.replace(' ', '_'))}"
+            else:
+                page['extract'] = self.pages[title]
+            pages = {str(page['pageid']): page}
+        return self._response(request, 200, json.dumps({'batchcomplete': '', 'query': {'pages': pages}}).encode('utf-8'))
+
+    def _response(self, request, status: int, body: bytes) -> Response:
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json; charset=utf-8', 'Content-Length': str(len(body))})
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
@@ -4,6 +4,14 @@ from pathlib import Path
 import logging
 import sys # Per uscire in caso di errori critici
 
+try:
+    from .tools.spreadsheet_reader import read_sheet_with_header, promote_header_row, EXPECTED_KEYWORDS
+    from .tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+except ImportError:
+    # Eseguito come script (python src/verify_etl.py)
+    from tools.spreadsheet_reader import read_sheet_with_header, promote_header_row, EXPECTED_KEYWORDS
+    from tools.processed_dataset import load_processed_dataset, PROCESSED_PARQUET
+
 # --- Configurazione Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -11,13 +19,11 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 try:
     PROJECT_ROOT = Path(__file__).parent.parent.resolve()
     DOWNLOAD_DIR = PROJECT_ROOT / "data" / "downloaded_files"
-    PROCESSED_CSV = PROJECT_ROOT / "data" / "processed_data" / "processed_pagamenti.csv" # Percorso corretto
     ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".ods"}
 except NameError:
     # Se __file__ non è definito (es. eseguito in un notebook interattivo senza salvare)
     PROJECT_ROOT = Path('.').resolve() # Usa la directory corrente
     DOWNLOAD_DIR = PROJECT_ROOT / "data" / "downloaded_files"
-    PROCESSED_CSV = PROJECT_ROOT / "data" / "processed_data" / "processed_pagamenti.csv"
     ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".ods"}
     logging.warning(f"__file__ non definito, PROJECT_ROOT impostato su: {PROJECT_ROOT}")
 
@@ -36,30 +42,23 @@ def find_data_files(directory: Path, extensions: set) -> list[Path]:
 def verify_row_counts():
     """
     Verifica la corrispondenza (approssimativa) del numero di righe
-    tra i file originali e il file CSV processato.
+    tra i file originali e il dataset processato.
     """
     logging.info("--- Inizio Verifica Conteggio Righe ---")
 
-    # 1. Leggi il file CSV processato e calcola i conteggi per file
-    if not PROCESSED_CSV.exists():
-        logging.error(f"File processato non trovato: {PROCESSED_CSV}. Impossibile verificare.")
-        sys.exit(1) # Esce dallo script con codice di errore
-
+    # 1. Leggi il dataset processato (solo NomeFileOrigine) e calcola i conteggi per file
     try:
-        # Leggi solo le colonne necessarie per efficienza, se possibile
-        # Assumiamo che 'NomeFileOrigine' sia sempre presente
-        df_proc = pd.read_csv(PROCESSED_CSV, usecols=['NomeFileOrigine'])
-        logging.info(f"File processato '{PROCESSED_CSV.name}' caricato.")
+        df_proc = load_processed_dataset(columns=['NomeFileOrigine'])
+        logging.info(f"Dataset processato '{PROCESSED_PARQUET.name}' caricato.")
+    except FileNotFoundError as e:
+        logging.error(f"{e}. Impossibile verificare.")
+        sys.exit(1) # Esce dallo script con codice di errore
     except Exception as e:
-        logging.error(f"Errore durante la lettura di {PROCESSED_CSV}: {e}", exc_info=True)
+        logging.error(f"Errore durante la lettura di {PROCESSED_PARQUET}: {e}", exc_info=True)
         sys.exit(1)
 
-    if 'NomeFileOrigine' not in df_proc.columns:
-         logging.error(f"Colonna 'NomeFileOrigine' mancante in {PROCESSED_CSV}. Impossibile verificare.")
-         sys.exit(1)
-
     processed_counts = df_proc.groupby('NomeFileOrigine').size()
-    logging.info(f"Calcolati conteggi per {len(processed_counts)} file dal CSV processato.")
+    logging.info(f"Calcolati conteggi per {len(processed_counts)} file dal dataset processato.")
     # print("\nConteggi dal file processato:")
     # print(processed_counts)
 
@@ -72,55 +71,25 @@ def verify_row_counts():
     raw_counts = {}
     logging.info("Inizio lettura file originali per conteggio grezzo...")
 
-    # Definisci le keyword qui, come nell'ETL
-    expected_keywords = {'numero', 'anno', 'data', 'importo', 'nominativo', 'descrizione'}
+    # Stesse keyword dell'ETL
+    expected_keywords = EXPECTED_KEYWORDS
 
     for file_path in raw_files:
         raw_count = 0 # Inizializza conteggio per questo file
         df_raw = None
         try:
-            # --- INIZIO LOGICA HEADER VERIFICA (simile a ETL) ---
-            header_found_at = None # Dove abbiamo trovato l'header (0 o 1)
-
-            # Tentativo 1: Leggi con header=0
-            try:
-                if file_path.suffix.lower() == '.ods':
-                    df_raw_h0 = pd.read_excel(file_path, header=0, engine='odf')
-                else:
-                    try: df_raw_h0 = pd.read_excel(file_path, header=0)
-                    except Exception: df_raw_h0 = pd.read_excel(file_path, header=0, engine='openpyxl')
-
-                if df_raw_h0 is not None and not df_raw_h0.empty:
-                    actual_headers_lower = {str(col).lower().strip() for col in df_raw_h0.columns}
-                    keywords_found = sum(any(key in hdr for hdr in actual_headers_lower) for key in expected_keywords)
-                    if keywords_found >= 3:
-                        header_found_at = 0
-                        df_raw = df_raw_h0 # Usiamo questo DataFrame
-                        logging.debug(f"  -> {file_path.name}: Header valido trovato alla riga 0.")
-            except Exception as e_h0:
-                 logging.debug(f"  -> {file_path.name}: Errore lettura con header=0: {e_h0}")
-                 pass # Ignora errori qui, proveremo l'altro metodo
-
-            # Tentativo 2: Leggi con header=1 (SOLO se header non trovato a 0)
+            # --- INIZIO LOGICA HEADER VERIFICA (lettore condiviso con l'ETL, una sola lettura) ---
+            df_raw, header_found_at = read_sheet_with_header(file_path, expected_keywords)
             if header_found_at is None:
-                 try:
-                      if file_path.suffix.lower() == '.ods':
-                           df_raw_h1 = pd.read_excel(file_path, header=1, engine='odf')
-                      else:
-                           try: df_raw_h1 = pd.read_excel(file_path, header=1)
-                           except Exception: df_raw_h1 = pd.read_excel(file_path, header=1, engine='openpyxl')
-
-                      # Verifica semplice: se ha colonne, assumiamo sia l'header corretto per questi file
-                      if df_raw_h1 is not None and not df_raw_h1.empty and len(df_raw_h1.columns) > 0:
-                            # NON verifichiamo le keyword qui, assumiamo che se header=0 fallisce, header=1 sia quello giusto
-                            header_found_at = 1
-                            df_raw = df_raw_h1 # Usiamo questo DataFrame
-                            logging.debug(f"  -> {file_path.name}: Assunto header valido alla riga 1.")
-
-                 except Exception as e_h1:
-                      # Potrebbe fallire per file corti, gestito dopo
-                      logging.debug(f"  -> {file_path.name}: Errore/Impossibile leggere con header=1: {e_h1}")
-                      pass
+                # Come in passato: se l'header non viene riconosciuto si assume alla riga 1
+                if len(df_raw) >= 2:
+                    header_found_at = 1
+                    df_raw = promote_header_row(df_raw, header_found_at)
+                    logging.debug(f"  -> {file_path.name}: Assunto header valido alla riga 1.")
+                else:
+                    df_raw = None
+            else:
+                logging.debug(f"  -> {file_path.name}: Header valido trovato alla riga {header_found_at}.")
 
             # --- FINE LOGICA HEADER VERIFICA ---
 
@@ -197,6 +166,21 @@ def verify_row_counts():
     return problemi_gravi == 0
 
 
+def count_importo_zero():
+    """
+    Conta quante righe nel dataset processato hanno ImportoEuro esattamente pari a 0.
+    """
+    try:
+        df = load_processed_dataset(columns=["ImportoEuro"])
+        # ImportoEuro è già float64 nel dataset (NaN se mancante)
+        count_zero = int(df["ImportoEuro"].eq(0).sum())
+        print(f"Numero di righe con ImportoEuro = 0: {count_zero}")
+        return count_zero
+    except Exception as e:
+        logging.error(f"Errore durante il conteggio ImportoEuro=0: {e}")
+        return None
+
+
 # --- Esecuzione ---
 if __name__ == "__main__":
     logging.info("--- Avvio verifica ETL ---")
@@ -212,19 +196,3 @@ if __name__ == "__main__":
             logging.error(f"Errore durante il conteggio ImportoEuro zero: {e}")
             sys.exit(1)
     logging.info("--- Verifica ETL completata ---")
-def count_importo_zero():
-    """
-    Conta quante righe nel file processed_pagamenti.csv hanno ImportoEuro esattamente pari a 0.
-    """
-    if not PROCESSED_CSV.exists():
-        logging.error(f"File processato non trovato: {PROCESSED_CSV}. Impossibile contare.")
-        return None
-    try:
-        df = pd.read_csv(PROCESSED_CSV, usecols=["ImportoEuro"])
-        # Gestione robusta: considera sia 0 numerico che stringa '0' o '0.0'
-        count_zero = df["ImportoEuro"].apply(lambda x: float(str(x).replace(",",".").replace("€","").strip()) if str(x).strip() not in ["", "nan", "None"] else None).fillna(999999999).eq(0).sum()
-        print(f"Numero di righe con ImportoEuro = 0: {count_zero}")
-        return count_zero
-    except Exception as e:
-        logging.error(f"Errore durante il conteggio ImportoEuro=0: {e}")
-        return None
\ No newline at end of file